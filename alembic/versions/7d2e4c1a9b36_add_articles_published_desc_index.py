@@ -0,0 +1,40 @@
+"""add_articles_published_desc_index
+
+Revision ID: 7d2e4c1a9b36
+Revises: 45780899b185
+Create Date: 2025-10-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e4c1a9b36'
+down_revision: Union[str, Sequence[str], None] = '45780899b185'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Индекс под ленты новостей: ORDER BY published_at DESC NULLS LAST, id DESC.
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        print("Skipping PostgreSQL-specific migration (not PostgreSQL)")
+        return
+
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_articles_published_desc_id
+        ON articles (published_at DESC NULLS LAST, id DESC)
+    """)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    op.drop_index("ix_articles_published_desc_id", table_name="articles", if_exists=True)
@@ -0,0 +1,39 @@
+"""add_feed_state
+
+Revision ID: b3f81c5d2e47
+Revises: 7d2e4c1a9b36
+Create Date: 2025-10-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f81c5d2e47'
+down_revision: Union[str, Sequence[str], None] = '7d2e4c1a9b36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Валидаторы условного GET по RSS-лентам (ETag / Last-Modified).
+    """
+    # таблицу мог уже создать Base.metadata.create_all при старте приложения
+    if sa.inspect(op.get_bind()).has_table('feed_state'):
+        return
+    op.create_table(
+        'feed_state',
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('etag', sa.String(), nullable=True),
+        sa.Column('last_modified', sa.String(), nullable=True),
+        sa.Column('last_fetched', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('url'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('feed_state')
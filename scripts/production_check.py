@@ -104,7 +104,7 @@ def check_model() -> Tuple[bool, List[str]]:
     
     try:
         from pathlib import Path
-        import joblib
+        from src.modeling import read_model_artifact
         
         # Ищем последнюю модель в artifacts/models/
         models_dir = Path("artifacts/models")
@@ -114,7 +114,7 @@ def check_model() -> Tuple[bool, List[str]]:
             return False, issues
         
         # Ищем файлы моделей
-        model_files = list(models_dir.glob("model_*.pkl"))
+        model_files = list(models_dir.glob("*.ubj")) + list(models_dir.glob("model_*.pkl"))
         if not model_files:
             issues.append("WARNING: Нет обученных моделей в artifacts/models/ (запустите POST /model/train)")
             print("  WARN: Модели не найдены (обучите модель через POST /model/train)")
@@ -134,7 +134,7 @@ def check_model() -> Tuple[bool, List[str]]:
             return False, issues
         
         # Попытка загрузить модель
-        model = joblib.load(model_path)
+        model, _features, _thr = read_model_artifact(model_path)
         print(f"  PASS: Модель найдена и загружена")
         print(f"  INFO: Path: {model_path}")
         
@@ -17,8 +17,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.dependencies import get_db
 from src.db import SessionLocal
 from src.features import build_dataset
-from src.modeling import train_xgb_and_save, load_latest_model
-import joblib
+from src.modeling import train_xgb_and_save, load_latest_model, read_model_artifact
 
 
 def analyze_feature_importance(model_path: str, feature_cols: list, top_n: int = 20):
@@ -28,8 +27,7 @@ def analyze_feature_importance(model_path: str, feature_cols: list, top_n: int =
     print(f"{'='*70}\n")
     
     # Загружаем модель
-    obj = joblib.load(model_path)
-    model = obj.get("model") if isinstance(obj, dict) else obj
+    model, _features, _thr = read_model_artifact(model_path)
     
     if not hasattr(model, "feature_importances_"):
         print("[ERROR] Модель не поддерживает feature_importances_")
@@ -241,7 +241,7 @@ def analyze_new_articles(db: Session, limit: int = 100, use_finbert: bool = Fals
         db.query(Article)
         .outerjoin(ArticleAnnotation, ArticleAnnotation.article_id == Article.id)
         .filter(ArticleAnnotation.id == None)  # noqa: E711
-        .order_by(Article.published_at.is_(None), Article.published_at.desc(), Article.id.desc())
+        .order_by(Article.published_at.desc().nullslast(), Article.id.desc())
         .limit(limit)
         .all()
     )
@@ -20,10 +20,10 @@ from typing import Dict, List
 from datetime import datetime
 import numpy as np
 import pandas as pd
-import joblib
 from sqlalchemy.orm import Session
 
 from .features import build_dataset
+from .modeling import read_model_artifact
 
 logger = logging.getLogger(__name__)
 
@@ -151,7 +151,7 @@ def run_vectorized_backtest(
         if not artifacts_dir.exists():
             artifacts_dir.mkdir(parents=True, exist_ok=True)
         
-        models = list(artifacts_dir.glob("model_*.pkl")) + list(artifacts_dir.glob("*.pkl"))
+        models = list(artifacts_dir.glob("*.ubj")) + list(artifacts_dir.glob("*.pkl"))
         if not models:
             return {
                 "success": False,
@@ -165,15 +165,11 @@ def run_vectorized_backtest(
 
     logger.info(f"[backtest] Loading model: {model_path}")
     try:
-        model_obj = joblib.load(model_path)
-        # Модель сохраняется как dict с ключами: model, feature_cols, threshold, metrics
-        if isinstance(model_obj, dict) and "model" in model_obj:
-            model = model_obj["model"]
-            saved_feature_cols = model_obj.get("feature_cols", None)
-            logger.info(f"[backtest] Loaded model from dict (threshold: {model_obj.get('threshold', 'N/A')}, features: {len(saved_feature_cols) if saved_feature_cols else 'unknown'})")
-        else:
-            model = model_obj  # Старый формат - напрямую модель
-            saved_feature_cols = None
+        # .ubj — нативный XGBoost + .meta.json, .pkl — legacy dict или сама модель (см. read_model_artifact)
+        model, saved_feature_cols, thr = read_model_artifact(model_path)
+        saved_feature_cols = saved_feature_cols or None
+        n_features = len(saved_feature_cols) if saved_feature_cols else "unknown"
+        logger.info(f"[backtest] Loaded model (threshold: {thr}, features: {n_features})")
     except Exception as e:
         logger.error(f"[backtest] Failed to load model: {e}")
         return {
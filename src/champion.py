@@ -9,10 +9,14 @@ from sqlalchemy.orm import Session
 from src.db import ModelRun
 from src.features import build_dataset
 from src.model_registry import get_active_model_path, set_active_model
+from src.modeling import read_model_artifact
 from src.notify import send_telegram
 
 
 def _load_model_from_run(run: ModelRun):
+    if str(run.model_path).endswith(".ubj"):
+        return read_model_artifact(run.model_path)
+
     obj = joblib.load(run.model_path)
     try:
         fj = json.loads(run.features_json or "{}")
@@ -77,6 +77,16 @@ class Article(Base):
     )
 
 
+class FeedState(Base):
+    """Валидаторы условного GET по RSS-ленте (ETag / Last-Modified из последнего ответа 200)."""
+
+    __tablename__ = "feed_state"
+    url = Column(String, primary_key=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    last_fetched = Column(DateTime, nullable=True)
+
+
 class ArticleAnnotation(Base):
     __tablename__ = "article_annotations"
     id = Column(Integer, primary_key=True, index=True)
@@ -243,14 +253,38 @@ class EquityPoint(Base):
 Base.metadata.create_all(bind=engine)
 
 
+def dialect_insert(db, model):
+    """
+    INSERT текущего диалекта (SQLite/PostgreSQL) — у обоих есть .on_conflict_do_nothing(index_elements=...),
+    что позволяет вставлять без предварительного SELECT на существование.
+    """
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"dialect_insert: unsupported dialect {name}")
+    return insert(model)
+
+
 def ensure_runtime_indexes(engine):
     """Создаёт недостающие индексы (idempotent). Безопасно для SQLite/Postgres."""
     stmts = [
         # статьи
         "CREATE INDEX IF NOT EXISTS ix_articles_published_id ON articles (published_at, id)",
         # модельные запуски
-        "CREATE INDEX IF NOT EXISTS ix_modelrun_market_hz_id ON model_runs (exchange, symbol, timeframe, horizon_steps, id)",
+        "CREATE INDEX IF NOT EXISTS ix_modelrun_market_hz_id "
+        "ON model_runs (exchange, symbol, timeframe, horizon_steps, id)",
     ]
+    if engine.dialect.name == "postgresql":
+        # ленты новостей: ORDER BY published_at DESC NULLS LAST, id DESC читается индексом без сортировки
+        # (SQLite не поддерживает NULLS LAST в определении индекса — там хватает
+        # обратного скана ix_articles_published_id)
+        stmts.append(
+            "CREATE INDEX IF NOT EXISTS ix_articles_published_desc_id "
+            "ON articles (published_at DESC NULLS LAST, id DESC)"
+        )
     with engine.begin() as con:
         for s in stmts:
             con.execute(_sql_text(s))
@@ -3,8 +3,11 @@
 """
 from __future__ import annotations
 import os
+from collections.abc import Mapping
 from typing import Optional, Any
+import orjson
 from fastapi import Security, HTTPException
+from fastapi.responses import Response
 from fastapi.security import APIKeyHeader
 from sqlalchemy.orm import Session
 from src.db import SessionLocal
@@ -57,3 +60,20 @@ def err(code: str, detail: Any = None, http: int = 400):
     """Единый способ отдавать ошибки"""
     raise HTTPException(status_code=http, detail={"status": "error", "code": code, "detail": detail})
 
+
+def _orjson_default(obj: Any) -> Any:
+    # RowMapping из Result.mappings() — не dict, orjson сериализует его через default
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def orjson_response(payload: Any) -> Response:
+    """
+    JSON-ответ через orjson в обход jsonable_encoder.
+    Списочные эндпоинты отдают строки Result.mappings() напрямую, без промежуточных dict.
+    """
+    return Response(
+        orjson.dumps(payload, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+    )
@@ -22,6 +22,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 # Импорты роутеров
@@ -52,7 +53,7 @@ from src.routers import (
 )
 
 # Импорты зависимостей и утилит
-from src.dependencies import get_db, require_api_key
+from src.dependencies import get_db, require_api_key, orjson_response
 from src.utils import _now_utc
 from src.db import SessionLocal, Message
 
@@ -251,7 +252,9 @@ def health():
     try:
         # Проверяем наличие модели в artifacts/models/
         models_dir = Path("artifacts/models")
-        model_files = list(models_dir.glob("model_*.pkl")) if models_dir.exists() else []
+        model_files = (
+            list(models_dir.glob("*.ubj")) + list(models_dir.glob("model_*.pkl")) if models_dir.exists() else []
+        )
         health_status["services"]["model"] = "ok" if model_files else "no_model"
     except Exception as e:
         health_status["services"]["model"] = f"error: {e}"
@@ -297,8 +300,10 @@ def add_message_get(text: str, db: Session = Depends(get_db), _=Depends(require_
 @app.get("/memory/all", tags=["Memory"])
 def get_messages(db: Session = Depends(get_db), _=Depends(require_api_key)):
     """Получить все сообщения из памяти"""
-    msgs = db.query(Message).order_by(Message.id.desc()).all()
-    return [{"id": m.id, "text": m.text, "created_at": m.created_at} for m in msgs]
+    rows = db.execute(
+        select(Message.id, Message.text, Message.created_at).order_by(Message.id.desc())
+    ).mappings().all()
+    return orjson_response(rows)
 
 
 # ============== APScheduler Jobs ==============
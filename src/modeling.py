@@ -1,13 +1,18 @@
 from pathlib import Path
+from functools import lru_cache
 import json
-import glob
 import os
+import shutil
+import subprocess
+import tempfile
 from typing import Dict, Tuple, List
 import numpy as np
 import pandas as pd
+import xgboost as xgb
 from xgboost import XGBClassifier
 from sklearn.metrics import accuracy_score, roc_auc_score
 import joblib
+from joblib import Parallel, delayed
 import logging
 
 # Загрузка переменных окружения из .env
@@ -20,14 +25,127 @@ logger = logging.getLogger(__name__)
 try:
     import mlflow
     import mlflow.sklearn
+    from mlflow.entities import Metric, Param, RunTag
+    from mlflow.tracking import MlflowClient
     MLFLOW_ENABLED = os.getenv("MLFLOW_TRACKING_URI") is not None
     if MLFLOW_ENABLED:
+        # недоступный сервер не должен подвешивать обучение на серии ретраев
+        os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "1")
         mlflow.set_tracking_uri(os.getenv("MLFLOW_TRACKING_URI", "http://localhost:5000"))
         logger.info(f"[mlflow] Tracking enabled: {mlflow.get_tracking_uri()}")
 except ImportError:
     MLFLOW_ENABLED = False
     logger.info("[mlflow] MLflow not installed, tracking disabled")
 
+# Numba (опционально): потоковый перебор порогов без матрицы (len(grid), n) на длинных выборках
+try:
+    from numba import njit
+
+    NUMBA_ENABLED = True
+except ImportError:
+    NUMBA_ENABLED = False
+
+# выше этого размера матрицы (len(grid) * n) подбор порога идёт через numba-ядро
+_THR_SWEEP_NUMBA_MIN_CELLS = 2_000_000
+
+if NUMBA_ENABLED:
+
+    @njit(cache=True)
+    def _threshold_sweep_numba(proba, y, fut, grid, out_acc, out_ret, out_mean, out_std):
+        n = proba.shape[0]
+        for j in range(grid.shape[0]):
+            thr = grid[j]
+            correct = 0
+            s = 0.0
+            log_sum = 0.0
+            for i in range(n):
+                hit = proba[i] > thr
+                if hit == (y[i] != 0):
+                    correct += 1
+                if hit:
+                    s += fut[i]
+                    log_sum += np.log1p(fut[i])
+            mu = s / n
+            ss = 0.0
+            for i in range(n):
+                r = fut[i] if proba[i] > thr else 0.0
+                ss += (r - mu) * (r - mu)
+            out_acc[j] = correct / n
+            out_ret[j] = np.expm1(log_sum)
+            out_mean[j] = mu
+            out_std[j] = np.sqrt(ss / n)
+
+
+# Общие гиперпараметры XGBoost для train_xgb_and_save и walk_forward_cv
+_XGB_PARAMS = dict(
+    n_estimators=300,
+    max_depth=4,
+    learning_rate=0.05,
+    subsample=0.8,
+    colsample_bytree=0.8,
+    reg_lambda=1.0,
+    objective="binary:logistic",
+    eval_metric="logloss",
+    random_state=42,
+    tree_method="hist",
+)
+_XGB_CPU_JOBS = 4
+
+# XGB_DEVICE=auto|cuda|cpu. На малых выборках копирование на GPU дороже самого обучения,
+# поэтому CUDA включается только от _MIN_ROWS_FOR_GPU строк.
+_XGB_DEVICE_PREF = os.getenv("XGB_DEVICE", "auto").strip().lower()
+_MIN_ROWS_FOR_GPU = int(os.getenv("XGB_MIN_ROWS_FOR_GPU", "20000"))
+
+
+@lru_cache(maxsize=1)
+def _cuda_available() -> bool:
+    """XGBoost собран с CUDA и в системе виден хотя бы один GPU."""
+    try:
+        if not xgb.build_info().get("USE_CUDA"):
+            return False
+        if shutil.which("nvidia-smi") is None:
+            return False
+        res = subprocess.run(["nvidia-smi", "-L"], capture_output=True, timeout=5)
+        return res.returncode == 0 and b"GPU" in res.stdout
+    except Exception:
+        return False
+
+
+def _xgb_device_params(n_rows: int) -> Dict:
+    """device (+ n_jobs для CPU) для XGBClassifier в зависимости от железа и размера выборки."""
+    if _XGB_DEVICE_PREF != "cpu" and n_rows >= _MIN_ROWS_FOR_GPU and _cuda_available():
+        return {"device": "cuda"}
+    if _XGB_DEVICE_PREF == "cuda" and n_rows >= _MIN_ROWS_FOR_GPU:
+        logger.warning("[modeling] XGB_DEVICE=cuda, но GPU недоступен — обучаем на CPU")
+    return {"device": "cpu", "n_jobs": _XGB_CPU_JOBS}
+
+
+# минимальная доля общих строк у соседних train-окон, при которой фолд дообучает прошлый бустер
+_WARM_START_MIN_OVERLAP = 0.8
+
+
+def _xgb_booster_params(n_rows: int) -> Tuple[Dict, int]:
+    """_XGB_PARAMS в терминах нативного xgb.train: (params, num_boost_round)."""
+    params = {k: v for k, v in _XGB_PARAMS.items() if k not in ("n_estimators", "random_state")}
+    params["seed"] = _XGB_PARAMS["random_state"]
+    dev = _xgb_device_params(n_rows)
+    params["device"] = dev["device"]
+    if "n_jobs" in dev:
+        params["nthread"] = dev["n_jobs"]
+    return params, int(_XGB_PARAMS["n_estimators"])
+
+
+# имя эксперимента MLflow -> experiment_id (set_experiment резолвится по сети один раз на процесс)
+_MLFLOW_EXPERIMENT_IDS: Dict[str, str] = {}
+
+
+def _mlflow_experiment_id(name: str) -> str:
+    exp_id = _MLFLOW_EXPERIMENT_IDS.get(name)
+    if exp_id is None:
+        exp_id = mlflow.set_experiment(name).experiment_id
+        _MLFLOW_EXPERIMENT_IDS[name] = exp_id
+    return exp_id
+
 
 def time_split(df: pd.DataFrame, test_ratio: float = 0.2) -> tuple[pd.DataFrame, pd.DataFrame]:
     n = len(df)
@@ -38,14 +156,16 @@ def time_split(df: pd.DataFrame, test_ratio: float = 0.2) -> tuple[pd.DataFrame,
 
 
 def _evaluate_with_threshold(y_true: np.ndarray, proba: np.ndarray, future_ret: np.ndarray, thr: float) -> Dict:
-    pred = (proba > thr).astype(int)
-    acc = float(accuracy_score(y_true, pred))
+    mask = proba > thr
+    acc = float(accuracy_score(y_true, mask.astype(int)))
     try:
         auc = float(roc_auc_score(y_true, proba))
     except Exception:
         auc = None
-    strat_ret = pred * future_ret
-    total_return = float(np.prod(1.0 + strat_ret) - 1.0)
+    # np.where вместо int-маска * future_ret: без лишнего int->float каста
+    strat_ret = np.where(mask, future_ret, 0.0)
+    # сумма логарифмов вместо произведения: не теряет точность и не переполняется на длинных рядах
+    total_return = float(np.expm1(np.log1p(strat_ret).sum()))
     sharpe_like = (
         float(np.mean(strat_ret) / (np.std(strat_ret) + 1e-9) * np.sqrt(len(strat_ret))) if len(strat_ret) > 1 else None
     )
@@ -58,27 +178,98 @@ def _select_threshold_grid(
     """
     Подбирает порог по сетке с приоритетом: Sharpe -> total_return -> AUC.
     Возвращает (best_thr, best_metrics).
+    Все пороги считаются одним broadcast'ом: матрица предсказаний (len(grid), n);
+    на больших выборках при наличии numba — потоковым ядром без этой матрицы.
     """
     if grid is None:
         grid = np.arange(0.50, 0.71, 0.01)
-    best_thr = float(grid[0])
-    best = None
-    for thr in grid:
-        m = _evaluate_with_threshold(y_true, proba, future_ret, float(thr))
-        if best is None:
-            best, best_thr = m, float(thr)
-            continue
-
-        def score(d):
-            return (
-                (d["sharpe_like"] if d["sharpe_like"] is not None else -1e9),
-                d["total_return"],
-                (d["roc_auc"] if d["roc_auc"] is not None else -1e9),
-            )
+    G = np.asarray(grid, dtype=np.float64)
+    y = np.asarray(y_true)
+    p = np.asarray(proba, dtype=np.float64)
+    fr = np.asarray(future_ret, dtype=np.float64)
+    n = len(p)
+
+    if NUMBA_ENABLED and len(G) * n >= _THR_SWEEP_NUMBA_MIN_CELLS:
+        acc, total_ret, mu, sd = (np.empty(len(G)) for _ in range(4))
+        _threshold_sweep_numba(p, y.astype(np.int64), fr, G, acc, total_ret, mu, sd)
+    else:
+        P = p[None, :] > G[:, None]  # (k, n) bool
+        acc = (P == y.astype(bool)[None, :]).mean(axis=1)
+        sr = P * fr[None, :]
+        total_ret = np.expm1(np.log1p(sr).sum(axis=1))
+        mu, sd = sr.mean(axis=1), sr.std(axis=1)
+
+    # AUC от порога не зависит — считаем один раз
+    try:
+        auc = float(roc_auc_score(y, p))
+    except Exception:
+        auc = None
 
-        if score(m) > score(best):
-            best, best_thr = m, float(thr)
-    return best_thr, best
+    if n > 1:
+        sharpe = mu / (sd + 1e-9) * np.sqrt(n)
+        sharpe_key = sharpe
+    else:
+        sharpe = None
+        sharpe_key = np.full(len(G), -1e9)
+
+    # lexsort: последний ключ — главный; -index даёт приоритет первому порогу при равенстве (как раньше)
+    best_i = int(np.lexsort((-np.arange(len(G)), total_ret, sharpe_key))[-1])
+    best = {
+        "accuracy": float(acc[best_i]),
+        "roc_auc": auc,
+        "total_return": float(total_ret[best_i]),
+        "sharpe_like": (float(sharpe[best_i]) if sharpe is not None else None),
+    }
+    return float(G[best_i]), best
+
+
+def _walk_forward_chain(
+    X_all: np.ndarray,
+    y_all: np.ndarray,
+    fut_all: np.ndarray,
+    starts: List[int],
+    window_train: int,
+    window_test: int,
+    va_off: int,
+    params: Dict,
+    n_rounds: int,
+    warm_start_rounds: int,
+    threshold_grid: np.ndarray | None,
+) -> list:
+    """
+    Цепочка подряд идущих фолдов walk_forward_cv: первый обучается с нуля, остальные (если
+    warm_start_rounds > 0) дообучают бустер предыдущего. Возвращает [(i, thr, warm, metrics, strat), ...].
+    """
+    out = []
+    prev_booster: xgb.Booster | None = None
+    # хвост train-окна (inner_valid) дообучается пропорциональной долей деревьев
+    tail_rounds = max(1, round(n_rounds * (window_train - va_off) / window_train))
+    for i in starts:
+        lo, hi, va_lo = i - window_train, i + window_test, i - window_train + va_off
+
+        # модель на inner_train; порог — по её вероятностям на хвосте, которого она не видела.
+        # QuantileDMatrix квантует inner_train один раз; хвост/test бинятся по его квантилям через ref=
+        dtr = xgb.QuantileDMatrix(X_all[lo:va_lo], label=y_all[lo:va_lo])
+        warm = prev_booster is not None and warm_start_rounds > 0
+        if warm:
+            booster = xgb.train(params, dtr, num_boost_round=warm_start_rounds, xgb_model=prev_booster)
+        else:
+            booster = xgb.train(params, dtr, num_boost_round=n_rounds)
+        # в цепочку идёт бустер без хвоста: хвост следующего фолда лежит правее его данных
+        prev_booster = booster
+        dva = xgb.QuantileDMatrix(X_all[va_lo:i], label=y_all[va_lo:i], ref=dtr)
+        proba_va = booster.predict(dva)
+        best_thr, _best_on_valid = _select_threshold_grid(y_all[va_lo:i], proba_va, fut_all[va_lo:i], threshold_grid)
+
+        # после выбора порога дообучаем копию на хвосте — test оценивается моделью на всём train-окне
+        booster = xgb.train(params, dva, num_boost_round=tail_rounds, xgb_model=booster)
+
+        # тест
+        proba_te = booster.predict(xgb.QuantileDMatrix(X_all[i:hi], ref=dtr))
+        fut_te = fut_all[i:hi]
+        m_te = _evaluate_with_threshold(y_all[i:hi], proba_te, fut_te, best_thr)
+        out.append((i, best_thr, warm, m_te, (proba_te > best_thr) * fut_te))
+    return out
 
 
 def walk_forward_cv(
@@ -90,83 +281,90 @@ def walk_forward_cv(
     step: int = 100,
     inner_valid_ratio: float = 0.2,
     threshold_grid: np.ndarray | None = None,
+    warm_start_rounds: int = 30,
+    full_refit_every: int = 5,
+    n_jobs: int | None = -1,
 ) -> Dict:
     """
     Скользящее окно: на каждом шаге:
-      - делим train на inner_train/inner_valid,
-      - подбираем порог на inner_valid,
-      - дообучаем на полном train,
+      - обучаем модель на inner_train
+        (если соседние train-окна пересекаются на >= 80%, дообучаем прошлый бустер на warm_start_rounds
+         деревьев вместо обучения с нуля; полное переобучение — каждые full_refit_every фолдов,
+         warm_start_rounds=0 отключает),
+      - подбираем порог на хвосте train (inner_valid) — вне выборки этой модели,
+      - дообучаем модель на хвосте (xgb_model=), чтобы test оценивался по всему train,
       - считаем метрики на test,
       - копим стратегию для общей equity-кривой.
+    Независимые цепочки фолдов считаются параллельно (n_jobs потоков, -1 = все ядра).
     Возвращает словарь с folds и агрегатами + усечённую equity-кривую.
     """
+    if window_train < 2:
+        raise ValueError(f"walk_forward_cv: window_train must be >= 2, got {window_train}")
     if df is None or df.empty:
         return {"folds": [], "summary": {"n_folds": 0}}
 
-    df = df.dropna().copy()
-    # безопасные колонки
-    use_cols = [c for c in feature_cols if c in df.columns]
+    df = df.dropna()  # новый DataFrame; дальше только чтение — лишний .copy() не нужен
+    # безопасные колонки (без дублей)
+    use_cols = list(dict.fromkeys(c for c in feature_cols if c in df.columns))
     if not use_cols:
         raise ValueError("walk_forward_cv: no usable feature columns found")
 
+    # один раз переводим данные в плотные массивы; фолды режутся целочисленными срезами без pandas
+    X_all = df[use_cols].to_numpy(dtype=np.float32)
+    y_all = df["y"].to_numpy()
+    fut_all = df["future_ret"].to_numpy(dtype=np.float64)
+    idx_all = df.index
+
     n = len(df)
-    folds = []
-    all_strat_rets: list[float] = []
-    all_time_idx: list[pd.Timestamp] = []
-
-    i = window_train
-    while i + window_test <= n:
-        tr = df.iloc[i - window_train : i]
-        te = df.iloc[i : i + window_test]
-
-        # внутренний split для подбора порога
-        tr_inner, va_inner = time_split(tr, test_ratio=inner_valid_ratio)
-
-        X_tr = tr_inner[use_cols].values
-        y_tr = tr_inner["y"].values
-        X_va = va_inner[use_cols].values
-        y_va = va_inner["y"].values
-        fut_va = va_inner["future_ret"].values
-
-        # базовая модель
-        model = XGBClassifier(
-            n_estimators=300,
-            max_depth=4,
-            learning_rate=0.05,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            reg_lambda=1.0,
-            objective="binary:logistic",
-            eval_metric="logloss",
-            n_jobs=4,
-            random_state=42,
-            tree_method="hist",
+    if n < window_train + window_test:
+        # данных меньше одного окна train+test — фолдов нет
+        return {"folds": [], "summary": {"n_folds": 0}}
+    overlap = max(0, window_train - max(1, int(step))) / max(1, window_train)
+    use_warm = warm_start_rounds > 0 and overlap >= _WARM_START_MIN_OVERLAP
+    # внутренний хвост train-окна для подбора порога (граница — как в time_split)
+    va_off = max(1, min(window_train - 1, int(window_train * (1 - inner_valid_ratio))))
+
+    # цепочки фолдов: внутри — последовательно (warm start от прошлого бустера), между собой — независимы
+    starts = list(range(window_train, n - window_test + 1, max(1, int(step))))
+    chain_len = max(1, int(full_refit_every)) if use_warm else 1
+    chains = [starts[k : k + chain_len] for k in range(0, len(starts), chain_len)]
+
+    # XGBoost отпускает GIL — цепочки гоняем в потоках над общими массивами, без копий и pickling;
+    # потоки XGBoost делим между воркерами, чтобы не было oversubscription
+    cpu = os.cpu_count() or 1
+    workers = min(len(chains), cpu if n_jobs is None or n_jobs < 1 else int(n_jobs)) or 1
+    params, n_rounds = _xgb_booster_params(window_train)
+    if "nthread" in params:
+        params["nthread"] = max(1, params["nthread"] // workers) if workers > 1 else params["nthread"]
+
+    def run_chain(chain: List[int]) -> list:
+        return _walk_forward_chain(
+            X_all, y_all, fut_all, chain, window_train, window_test, va_off,
+            params, n_rounds, int(warm_start_rounds), threshold_grid,
         )
-        model.fit(X_tr, y_tr)
-        proba_va = model.predict_proba(X_va)[:, 1]
-        best_thr, _best_on_valid = _select_threshold_grid(y_va, proba_va, fut_va, threshold_grid)
-
-        # дообучаем на всём train-окне
-        model.fit(tr[use_cols].values, tr["y"].values)
 
-        # тест
-        proba_te = model.predict_proba(te[use_cols].values)[:, 1]
-        fut_te = te["future_ret"].values
-        y_te = te["y"].values
-        m_te = _evaluate_with_threshold(y_te, proba_te, fut_te, best_thr)
+    if workers > 1:
+        chain_results = Parallel(n_jobs=workers, prefer="threads")(delayed(run_chain)(c) for c in chains)
+    else:
+        chain_results = [run_chain(c) for c in chains]
 
-        # накапливаем стратегию и тайм-индекс для кривой
-        strat = ((proba_te > best_thr).astype(int) * fut_te).tolist()
-        all_strat_rets.extend(strat)
-        all_time_idx.extend(te.index.to_list())
+    folds = []
+    strat_chunks: list[np.ndarray] = []
+    pos_chunks: list[np.ndarray] = []
+    for i, best_thr, warm, m_te, strat in (r for chain in chain_results for r in chain):
+        lo, hi = i - window_train, i + window_test
+        # накапливаем стратегию и позиции баров для кривой
+        strat_chunks.append(strat)
+        pos_chunks.append(np.arange(i, hi))
 
         folds.append(
             {
-                "start": tr.index[0].isoformat(),
-                "end": te.index[-1].isoformat(),
-                "n_train": int(len(tr)),
-                "n_test": int(len(te)),
+                "start": idx_all[lo].isoformat(),
+                "end": idx_all[hi - 1].isoformat(),
+                "n_train": int(window_train),
+                "n_test": int(window_test),
                 "threshold": float(best_thr),
+                "warm_start": bool(warm),
                 "accuracy": float(m_te["accuracy"]),
                 "roc_auc": (float(m_te["roc_auc"]) if m_te["roc_auc"] is not None else None),
                 "total_return": float(m_te["total_return"]),
@@ -174,8 +372,6 @@ def walk_forward_cv(
             }
         )
 
-        i += max(1, int(step))
-
     if not folds:
         return {"folds": [], "summary": {"n_folds": 0}}
 
@@ -186,13 +382,10 @@ def walk_forward_cv(
     sharpe_mean = float(np.mean(sharpes)) if sharpes else None
 
     # общая equity-кривая на тестовых отрезках
-    eq = []
-    s = 1.0
-    for r in all_strat_rets:
-        s *= 1.0 + float(r)
-        eq.append(s)
+    rets = np.concatenate(strat_chunks) if strat_chunks else np.empty(0)
+    eq = np.cumprod(1.0 + rets)
 
-    total_return_cum = float(s - 1.0)
+    total_return_cum = float(eq[-1] - 1.0) if len(eq) else 0.0
 
     # уменьшим размер для metrics.json (до 400 точек)
     max_pts = 400
@@ -200,8 +393,9 @@ def walk_forward_cv(
         step_idx = int(np.ceil(len(eq) / max_pts))
     else:
         step_idx = 1
-    eq_ds = eq[::step_idx]
-    ts_ds = [t.isoformat() for t in all_time_idx[::step_idx]]
+    eq_ds = eq[::step_idx].tolist()
+    pos_ds = np.concatenate(pos_chunks)[::step_idx] if pos_chunks else np.empty(0, dtype=np.int64)
+    ts_ds = [t.isoformat() for t in idx_all[pos_ds]]
 
     return {
         "params": {
@@ -209,6 +403,8 @@ def walk_forward_cv(
             "window_test": int(window_test),
             "step": int(step),
             "inner_valid_ratio": float(inner_valid_ratio),
+            "warm_start_rounds": int(warm_start_rounds) if use_warm else 0,
+            "full_refit_every": int(full_refit_every),
         },
         "folds": folds,
         "summary": {
@@ -229,19 +425,19 @@ def train_xgb_and_save(
     mlflow_experiment: str = "myassistent-trading",
     mlflow_run_name: str | None = None,
 ) -> Tuple[Dict, str]:
-    """Тренируем XGB, подбираем threshold по сетке, сохраняем .pkl и метрики."""
+    """Тренируем XGB, подбираем threshold по сетке, сохраняем .ubj (+ .meta.json) и метрики."""
     Path(artifacts_dir).mkdir(exist_ok=True)
     models_dir = Path(artifacts_dir) / "models"
     models_dir.mkdir(parents=True, exist_ok=True)
 
-    df = df.dropna().copy()
+    df = df.dropna()  # новый DataFrame; дальше только чтение — лишний .copy() не нужен
     if df.empty:
         raise ValueError("empty dataframe passed to train_xgb_and_save")
     if not feature_cols:
         raise ValueError("feature_cols is empty")
 
-    # безопасный сабсет — только реально существующие колонки
-    use_cols = [c for c in feature_cols if c in df.columns]
+    # безопасный сабсет — только реально существующие колонки (без дублей)
+    use_cols = list(dict.fromkeys(c for c in feature_cols if c in df.columns))
     missing_cols = sorted(set(feature_cols) - set(use_cols))
     if missing_cols:
         print(f"[modeling] Missing features skipped: {missing_cols[:8]}{'...' if len(missing_cols) > 8 else ''}")
@@ -250,77 +446,33 @@ def train_xgb_and_save(
     if df_test.empty:
         raise ValueError("test split is empty")
 
-    X_train = df_train[use_cols].values
-    y_train = df_train["y"].values
-    X_test = df_test[use_cols].values
-    y_test = df_test["y"].values
-    fut = df_test["future_ret"].values
+    # XGBoost (hist) всё равно работает во float32 — отдаём сразу float32, без лишней float64-копии
+    X_train = df_train[use_cols].to_numpy(dtype=np.float32)
+    y_train = df_train["y"].to_numpy()
+    X_test = df_test[use_cols].to_numpy(dtype=np.float32)
+    y_test = df_test["y"].to_numpy()
+    fut = df_test["future_ret"].to_numpy(dtype=np.float64, copy=False)
 
     # ============ MLflow Tracking Start ============
     if MLFLOW_ENABLED:
         try:
-            mlflow.set_experiment(mlflow_experiment)
-            mlflow.start_run(run_name=mlflow_run_name)
-            
-            # Log hyperparameters
-            mlflow.log_params({
-                "n_estimators": 300,
-                "max_depth": 4,
-                "learning_rate": 0.05,
-                "subsample": 0.8,
-                "colsample_bytree": 0.8,
-                "reg_lambda": 1.0,
-                "n_train": len(df_train),
-                "n_test": len(df_test),
-                "n_features": len(use_cols),
-                "test_ratio": test_ratio,
-            })
+            mlflow.start_run(experiment_id=_mlflow_experiment_id(mlflow_experiment), run_name=mlflow_run_name)
         except Exception as e:
             logger.warning(f"[mlflow] Failed to start run: {e}")
 
-    model = XGBClassifier(
-        n_estimators=300,
-        max_depth=4,
-        learning_rate=0.05,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        reg_lambda=1.0,
-        objective="binary:logistic",
-        eval_metric="logloss",
-        n_jobs=4,
-        random_state=42,
-    )
+    model = XGBClassifier(**_XGB_PARAMS, **_xgb_device_params(len(df_train)))
     model.fit(X_train, y_train)
     proba = model.predict_proba(X_test)[:, 1]
 
     # поиск порога (Sharpe -> total_return -> AUC)
-    candidates = np.arange(0.50, 0.71, 0.01)
-    best = None
-    best_thr = 0.55
-    for thr in candidates:
-        m = _evaluate_with_threshold(y_test, proba, fut, thr)
-        if best is None:
-            best, best_thr = m, float(thr)
-            continue
-
-        def score(d):
-            return (
-                (d["sharpe_like"] if d["sharpe_like"] is not None else -1e9),
-                d["total_return"],
-                (d["roc_auc"] if d["roc_auc"] is not None else -1e9),
-            )
-
-        if score(m) > score(best):
-            best, best_thr = m, float(thr)
+    best_thr, best = _select_threshold_grid(y_test, proba, fut)
 
     # собираем метрики и сохраняем артефакты
     metrics = {"n_train": int(len(df_train)), "n_test": int(len(df_test)), "threshold": float(best_thr), **best}
 
     ts = pd.Timestamp.utcnow().strftime("%Y%m%d_%H%M%S")
-    model_path = models_dir / f"xgb_{ts}.pkl"  # ← единый формат .pkl
-    joblib.dump(
-        {"model": model, "feature_cols": use_cols, "threshold": float(best_thr), "metrics": metrics}, model_path
-    )
+    model_path = models_dir / f"xgb_{ts}.ubj"  # нативный бинарный формат XGBoost
+    save_model_artifact(model, model_path, use_cols, float(best_thr), metrics)
 
     # файлы для UI
     with open(Path(artifacts_dir) / "metrics.json", "w", encoding="utf-8") as f:
@@ -331,40 +483,61 @@ def train_xgb_and_save(
     # ============ MLflow Tracking End ============
     if MLFLOW_ENABLED:
         try:
-            # Log metrics
-            mlflow.log_metrics({
+            run_id = mlflow.active_run().info.run_id
+            now_ms = int(pd.Timestamp.utcnow().timestamp() * 1000)
+
+            # params + metrics + tags — одним log_batch (один HTTP-запрос вместо трёх)
+            params = {
+                "n_estimators": _XGB_PARAMS["n_estimators"],
+                "max_depth": _XGB_PARAMS["max_depth"],
+                "learning_rate": _XGB_PARAMS["learning_rate"],
+                "subsample": _XGB_PARAMS["subsample"],
+                "colsample_bytree": _XGB_PARAMS["colsample_bytree"],
+                "reg_lambda": _XGB_PARAMS["reg_lambda"],
+                "n_train": len(df_train),
+                "n_test": len(df_test),
+                "n_features": len(use_cols),
+                "test_ratio": test_ratio,
+            }
+            run_metrics = {
                 "accuracy": metrics["accuracy"],
                 "roc_auc": metrics.get("roc_auc") or 0,
                 "threshold": metrics["threshold"],
                 "total_return": metrics["total_return"],
                 "sharpe_like": metrics.get("sharpe_like") or 0,
-            })
-            
+            }
+            tags = {"stage": "challenger", "n_features": len(use_cols), "model_type": "XGBoost"}
+            MlflowClient().log_batch(
+                run_id,
+                metrics=[Metric(k, float(v), now_ms, 0) for k, v in run_metrics.items()],
+                params=[Param(k, str(v)) for k, v in params.items()],
+                tags=[RunTag(k, str(v)) for k, v in tags.items()],
+            )
+
             # Log model to MLflow with signature
             mlflow.sklearn.log_model(
                 model, 
                 "model",
                 registered_model_name="xgboost_trading_model"
             )
-            
-            # Log artifacts
-            mlflow.log_artifact(str(model_path), "model_artifacts")
-            mlflow.log_artifact(str(Path(artifacts_dir) / "metrics.json"), "metrics")
-            mlflow.log_artifact(str(Path(artifacts_dir) / "features.json"), "features")
-            
-            # Log feature importance
-            if hasattr(model, "feature_importances_"):
-                importance_dict = dict(zip(use_cols, model.feature_importances_.tolist()))
-                mlflow.log_dict(importance_dict, "feature_importance.json")
-            
-            # Log tags for easy filtering
-            mlflow.set_tags({
-                "stage": "challenger",
-                "n_features": len(use_cols),
-                "model_type": "XGBoost",
-            })
-            
-            run_id = mlflow.active_run().info.run_id
+
+            # Артефакты (модель, метрики, фичи, важность) — одним log_artifacts из временной папки
+            with tempfile.TemporaryDirectory() as tmp:
+                tmp_dir = Path(tmp)
+                for sub, src in (
+                    ("model_artifacts", model_path),
+                    ("model_artifacts", _meta_path(model_path)),
+                    ("metrics", Path(artifacts_dir) / "metrics.json"),
+                    ("features", Path(artifacts_dir) / "features.json"),
+                ):
+                    (tmp_dir / sub).mkdir(exist_ok=True)
+                    shutil.copy2(src, tmp_dir / sub / src.name)
+                if hasattr(model, "feature_importances_"):
+                    importance_dict = dict(zip(use_cols, model.feature_importances_.tolist()))
+                    with open(tmp_dir / "feature_importance.json", "w", encoding="utf-8") as f:
+                        json.dump(importance_dict, f, ensure_ascii=False)
+                mlflow.log_artifacts(str(tmp_dir))
+
             logger.info(f"[mlflow] Run logged successfully (run_id: {run_id})")
             
             mlflow.end_run()
@@ -382,19 +555,40 @@ def train_xgb_and_save(
     return metrics, str(model_path.resolve())
 
 
-def load_latest_model(artifacts_dir: str = "artifacts", model_path: str | None = None):
+def _meta_path(model_path: Path) -> Path:
+    return model_path.with_suffix(".meta.json")
+
+
+def save_model_artifact(
+    model: XGBClassifier, model_path: Path, feature_cols: List[str], threshold: float, metrics: Dict
+) -> None:
     """
-    Возвращает (model, feature_cols, threshold, path).
-    Поддерживает и .pkl, и .joblib; приоритет — самый свежий.
+    Сохраняет модель в нативном формате XGBoost (UBJSON)
+    + сайдкар <name>.meta.json с feature_cols/threshold/metrics.
+    Нативный формат грузится C-парсером быстрее unpickle и не зависит от версий Python/sklearn.
     """
-    if model_path is None:
-        models_dir = Path(artifacts_dir) / "models"
-        candidates = sorted(glob.glob(str(models_dir / "*.pkl")) + glob.glob(str(models_dir / "*.joblib")))
-        if not candidates:
-            raise FileNotFoundError("Модель не найдена: нет файлов в artifacts/models")
-        model_path = candidates[-1]
+    with open(_meta_path(model_path), "w", encoding="utf-8") as f:
+        json.dump({"feature_cols": feature_cols, "threshold": threshold, "metrics": metrics}, f, ensure_ascii=False)
+    model.save_model(str(model_path))
 
-    obj = joblib.load(model_path)
+
+def read_model_artifact(path: str | Path) -> tuple:
+    """
+    Читает артефакт модели -> (model, feature_cols, threshold).
+    .ubj — нативный XGBoost + .meta.json; прочее (.pkl/.joblib) — legacy pickle (dict или сама модель).
+    .json не принимается: рядом лежат meta.json/metrics.json/features.json, а модель пишется только в .ubj.
+    """
+    p = Path(path)
+    if p.suffix == ".json":
+        raise ValueError(f"Not a model artifact: {p.name} (native models are saved as .ubj)")
+    if p.suffix == ".ubj":
+        model = XGBClassifier()
+        model.load_model(str(p))
+        meta_p = _meta_path(p)
+        meta = json.loads(meta_p.read_text(encoding="utf-8")) if meta_p.exists() else {}
+        return model, [str(c) for c in meta.get("feature_cols") or []], float(meta.get("threshold", 0.55))
+
+    obj = joblib.load(p)
     if isinstance(obj, dict):
         model = obj.get("model") or obj.get("estimator") or obj
         feature_cols = obj.get("feature_cols") or obj.get("features") or []
@@ -402,19 +596,88 @@ def load_latest_model(artifacts_dir: str = "artifacts", model_path: str | None =
     else:
         model = obj
         feature_cols, threshold = [], 0.55
-    return model, [str(c) for c in feature_cols], threshold, str(Path(model_path).resolve())
+    return model, [str(c) for c in feature_cols], threshold
+
+
+# Кэш десериализованных моделей: путь -> (mtime_ns, (model, feature_cols, threshold, path)).
+# Повторная десериализация XGBoost на каждый /predict стоит десятки мс; при перезаписи файла
+# mtime меняется и модель перечитывается.
+_MODEL_CACHE: Dict[str, Tuple[int, tuple]] = {}
+
+
+def _load_model_cached(path: Path) -> tuple:
+    key = str(path.resolve())
+    mtime_ns = path.stat().st_mtime_ns
+    hit = _MODEL_CACHE.get(key)
+    if hit is not None and hit[0] == mtime_ns:
+        model, feature_cols, threshold, resolved = hit[1]
+        return model, list(feature_cols), threshold, resolved
+
+    model, feature_cols, threshold = read_model_artifact(path)
+    loaded = (model, feature_cols, threshold, key)
+    _MODEL_CACHE[key] = (mtime_ns, loaded)
+    return loaded[0], list(loaded[1]), loaded[2], loaded[3]
+
+
+def clear_model_cache() -> None:
+    """Сбрасывает кэш загруженных моделей (например, после ручной замены артефактов)."""
+    _MODEL_CACHE.clear()
+
+
+_MODEL_EXTS = (".ubj", ".pkl", ".joblib")
+
+
+def _newest_model_file(models_dir: Path) -> str | None:
+    """Самый свежий (по mtime) файл модели — один проход os.scandir, без glob + sort."""
+    best, best_mtime = None, -1
+    try:
+        with os.scandir(models_dir) as it:
+            for e in it:
+                if not e.name.endswith(_MODEL_EXTS) or not e.is_file():
+                    continue
+                mtime = e.stat().st_mtime_ns
+                if mtime > best_mtime:
+                    best, best_mtime = e.path, mtime
+    except FileNotFoundError:
+        return None
+    return best
+
+
+def load_latest_model(artifacts_dir: str = "artifacts", model_path: str | None = None):
+    """
+    Возвращает (model, feature_cols, threshold, path).
+    Поддерживает .ubj (нативный XGBoost) и legacy .pkl/.joblib; приоритет — самый свежий по mtime.
+    Модель кэшируется в памяти по (path, mtime), повторные вызовы не читают диск.
+    """
+    if model_path is None:
+        model_path = _newest_model_file(Path(artifacts_dir) / "models")
+        if model_path is None:
+            raise FileNotFoundError("Модель не найдена: нет файлов в artifacts/models")
+
+    return _load_model_cached(Path(model_path))
 
 
 def load_model_from_path(path: str):
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(f"model file not found: {p}")
-    obj = joblib.load(p)
-    if isinstance(obj, dict):
-        model = obj.get("model") or obj.get("estimator") or obj
-        feature_cols = obj.get("feature_cols") or obj.get("features") or []
-        threshold = float(obj.get("threshold", 0.55))
-    else:
-        model = obj
-        feature_cols, threshold = [], 0.55
-    return model, [str(c) for c in feature_cols], threshold, str(p)
+    model, feature_cols, threshold, _resolved = _load_model_cached(p)
+    return model, feature_cols, threshold, str(p)
+
+
+def predict_positive_proba(model, X: np.ndarray) -> np.ndarray:
+    """
+    Вероятность класса 1 для матрицы X (float32, колонки в порядке feature_cols).
+    XGBClassifier с бинарной целью скорится через Booster.inplace_predict — без DMatrix
+    и проверок sklearn-обёртки (для пачки из нескольких строк это основная часть времени);
+    прочие модели — обычный predict_proba.
+    """
+    if isinstance(model, XGBClassifier) and model.n_classes_ == 2:
+        try:
+            iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:  # обучена без early stopping — все деревья
+            iteration_range = (0, 0)
+        return model.get_booster().inplace_predict(
+            X, iteration_range=iteration_range, predict_type="value", validate_features=False
+        )
+    return model.predict_proba(X)[:, 1]
@@ -1,14 +1,19 @@
 from __future__ import annotations
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import threading
 from datetime import datetime, timezone, timedelta
 from dateutil import parser as dtparse
 import feedparser
 from urllib.parse import urlparse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 import time
 import requests
-from src.db import Article, ArticleAnnotation
-from .news_url import canonicalize_url
+from src.db import Article, ArticleAnnotation, FeedState, dialect_insert
+from .news_url import canonicalize
 import re
 
 # Базовый список лент (можно расширять конфигом позже)
@@ -20,6 +25,25 @@ FEEDS = [
     "https://www.reuters.com/markets/cryptocurrency/rss",
 ]
 
+# максимум одновременных HTTP-запросов к лентам
+_FETCH_WORKERS = 8
+_RE_WS = re.compile(r"\s+")
+_HEADERS = {"User-Agent": "MyAssistantBot/0.7 (+https://local)"}
+_SOFT_WINDOW = timedelta(hours=48)
+
+# Индекс мягкой дедупликации в памяти процесса: source -> [(published_at, title_norm)].
+# Держим статьи не старше 2×окна — этого хватает, чтобы целиком покрыть окно ±48h вокруг записи
+# не старше 48h (обычный случай для RSS). Строится одним SELECT при первом вызове (или смене БД),
+# пополняется после успешной вставки; более старые записи фида проверяются прежним запросом в БД.
+_RECENT_HORIZON = 2 * _SOFT_WINDOW
+_recent_lock = threading.Lock()
+_recent_titles: Dict[str, List[tuple[datetime, str]]] = defaultdict(list)
+_recent_state: Dict[str, Any] = {"bind": None, "since": None}
+
+
+def _norm_title(title: str) -> str:
+    return _RE_WS.sub(" ", title).strip().lower()
+
 
 def _hostname(url: str) -> str:
     try:
@@ -59,6 +83,86 @@ def _parse_published(entry) -> datetime | None:
     return dt
 
 
+def _aware(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _recent_index(db: Session, now: datetime) -> datetime:
+    """
+    Готовит индекс _recent_titles (вызывать под _recent_lock) и возвращает его нижнюю границу:
+    записи с published_at >= границы + окно проверяются только по индексу.
+    """
+    since = now - _RECENT_HORIZON
+    bind = db.get_bind().url
+    if _recent_state["bind"] != bind:
+        _recent_titles.clear()
+        rows = db.execute(
+            select(Article.source, Article.title, Article.published_at).where(Article.published_at >= since)
+        ).all()
+        for src_, title_, pub_ in rows:
+            _recent_titles[src_].append((_aware(pub_), _norm_title(title_ or "")))
+        _recent_state["bind"] = bind
+    elif _recent_state["since"] is not None and since - _recent_state["since"] >= _SOFT_WINDOW:
+        # выселяем устаревшее не на каждом вызове, а раз в окно
+        for src_ in list(_recent_titles):
+            kept = [e for e in _recent_titles[src_] if e[0] >= since]
+            if kept:
+                _recent_titles[src_] = kept
+            else:
+                del _recent_titles[src_]
+    else:
+        since = _recent_state["since"] or since
+    _recent_state["since"] = since
+    return since
+
+
+def reset_recent_titles() -> None:
+    """Сбрасывает индекс мягкой дедупликации (перестроится из БД при следующей загрузке)."""
+    with _recent_lock:
+        _recent_titles.clear()
+        _recent_state.update(bind=None, since=None)
+
+
+def _fetch_feed(
+    feed_url: str, req_timeout: float, headers: Dict[str, str], state: tuple[str | None, str | None]
+) -> tuple[bytes | None, str | None, str | None] | None:
+    """
+    Условный GET ленты: (content, etag, last_modified); content=None — 304 Not Modified.
+    None — ошибка сети/HTTP.
+    """
+    etag, last_modified = state
+    if etag or last_modified:
+        headers = dict(headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    try:
+        r = requests.get(feed_url, timeout=req_timeout, headers=headers)
+        if r.status_code == 304:
+            return None, etag, last_modified
+        r.raise_for_status()
+        return r.content, r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except Exception as e:
+        print(f"[news] skip {feed_url}: {e}")
+        return None
+
+
+def _save_feed_state(db: Session, feed_url: str, etag: str | None, last_modified: str | None) -> None:
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(db, FeedState).values(url=feed_url, etag=etag, last_modified=last_modified, last_fetched=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["url"],
+        set_={"etag": stmt.excluded.etag, "last_modified": stmt.excluded.last_modified, "last_fetched": now},
+    )
+    try:
+        db.execute(stmt)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[news] feed_state error {feed_url}: {e}")
+
+
 def fetch_and_store(
     db: Session,
     feeds: List[str] | None = None,
@@ -68,104 +172,143 @@ def fetch_and_store(
 ) -> int:
     """
     Надёжная загрузка новостей:
-      - requests.get(..., timeout=req_timeout) -> feedparser.parse(bytes)
+      - requests.get(..., timeout=req_timeout) параллельно по всем фидам -> feedparser.parse(bytes)
+        (сеть — в пуле потоков, разбор и запись в БД — в вызывающем потоке: Session не потокобезопасна)
+      - условный GET (If-None-Match / If-Modified-Since из feed_state): на 304 лента пропускается
       - per_feed_limit: ограничение записей на фид
       - total_limit: общий лимит (None = без лимита)
-      - коммиты пачками
-      - канонизация URL (без UTM и прочих трекеров) + дедупликация:
+      - один INSERT и коммит на фид
+      - канонизация URL (без UTM и прочих трекеров) + дедупликация (INSERT ... ON CONFLICT на фид, не на запись):
          1) жёсткая — по каноническому URL
          2) мягкая — тот же источник и идентичный заголовок в окне ±48h
+            (по индексу заголовков в памяти процесса; в БД — только для старых записей)
     """
     feeds = feeds or FEEDS
-    headers = {"User-Agent": "MyAssistantBot/0.7 (+https://local)"}
+    headers = _HEADERS
+    soft_window = _SOFT_WINDOW
 
     added = 0
-    batch = 0
     start_time = time.time()
 
-    for feed_url in feeds:
-        try:
-            r = requests.get(feed_url, timeout=req_timeout, headers=headers)
-            r.raise_for_status()
-        except Exception as e:
-            print(f"[news] skip {feed_url}: {e}")
+    # ETag / Last-Modified прошлых загрузок — одним запросом на все ленты
+    states = {
+        url_: (etag, lm)
+        for url_, etag, lm in db.execute(
+            select(FeedState.url, FeedState.etag, FeedState.last_modified).where(FeedState.url.in_(feeds))
+        ).all()
+    }
+
+    # время ожидания ≈ самый медленный фид, а не сумма по всем
+    with ThreadPoolExecutor(max_workers=min(len(feeds), _FETCH_WORKERS) or 1) as pool:
+        raw = list(
+            pool.map(lambda u: _fetch_feed(u, req_timeout, headers, states.get(u, (None, None))), feeds)
+        )
+
+    for feed_url, res in zip(feeds, raw):
+        if res is None:
+            continue
+        content, etag, last_modified = res
+        if content is None:
+            # 304 Not Modified: лента не менялась — ни разбора, ни записи
             continue
 
         try:
-            feed = feedparser.parse(r.content)
+            feed = feedparser.parse(content)
             entries = feed.entries or []
         except Exception as e:
             print(f"[news] parse error {feed_url}: {e}")
             continue
 
+        # 1) разбираем все записи фида: канонический URL, источник по домену СТАТЬИ, время, нормализованный заголовок
+        cands: List[Dict[str, Any]] = []
         for entry in entries[:per_feed_limit]:
-            title = getattr(entry, "title", None) or ""
             link = getattr(entry, "link", None)
             if not link:
                 continue
+            title = getattr(entry, "title", None) or ""
+            can_link, host = canonicalize(link)
+            cands.append(
+                {
+                    "title": title,
+                    "url": can_link,
+                    "source": host or "unknown",
+                    "published_at": _parse_published(entry),
+                    "title_norm": _norm_title(title),
+                }
+            )
+        if not cands:
+            continue
 
-            # 1) канонизируем URL (срежем utm/рефы, нормализуем хост/путь/квери)
-            can_link = canonicalize_url(link)
-
-            # 2) жёсткая уникальность по каноническому URL
-            if db.query(Article).filter(Article.url == can_link).first():
-                continue
-
-            # 3) нормализуем источник по домену СТАТЬИ (не фида)
-            source = (urlparse(can_link).hostname or "unknown").lower()
+        with _recent_lock:
+            # 2) мягкая дедупликация: тот же источник и заголовок в окне ±48h.
+            #    Свежие записи проверяем по индексу в памяти; в БД идём только за теми,
+            #    чьё окно выходит за горизонт индекса (старые статьи в ленте) — одним запросом
+            index_since = _recent_index(db, datetime.now(timezone.utc))
+            recent: Dict[str, List[tuple[datetime, str]]] = defaultdict(list)
+            old = [
+                c["published_at"]
+                for c in cands
+                if c["published_at"] is not None and c["published_at"] - soft_window < index_since
+            ]
+            if old:
+                rows = db.execute(
+                    select(Article.source, Article.title, Article.published_at).where(
+                        Article.source.in_({c["source"] for c in cands}),
+                        Article.published_at >= min(old) - soft_window,
+                        Article.published_at < index_since,
+                    )
+                ).all()
+                for src_, title_, pub_ in rows:
+                    recent[src_].append((_aware(pub_), _norm_title(title_ or "")))
 
-            # 4) время публикации
-            published_at = _parse_published(entry)
-            if published_at is not None:
-                if published_at.tzinfo is None:
-                    published_at = published_at.replace(tzinfo=timezone.utc)
-                else:
-                    published_at = published_at.astimezone(timezone.utc)
-
-            # 5) мягкая дедупликация по заголовку в окне ±48h для того же источника
-            #    (избавляет от копий с одинаковыми заголовками)
-            title_norm = re.sub(r"\s+", " ", title).strip().lower()
-            if published_at is not None:
-                since = published_at - timedelta(hours=48)
-                until = published_at + timedelta(hours=48)
-                recent = (
-                    db.query(Article)
-                    .filter(Article.source == source)
-                    .filter(Article.published_at >= since)
-                    .filter(Article.published_at <= until)
-                    .order_by(Article.published_at.desc().nullslast())
-                    .limit(50)
-                    .all()
-                )
-                if any(re.sub(r"\s+", " ", (r.title or "")).strip().lower() == title_norm for r in recent):
+            # 3) фильтруем в памяти; принятые записи тоже учитываем (дубли внутри одного фида)
+            new_rows: List[Dict[str, Any]] = []
+            accepted: List[tuple[str, datetime, str]] = []
+            batch_urls: set[str] = set()
+            for c in cands:
+                if c["url"] in batch_urls:
                     continue
+                pub = c["published_at"]
+                if pub is not None and any(
+                    t == c["title_norm"] and abs(p - pub) <= soft_window
+                    for p, t in chain(_recent_titles.get(c["source"], ()), recent[c["source"]])
+                ):
+                    continue
+                # канонический URL
+                new_rows.append({"source": c["source"], "title": c["title"], "url": c["url"], "published_at": pub})
+                batch_urls.add(c["url"])
+                if pub is not None:
+                    recent[c["source"]].append((pub, c["title_norm"]))
+                    accepted.append((c["source"], pub, c["title_norm"]))
+                if total_limit and added + len(new_rows) >= total_limit:
+                    break
 
-            # 6) сохраняем
-            art = Article(
-                source=source, title=title, url=can_link, published_at=published_at  # <— сохраняем канонический URL
-            )
-            db.add(art)
-            batch += 1
-            added += 1
-
-            if batch >= 50:
+            # 4) жёсткая уникальность по каноническому URL делает сама БД (uq_articles_url):
+            #    один INSERT ... ON CONFLICT (url) DO NOTHING на фид, без SELECT перед записью
+            insert_failed = False
+            if new_rows:
+                stmt = dialect_insert(db, Article).values(new_rows).on_conflict_do_nothing(index_elements=["url"])
                 try:
+                    res = db.execute(stmt)
                     db.commit()
-                except Exception:
+                    added += max(0, res.rowcount or 0)
+                except Exception as e:
                     db.rollback()
-                batch = 0
-
-            if total_limit and added >= total_limit:
-                break
+                    insert_failed = True
+                    print(f"[news] insert error {feed_url}: {e}")
+                else:
+                    # индекс пополняем только закоммиченным
+                    for src_, pub, title_norm in accepted:
+                        if pub >= index_since:
+                            _recent_titles[src_].append((pub, title_norm))
 
         if total_limit and added >= total_limit:
             break
 
-    if batch:
-        try:
-            db.commit()
-        except Exception:
-            db.rollback()
+        # валидаторы сохраняем только для целиком обработанной ленты: иначе следующий запрос
+        # получит 304 и недозаписанные статьи потеряются (в том числе после отката INSERT)
+        if not insert_failed and (etag or last_modified) and states.get(feed_url) != (etag, last_modified):
+            _save_feed_state(db, feed_url, etag, last_modified)
 
     took = time.time() - start_time
     print(f"[news] fetch done: +{added} in {took:.1f}s from {len(feeds)} feeds")
@@ -1,4 +1,5 @@
 from __future__ import annotations
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, unquote
 import re
 
@@ -22,25 +23,43 @@ _TRACK_KEYS = {
     "igshid",
 }
 
+_RE_MULTISLASH = re.compile(r"/{2,}")
 
-def canonicalize_url(url: str) -> str:
+
+@lru_cache(maxsize=4096)
+def canonicalize(url: str) -> tuple[str, str]:
+    """
+    (канонический URL, hostname) за один urlparse.
+    Кэшируется: ленты между опросами в основном отдают те же ссылки.
+    """
     if not url:
-        return url
+        return url, ""
     u = urlparse(url.strip())
     scheme = (u.scheme or "https").lower()
     netloc = (u.netloc or "").lower()
+    host = u.hostname or ""
     if netloc.startswith("www."):
         netloc = netloc[4:]
+        if host.startswith("www."):
+            host = host[4:]
 
     # аккуратный path
     path = unquote(u.path or "")
-    path = re.sub(r"/{2,}", "/", path).rstrip("/")
-    # чистим query
-    q_pairs = [(k, v) for (k, v) in parse_qsl(u.query, keep_blank_values=False) if k.lower() not in _TRACK_KEYS]
-    q_pairs.sort()
-    query = urlencode(q_pairs)
+    if "//" in path:
+        path = _RE_MULTISLASH.sub("/", path)
+    path = path.rstrip("/")
+    # чистим query (parse_qsl/urlencode оставляем: они нормализуют кодирование, на этом держится дедуп по URL)
+    query = ""
+    if u.query:
+        q_pairs = [(k, v) for (k, v) in parse_qsl(u.query, keep_blank_values=False) if k.lower() not in _TRACK_KEYS]
+        q_pairs.sort()
+        query = urlencode(q_pairs)
 
     # убираем фрагмент
     frag = ""
     can = urlunparse((scheme, netloc, path, "", query, frag))
-    return can
+    return can, host
+
+
+def canonicalize_url(url: str) -> str:
+    return canonicalize(url)[0]
@@ -1,15 +1,26 @@
 from __future__ import annotations
-import json
+import copy
+from bisect import bisect_right
+import os
+import queue
+import re
+import threading
+import time
 from pathlib import Path
+from functools import lru_cache
 from typing import Any, Dict, Tuple
+import orjson
 import requests
-from .risk import load_policy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .risk import POLICY_PATH, load_policy
 import math
 from datetime import timezone as _tz
 
 CFG_DIR = Path("artifacts") / "config"
 CFG_DIR.mkdir(parents=True, exist_ok=True)
 CFG_PATH = CFG_DIR / "notify.json"
+_CFG_PATH_STR = str(CFG_PATH)
 
 DEFAULT_CFG: Dict[str, Any] = {
     "enabled": False,
@@ -23,19 +34,94 @@ DEFAULT_CFG: Dict[str, Any] = {
 }
 
 
+# Одна сессия на процесс: keep-alive до api.telegram.org, без TCP+TLS рукопожатия на каждое сообщение.
+# Ретраи urllib3 — только на ошибку соединения (запрос ещё не ушёл): sendMessage не идемпотентен,
+# повтор после 5xx/таймаута чтения может доставить сообщение дважды. 429 и retry_after
+# обрабатывают _post_telegram/_send_with_backoff.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=2,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=2,
+            connect=2,
+            read=0,
+            status=0,
+            other=0,
+            backoff_factor=0.5,
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Кэш разобранных конфигов: (mtime_ns, dict). Файл перечитывается только при смене mtime,
+# в остальных вызовах — один stat вместо open/read/разбора JSON.
+_CFG_CACHE: Dict[str, Any] = {"mtime": -1, "data": None, "enabled": False}
+_POLICY_CACHE: Dict[str, Any] = {"mtime": -1, "data": None}
+
+
+def _read_file(path: str) -> bytes:
+    """open/read/close на голых дескрипторах, без слоя Path/io-буферов."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            buf = os.read(fd, 65536)
+            if not buf:
+                break
+            chunks.append(buf)
+        return b"".join(chunks)
+    finally:
+        os.close(fd)
+
+
 def _load_raw() -> Dict[str, Any]:
-    if not CFG_PATH.exists():
-        CFG_PATH.write_text(json.dumps(DEFAULT_CFG, ensure_ascii=False, indent=2), encoding="utf-8")
-        return DEFAULT_CFG.copy()
+    """Текущий notify.json (с дефолтами). Результат общий для всех вызовов — только для чтения."""
     try:
-        data = json.loads(CFG_PATH.read_text(encoding="utf-8"))
-    except Exception:
-        data = {}
-    return {**DEFAULT_CFG, **(data or {})}
+        mtime = os.stat(_CFG_PATH_STR).st_mtime_ns
+    except FileNotFoundError:
+        CFG_PATH.write_bytes(orjson.dumps(DEFAULT_CFG, option=orjson.OPT_INDENT_2))
+        return DEFAULT_CFG
+    if _CFG_CACHE["mtime"] != mtime:
+        try:
+            data = orjson.loads(_read_file(_CFG_PATH_STR))
+        except Exception:
+            data = {}
+        cfg = {**DEFAULT_CFG, **(data or {})}
+        _CFG_CACHE["data"] = cfg
+        _CFG_CACHE["enabled"] = bool(cfg.get("enabled"))
+        _CFG_CACHE["mtime"] = mtime
+    return _CFG_CACHE["data"]
+
+
+def notifications_enabled() -> bool:
+    """Быстрая проверка флага enabled: stat + bool из кэша (разбор JSON — только при смене mtime)."""
+    try:
+        if os.stat(_CFG_PATH_STR).st_mtime_ns == _CFG_CACHE["mtime"]:
+            return _CFG_CACHE["enabled"]
+    except OSError:
+        pass
+    return bool(_load_raw().get("enabled"))
+
+
+def _load_policy_cached() -> Dict[str, Any]:
+    """policy.json для уведомлений, с тем же кэшем по mtime (только для чтения)."""
+    try:
+        mtime = os.stat(POLICY_PATH).st_mtime_ns
+    except OSError:
+        return load_policy() or {}
+    if _POLICY_CACHE["mtime"] != mtime:
+        _POLICY_CACHE["data"] = load_policy() or {}
+        _POLICY_CACHE["mtime"] = mtime
+    return _POLICY_CACHE["data"]
 
 
 def get_notify_config(mask: bool = True) -> Dict[str, Any]:
-    cfg = _load_raw()
+    # глубокая копия: вызывающие (роутер /notify/config) правят вложенные dict
+    cfg = copy.deepcopy(_load_raw())
     if mask:
         tg = cfg.get("telegram") or {}
         if "token" in tg and tg["token"]:
@@ -46,53 +132,230 @@ def get_notify_config(mask: bool = True) -> Dict[str, Any]:
 
 def save_notify_config(cfg: Dict[str, Any]) -> None:
     data = {**DEFAULT_CFG, **(cfg or {})}
-    CFG_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    CFG_PATH.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    # mtime на части ФС грубый (секунды) — сбрасываем кэш явно
+    _CFG_CACHE["mtime"] = -1
 
 
-def send_telegram(text: str) -> Tuple[bool, str]:
-    """Отправляет сообщение в телеграм. Возвращает (ok, detail)."""
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+@lru_cache(maxsize=4)
+def _tg_send_url(token: str) -> str:
+    return f"https://api.telegram.org/bot{token}/sendMessage"
+
+
+def _post_telegram(text: str) -> Tuple[bool, str, float]:
+    """Один sendMessage. Возвращает (ok, detail, retry_after): retry_after > 0 — Telegram ответил 429."""
+    if not notifications_enabled():
+        return False, "notifications disabled", 0.0
     cfg = _load_raw()
-    if not cfg.get("enabled"):
-        return False, "notifications disabled"
     tg = cfg.get("telegram") or {}
     token = (tg.get("token") or "").strip()
     chat_id = int(tg.get("chat_id") or 0)
     if not token or not chat_id:
-        return False, "telegram token/chat_id not configured"
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text, "disable_web_page_preview": True}
+        return False, "telegram token/chat_id not configured", 0.0
+    # тело сериализуем сами (orjson) и шлём как data= с готовыми заголовками — без json= внутри requests
+    body = orjson.dumps({"chat_id": chat_id, "text": text, "disable_web_page_preview": True})
     try:
-        r = requests.post(url, json=payload, timeout=10)
+        r = _SESSION.post(_tg_send_url(token), data=body, headers=_JSON_HEADERS, timeout=10)
         if r.ok:
-            return True, "sent"
-        return False, f"{r.status_code}: {r.text[:200]}"
+            return True, "sent", 0.0
+        retry_after = 0.0
+        if r.status_code == 429:
+            try:
+                retry_after = float((orjson.loads(r.content).get("parameters") or {}).get("retry_after") or 1)
+            except Exception:
+                retry_after = 1.0
+        # декодируем только срез для лога, а не всё тело
+        return False, f"{r.status_code}: {r.content[:200].decode('utf-8', 'replace')}", retry_after
     except Exception as e:
-        return False, f"error: {e}"
+        return False, f"error: {e}", 0.0
+
+
+def send_telegram(text: str) -> Tuple[bool, str]:
+    """Отправляет сообщение в телеграм (синхронно). Возвращает (ok, detail)."""
+    ok, detail, _ = _post_telegram(text)
+    return ok, detail
+
+
+# --- Фоновая отправка ---
+# Сигналы не ждут сеть: сообщение кладётся в очередь, отдельный поток шлёт его,
+# склеивая всплески (всё, что пришло за _COALESCE_WINDOW) в одно сообщение до лимита Telegram,
+# и на 429 выжидает parameters.retry_after.
+_TG_MAX_LEN = 4096
+_COALESCE_WINDOW = 0.2
+_SEND_ATTEMPTS = 3
+_OUTBOX: "queue.Queue[str]" = queue.Queue(maxsize=1000)
+_SENDER_LOCK = threading.Lock()
+_SENDER: Dict[str, Any] = {"thread": None}
+
+
+def _send_with_backoff(text: str) -> None:
+    for _ in range(_SEND_ATTEMPTS):
+        ok, detail, retry_after = _post_telegram(text)
+        if ok:
+            return
+        if retry_after <= 0:
+            break
+        time.sleep(retry_after)
+    print(f"[notify] telegram send failed: {detail}")
+
+
+def _sender_loop() -> None:
+    carry: str | None = None
+    while True:
+        msg = carry if carry is not None else _OUTBOX.get()
+        carry = None
+        batch, size = [msg], len(msg)
+        deadline = time.monotonic() + _COALESCE_WINDOW
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                break
+            try:
+                nxt = _OUTBOX.get(timeout=left)
+            except queue.Empty:
+                break
+            if size + 2 + len(nxt) > _TG_MAX_LEN:
+                carry = nxt
+                break
+            batch.append(nxt)
+            size += 2 + len(nxt)
+        try:
+            _send_with_backoff("\n\n".join(batch))
+        except Exception as e:
+            print(f"[notify] sender error: {e}")
+
+
+def enqueue_telegram(text: str) -> bool:
+    """Ставит сообщение в очередь фоновой отправки. False — уведомления выключены или очередь переполнена."""
+    if not notifications_enabled():
+        return False
+    if _SENDER["thread"] is None:
+        with _SENDER_LOCK:
+            if _SENDER["thread"] is None:
+                t = threading.Thread(target=_sender_loop, name="telegram-sender", daemon=True)
+                t.start()
+                _SENDER["thread"] = t
+    try:
+        _OUTBOX.put_nowait(text)
+        return True
+    except queue.Full:
+        print("[notify] outbox full, message dropped")
+        return False
+
+
+# корзины цены: [.., 0.01) | [0.01, 1) | [1, 100) | [100, ..) -> формат
+_PRICE_THRESH = (0.01, 1.0, 100.0)
+_PRICE_SPECS = ("{:.6f}", "{:,.4f}", "{:,.3f}", "{:,.2f}")
 
 
 def _fmt_price(x: float) -> str:
-    if x is None or (isinstance(x, float) and (math.isnan(x) or math.isinf(x))):
+    if x is None or (isinstance(x, float) and not math.isfinite(x)):
         return "—"
-    if x >= 100:
-        return f"{x:,.2f}".replace(",", " ")
-    if x >= 1:
-        return f"{x:,.3f}"
-    if x >= 0.01:
-        return f"{x:,.4f}"
-    return f"{x:.6f}"
+    idx = bisect_right(_PRICE_THRESH, x)
+    s = _PRICE_SPECS[idx].format(x)
+    return s.replace(",", " ") if idx == 3 else s
+
+
+# одно-слотовый кэш (bar_dt, строка): сигналы по одному бару приходят подряд
+_LAST_TS: list = [(None, "")]
 
 
 def _ts_hhmm_utc(dt) -> str:
+    last_dt, last_s = _LAST_TS[0]
+    if last_dt is not None and type(dt) is type(last_dt) and dt == last_dt:
+        return last_s
     try:
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=_tz.utc)
-        return dt.astimezone(_tz.utc).strftime("%H:%M UTC")
+        tz = dt.tzinfo
+        # naive считаем UTC; astimezone — только если зона действительно другая
+        utc = dt.astimezone(_tz.utc) if tz is not None and tz is not _tz.utc else dt
+        s = f"{utc.hour:02d}:{utc.minute:02d} UTC"
     except Exception:
         return str(dt)
+    _LAST_TS[0] = (dt, s)
+    return s
+
+
+_VOL_EMOJI = {"hot": "🔥", "dead": "🧊", "normal": "〰️"}
 
 
 def _vol_emoji(state: str | None) -> str:
-    return {"hot": "🔥", "dead": "🧊", "normal": "〰️"}.get((state or "normal"), "〰️")
+    return _VOL_EMOJI.get((state or "normal"), "〰️")
+
+
+# Разбор причин фильтров: волатильность — одной регуляркой, остальное — по таблице подстрок
+_RE_VOL = re.compile(r"(dead_volatility)|hot_volatility|hot market")
+_VOL_INFO = {
+    "dead": "🧊 Низкая волатильность (рынок спокоен)",
+    "hot": "🔥 Высокая волатильность (рынок активен)",
+    "normal": "〰️ Нормальная волатильность",
+}
+_REASON_SKIP = ("pass", "ok", "allow")
+_REASON_RISK = ("block", "reject", "dead")
+_REASON_BUCKETS = ((("volume",), "📊"), (("trend", "ema"), "📈"), (("cooldown",), "⏱"))
+
+# Статичные части «человеческого» сообщения
+_SEP = "━" * 20
+_HEADER = "📊 СИГНАЛ:"
+_RISKS_BLOCK = ("", "⚠️ РИСКИ:")
+_FILTERS_BLOCK = ("", "✓ ФИЛЬТРЫ ПРОЙДЕНЫ:")
+_ADVICE = "💡 РЕКОМЕНДАЦИЯ:"
+_SKIP_ADVICE = ("", _ADVICE, "Пропустить сделку (не выполнены условия)")
+
+
+def _classify_reasons(reasons: list[str]) -> Tuple[str, list[str], list[str]]:
+    """Один проход по причинам: (состояние волатильности, risk_warnings, filter_details)."""
+    vol_state = None
+    risk_warnings: list[str] = []
+    filter_details: list[str] = []
+    for r in reasons:
+        low = r.lower()
+        if vol_state is None:
+            m = _RE_VOL.search(low)
+            if m:
+                vol_state = "dead" if m.group(1) else "hot"
+        if any(k in low for k in _REASON_SKIP):
+            continue  # Пропускаем "pass" фильтры
+        if any(k in low for k in _REASON_RISK):
+            risk_warnings.append(f"⚠️ {r}")
+            continue
+        for keys, mark in _REASON_BUCKETS:
+            if any(k in low for k in keys):
+                filter_details.append(f"{mark} {r}")
+                break
+        else:
+            filter_details.append(f"• {r}")
+    return vol_state or "normal", risk_warnings, filter_details
+
+
+@lru_cache(maxsize=64)
+def _derive_model_info(model_path: str) -> str:
+    """Строка «📦 Модель: …» по пути модели (путь меняется только после переобучения — кэшируем)."""
+    try:
+        model_name = Path(model_path).stem
+        # Попытаемся извлечь дату из имени файла (формат: model_SYMBOL_TF_YYYYMMDD_HHMMSS.pkl)
+        parts = model_name.split("_")
+        if len(parts) >= 4:
+            date_part = parts[-2] if parts[-2].isdigit() and len(parts[-2]) == 8 else ""
+            if date_part:
+                return f"📦 Модель: {date_part[:4]}-{date_part[4:6]}-{date_part[6:8]}"
+        return f"📦 Модель: {model_name[:30]}"
+    except Exception:
+        return "📦 Модель: активная"
+
+
+def _buy_fraction(pol: Dict[str, Any], default: float = 0.10) -> float:
+    try:
+        if isinstance(pol.get("buy_fraction"), (int, float)):
+            return float(pol.get("buy_fraction"))
+        bf_auto = (pol.get("auto") or {}).get("buy_fraction") or {}
+        if isinstance(bf_auto, dict) and "normal" in bf_auto:
+            return float(bf_auto.get("normal", default))
+    except Exception:
+        pass
+    return default
 
 
 def maybe_send_signal_notification(
@@ -115,9 +378,9 @@ def maybe_send_signal_notification(
     и policy.notify.send_flat (если нужно присылать FLAT).
     """
     # 1) базовые настройки из artifacts/config/notify.json
-    cfg = _load_raw()
-    if not cfg.get("enabled"):
+    if not notifications_enabled():
         return
+    cfg = _load_raw()
     rules = cfg.get("rules") or {}
     send_flat = bool(rules.get("send_flat", False))
     min_gap = float(rules.get("min_abs_prob_gap", 0.0))
@@ -127,7 +390,7 @@ def maybe_send_signal_notification(
         return
 
     # 2) учтём предпочтения из policy.json
-    pol = load_policy() or {}
+    pol = _load_policy_cached()
     notify_pol = pol.get("notify") or {}
     style = str(notify_pol.get("style", "simple")).lower()
 
@@ -146,97 +409,39 @@ def maybe_send_signal_notification(
             raw += "Фильтры: " + "; ".join(reasons[:6])
         if model_path:
             raw += f"\n{model_path}"
-        send_telegram(raw)
+        enqueue_telegram(raw)
         return
 
     # 4) «человеческий» стиль с максимальной детализацией
-    side = "ПОКУПКА" if final_signal.lower() == "buy" else "БЕЗ ДЕЙСТВИЯ"
-    emoji = "🟢" if final_signal.lower() == "buy" else "⚪"
+    is_buy = final_signal.lower() == "buy"
+    side = "ПОКУПКА" if is_buy else "БЕЗ ДЕЙСТВИЯ"
+    emoji = "🟢" if is_buy else "⚪"
     ex = (exchange or "").upper()
     price_s = _fmt_price(float(close))
     time_s = _ts_hhmm_utc(bar_dt)
     gap_pp = delta * 100.0
 
-    # Определяем состояние волатильности из фильтров
-    vol_state = "normal"
-    vol_info = ""
-    try:
-        if reasons:
-            for r in reasons:
-                if "dead_volatility" in r.lower():
-                    vol_state = "dead"
-                    vol_info = "🧊 Низкая волатильность (рынок спокоен)"
-                    break
-                elif "hot_volatility" in r.lower() or "hot market" in r.lower():
-                    vol_state = "hot"
-                    vol_info = "🔥 Высокая волатильность (рынок активен)"
-                    break
-        if not vol_info:
-            vol_info = "〰️ Нормальная волатильность"
-    except Exception:
-        pass
-    _vol_emoji(vol_state)
-
-    # Анализ фильтров для детального вывода
-    filter_details = []
-    risk_warnings = []
-    if reasons:
-        for r in reasons:
-            r_lower = r.lower()
-            if "pass" in r_lower or "ok" in r_lower or "allow" in r_lower:
-                continue  # Пропускаем "pass" фильтры
-            if "block" in r_lower or "reject" in r_lower or "dead" in r_lower:
-                risk_warnings.append(f"⚠️ {r}")
-            elif "volume" in r_lower:
-                filter_details.append(f"📊 {r}")
-            elif "trend" in r_lower or "ema" in r_lower:
-                filter_details.append(f"📈 {r}")
-            elif "cooldown" in r_lower:
-                filter_details.append(f"⏱ {r}")
-            else:
-                filter_details.append(f"• {r}")
+    # Волатильность и анализ фильтров для детального вывода — один проход по reasons
+    vol_state, risk_warnings, filter_details = _classify_reasons(reasons or [])
+    vol_info = _VOL_INFO[vol_state]
 
     # Размер позиции и советы
-    buy_fraction = 0.10
-    try:
-        if isinstance(pol.get("buy_fraction"), (int, float)):
-            buy_fraction = float(pol.get("buy_fraction"))
-        else:
-            bf_auto = (pol.get("auto") or {}).get("buy_fraction") or {}
-            if isinstance(bf_auto, dict) and "normal" in bf_auto:
-                buy_fraction = float(bf_auto.get("normal", buy_fraction))
-    except Exception:
-        pass
+    buy_fraction = _buy_fraction(pol)
 
     # Информация о модели
-    model_info = ""
-    if model_path:
-        try:
-            model_name = Path(model_path).stem if model_path else "unknown"
-            # Попытаемся извлечь дату из имени файла (формат: model_SYMBOL_TF_YYYYMMDD_HHMMSS.pkl)
-            parts = model_name.split("_")
-            if len(parts) >= 4:
-                date_part = parts[-2] if parts[-2].isdigit() and len(parts[-2]) == 8 else ""
-                if date_part:
-                    model_info = f"📦 Модель: {date_part[:4]}-{date_part[4:6]}-{date_part[6:8]}"
-                else:
-                    model_info = f"📦 Модель: {model_name[:30]}"
-            else:
-                model_info = f"📦 Модель: {model_name[:30]}"
-        except Exception:
-            model_info = "📦 Модель: активная"
+    model_info = _derive_model_info(model_path) if model_path else ""
 
-    # Формирование сообщения
+    # Формирование сообщения: шапка — один кортеж, опциональные блоки — готовые кортежи-заготовки
     msg_lines = [
         f"{emoji} {side}",
-        "━━━━━━━━━━━━━━━━━━━━",
+        _SEP,
         f"🏦 Биржа: {ex}",
         f"💰 Пара: {symbol}",
         f"⏰ Таймфрейм: {timeframe}",
         f"💵 Цена: {price_s}",
         f"🕐 Время: {time_s}",
         "",
-        "📊 СИГНАЛ:",
+        _HEADER,
         f"• Вероятность: {proba:.1%}",
         f"• Порог модели: {threshold:.1%}",
         f"• Запас: {gap_pp:+.1f} п.п. ({'сильный' if abs(gap_pp) > 5 else 'умеренный'})",
@@ -245,36 +450,32 @@ def maybe_send_signal_notification(
     ]
 
     if model_info:
-        msg_lines.append(f"{model_info}")
+        msg_lines.append(model_info)
 
-    # Добавляем предупреждения о рисках
+    # Добавляем предупреждения о рисках (макс 3)
     if risk_warnings:
-        msg_lines.append("")
-        msg_lines.append("⚠️ РИСКИ:")
-        for warn in risk_warnings[:3]:  # Макс 3 предупреждения
-            msg_lines.append(warn)
-
-    # Добавляем детали фильтров (если есть и сигнал BUY)
-    if filter_details and final_signal.lower() == "buy":
-        msg_lines.append("")
-        msg_lines.append("✓ ФИЛЬТРЫ ПРОЙДЕНЫ:")
-        for detail in filter_details[:4]:  # Макс 4 фильтра
-            msg_lines.append(detail)
+        msg_lines += _RISKS_BLOCK
+        msg_lines += risk_warnings[:3]
+
+    # Добавляем детали фильтров (если есть и сигнал BUY, макс 4)
+    if filter_details and is_buy:
+        msg_lines += _FILTERS_BLOCK
+        msg_lines += filter_details[:4]
 
     # Рекомендации и команды
-    msg_lines.append("")
-    if final_signal.lower() == "buy":
-        msg_lines.append("💡 РЕКОМЕНДАЦИЯ:")
-        msg_lines.append(f"Купить на {buy_fraction*100:.0f}% от капитала")
-        msg_lines.append("")
-        msg_lines.append("🤖 Быстрая команда:")
-        msg_lines.append(f"/buy {exchange} {symbol} {buy_fraction}")
+    if is_buy:
+        msg_lines += (
+            "",
+            _ADVICE,
+            f"Купить на {buy_fraction*100:.0f}% от капитала",
+            "",
+            "🤖 Быстрая команда:",
+            f"/buy {exchange} {symbol} {buy_fraction}",
+        )
     else:
-        msg_lines.append("💡 РЕКОМЕНДАЦИЯ:")
-        msg_lines.append("Пропустить сделку (не выполнены условия)")
+        msg_lines += _SKIP_ADVICE
         if reasons:
-            top_reason = reasons[0] if reasons else "неизвестно"
-            msg_lines.append(f"Причина: {top_reason}")
+            msg_lines.append(f"Причина: {reasons[0]}")
 
     msg = "\n".join(msg_lines)
-    send_telegram(msg)
+    enqueue_telegram(msg)
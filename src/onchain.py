@@ -3,9 +3,17 @@ On-chain метрики через БЕСПЛАТНЫЕ API (CoinGecko, CoinGlas
 НЕ требуется API key! 🚀
 """
 from __future__ import annotations
+import asyncio
+import os
+import orjson
 import requests
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Optional
 import logging
+import threading
 import time
 
 logger = logging.getLogger(__name__)
@@ -14,20 +22,102 @@ logger = logging.getLogger(__name__)
 COINGECKO_BASE = "https://api.coingecko.com/api/v3"
 COINGLASS_BASE = "https://open-api.coinglass.com/public/v2"
 BLOCKCHAIN_INFO_BASE = "https://blockchain.info"
+COINGLASS_FUNDING_URL = "https://fapi.coinglass.com/api/fundingRate/v2/home"
+COINGLASS_LIQUIDATIONS_URL = "https://fapi.coinglass.com/api/futures/liquidation/chart"
+BTC_STATS_ENDPOINT = "stats?format=json"
+COINGECKO_COIN_PARAMS = {
+    "localization": "false",
+    "tickers": "false",
+    "community_data": "false",
+    "developer_data": "false",
+}
 
+# Маппинг coin_id для CoinGecko
+COIN_ID_MAP = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "SOL": "solana",
+    "USDT": "tether",
+    "BNB": "binancecoin",
+}
 
-def _rate_limit_sleep(delay: float = 1.2):
-    """Rate limiting для бесплатных API (50 req/min = 1.2 sec delay)"""
-    time.sleep(delay)
+# ONCHAIN_ASYNC=1 — все запросы get_onchain_features идут через httpx.AsyncClient в одном event loop
+# (src/onchain_async.py) вместо пула потоков
+ONCHAIN_ASYNC = os.getenv("ONCHAIN_ASYNC", "0").strip().lower() in ("1", "true", "yes")
+
+# Кэш сырых ответов провайдеров (метрики обновляются раз в сутки/часы, а не на каждый вызов):
+# память процесса + файл artifacts/cache/onchain/onchain_{asset}.json, свежесть — по mtime
+ONCHAIN_CACHE_TTL = 15 * 60
+# если часть провайдеров не ответила — кэшируем коротко, чтобы их заглушки не жили все 15 минут
+ONCHAIN_PARTIAL_CACHE_TTL = 60
+ONCHAIN_CACHE_DIR = Path("artifacts") / "cache" / "onchain"
+_MEM_CACHE: Dict[str, tuple] = {}  # asset -> (fetched_at, raw)
+
+ONCHAIN_HEADERS = {"User-Agent": "MyAssistent/1.0 (on-chain metrics)"}
+
+# Одна сессия на все провайдеры: keep-alive/TLS переиспользуются между вызовами.
+# Ретраи — только на 5xx/обрывы соединения; 429 обрабатывается в самих функциях (без данных)
+_SESSION = requests.Session()
+_SESSION.headers.update(ONCHAIN_HEADERS)
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        ),
+    ),
+)
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: пропускает всплески до capacity, ждёт только при пустом ведре."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # токенов в секунду
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: float = 1.0) -> float:
+        """Забирает n токенов (в долг, если не хватает) и возвращает, сколько секунд ждать до запроса."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= n
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self, n: float = 1.0) -> None:
+        # ждём вне блокировки: остальные потоки тем временем занимают свои места в очереди
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+
+# CoinGecko free tier: 50 req/min
+_COINGECKO_BUCKET = TokenBucket(rate=50 / 60, capacity=50)
+
+
+def _rate_limit_sleep():
+    """Rate limiting для CoinGecko: блокирует, только если исчерпан лимит 50 req/min."""
+    _COINGECKO_BUCKET.acquire(1)
 
 
 def _coingecko_get(endpoint: str, params: Optional[Dict] = None) -> Optional[Dict]:
     """Запрос к CoinGecko API (бесплатный, 50 req/min)"""
     url = f"{COINGECKO_BASE}/{endpoint}"
+    _rate_limit_sleep()
     try:
-        response = requests.get(url, params=params or {}, timeout=15)
+        response = _SESSION.get(url, params=params or {}, timeout=15)
         if response.status_code == 200:
-            return response.json()
+            return orjson.loads(response.content)
         elif response.status_code == 429:
             logger.warning("[CoinGecko] Rate limit hit, sleeping 60s...")
             time.sleep(60)
@@ -44,9 +134,9 @@ def _blockchain_info_get(endpoint: str) -> Optional[Dict]:
     """Запрос к Blockchain.info API (бесплатный для BTC)"""
     url = f"{BLOCKCHAIN_INFO_BASE}/{endpoint}"
     try:
-        response = requests.get(url, timeout=15)
+        response = _SESSION.get(url, timeout=15)
         if response.status_code == 200:
-            return response.json()
+            return orjson.loads(response.content)
         else:
             logger.error(f"[Blockchain.info] Error {response.status_code}")
             return None
@@ -59,19 +149,7 @@ def _blockchain_info_get(endpoint: str) -> Optional[Dict]:
 # CoinGecko - Market Data (бесплатный!)
 # ====================
 
-def get_coingecko_market_data(coin_id: str = "bitcoin") -> Optional[Dict]:
-    """
-    Получить рыночные данные с CoinGecko
-    
-    Включает: market cap, volume, price changes, circulating supply
-    """
-    data = _coingecko_get(f"coins/{coin_id}", params={
-        "localization": "false",
-        "tickers": "false",
-        "community_data": "false",
-        "developer_data": "false"
-    })
-    
+def _parse_market_data(data: Optional[Dict]) -> Optional[Dict]:
     if not data or "market_data" not in data:
         return None
     
@@ -86,10 +164,34 @@ def get_coingecko_market_data(coin_id: str = "bitcoin") -> Optional[Dict]:
     }
 
 
+def get_coingecko_market_data(coin_id: str = "bitcoin") -> Optional[Dict]:
+    """
+    Получить рыночные данные с CoinGecko
+    
+    Включает: market cap, volume, price changes, circulating supply
+    """
+    return _parse_market_data(_coingecko_get(f"coins/{coin_id}", params=COINGECKO_COIN_PARAMS))
+
+
 # ====================
 # Blockchain.info - Bitcoin On-chain (бесплатный!)
 # ====================
 
+def _parse_btc_stats(data: Optional[Dict]) -> Optional[Dict]:
+    if not data:
+        return None
+    
+    return {
+        "n_btc_mined": data.get("n_btc_mined", 0) / 1e8,  # Satoshi to BTC
+        "market_price_usd": data.get("market_price_usd", 0),
+        "hash_rate": data.get("hash_rate", 0),
+        "difficulty": data.get("difficulty", 0),
+        "n_tx": data.get("n_tx", 0),
+        "trade_volume_usd": data.get("trade_volume_usd", 0),
+        "mempool_size": data.get("mempool_size", 0),
+    }
+
+
 def get_btc_blockchain_stats() -> Optional[Dict]:
     """
     Bitcoin blockchain статистика от Blockchain.info
@@ -104,25 +206,37 @@ def get_btc_blockchain_stats() -> Optional[Dict]:
             "trade_volume_usd": объем торгов,
         }
     """
-    data = _blockchain_info_get("stats?format=json")
-    if not data:
-        return None
-    
-    return {
-        "n_btc_mined": data.get("n_btc_mined", 0) / 1e8,  # Satoshi to BTC
-        "market_price_usd": data.get("market_price_usd", 0),
-        "hash_rate": data.get("hash_rate", 0),
-        "difficulty": data.get("difficulty", 0),
-        "n_tx": data.get("n_tx", 0),
-        "trade_volume_usd": data.get("trade_volume_usd", 0),
-        "mempool_size": data.get("mempool_size", 0),
-    }
+    return _parse_btc_stats(_blockchain_info_get(BTC_STATS_ENDPOINT))
 
 
 # ====================
 # CoinGlass - Derivatives Data (бесплатный!)
 # ====================
 
+def _parse_funding_rate(data: Optional[Dict]) -> Optional[float]:
+    if data and data.get("success") and "data" in data:
+        # Усреднение по биржам
+        rates = [float(item["rate"]) for item in data["data"] if "rate" in item]
+        if rates:
+            return sum(rates) / len(rates)
+    return None
+
+
+def _parse_liquidations(data: Optional[Dict]) -> Optional[Dict]:
+    if data and data.get("success") and "data" in data:
+        # один проход по списку из JSON, без промежуточных структур
+        total_longs = total_shorts = 0.0
+        for item in data["data"]:
+            total_longs += float(item.get("longLiquidationValue", 0))
+            total_shorts += float(item.get("shortLiquidationValue", 0))
+        return {
+            "total_liquidations_usd": total_longs + total_shorts,
+            "long_liquidations_usd": total_longs,
+            "short_liquidations_usd": total_shorts,
+        }
+    return None
+
+
 def get_coinglass_funding_rate(symbol: str = "BTC") -> Optional[float]:
     """
     Funding Rate - индикатор настроения на derivatives рынке
@@ -131,17 +245,10 @@ def get_coinglass_funding_rate(symbol: str = "BTC") -> Optional[float]:
     """
     try:
         # CoinGlass Public API (без ключа!)
-        url = "https://fapi.coinglass.com/api/fundingRate/v2/home"
-        params = {"symbol": symbol}
-        response = requests.get(url, params=params, timeout=10)
+        response = _SESSION.get(COINGLASS_FUNDING_URL, params={"symbol": symbol}, timeout=10)
         
         if response.status_code == 200:
-            data = response.json()
-            if data.get("success") and "data" in data:
-                # Усреднение по биржам
-                rates = [float(item["rate"]) for item in data["data"] if "rate" in item]
-                if rates:
-                    return sum(rates) / len(rates)
+            return _parse_funding_rate(orjson.loads(response.content))
         return None
     except Exception as e:
         logger.error(f"[CoinGlass] Funding rate request failed: {e}")
@@ -154,21 +261,10 @@ def get_coinglass_liquidations(symbol: str = "BTC") -> Optional[Dict]:
     Высокие ликвидации = волатильность
     """
     try:
-        url = "https://fapi.coinglass.com/api/futures/liquidation/chart"
-        params = {"symbol": symbol, "interval": "h1"}
-        response = requests.get(url, params=params, timeout=10)
+        response = _SESSION.get(COINGLASS_LIQUIDATIONS_URL, params={"symbol": symbol, "interval": "h1"}, timeout=10)
         
         if response.status_code == 200:
-            data = response.json()
-            if data.get("success") and "data" in data:
-                liq_data = data["data"]
-                total_longs = sum(float(item.get("longLiquidationValue", 0)) for item in liq_data)
-                total_shorts = sum(float(item.get("shortLiquidationValue", 0)) for item in liq_data)
-                return {
-                    "total_liquidations_usd": total_longs + total_shorts,
-                    "long_liquidations_usd": total_longs,
-                    "short_liquidations_usd": total_shorts,
-                }
+            return _parse_liquidations(orjson.loads(response.content))
         return None
     except Exception as e:
         logger.error(f"[CoinGlass] Liquidations request failed: {e}")
@@ -179,94 +275,155 @@ def get_coinglass_liquidations(symbol: str = "BTC") -> Optional[Dict]:
 # Helper: Get all metrics as features
 # ====================
 
-def get_onchain_features(asset: str = "BTC") -> Dict[str, float]:
+def _fetch_onchain_raw(asset: str, coin_id: str) -> tuple:
+    """(market_data, btc_stats, funding_rate, liquidations) — запросы параллельно в пуле потоков."""
+    # Провайдеры независимы — ожидание ≈ самый медленный, а не сумма.
+    # Лимит CoinGecko соблюдает сам _coingecko_get.
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        f_market = pool.submit(get_coingecko_market_data, coin_id)
+        f_btc = pool.submit(get_btc_blockchain_stats) if asset == "BTC" else None
+        f_funding = pool.submit(get_coinglass_funding_rate, asset)
+        f_liq = pool.submit(get_coinglass_liquidations, asset)
+        return (
+            f_market.result(),
+            f_btc.result() if f_btc is not None else None,
+            f_funding.result(),
+            f_liq.result(),
+        )
+
+
+def _cache_ttl(asset: str, raw: tuple) -> int:
+    """TTL записи: полный — только если ответили все провайдеры, нужные для asset."""
+    market, btc, funding, liq = raw
+    expected = (market, funding, liq, btc) if asset == "BTC" else (market, funding, liq)
+    if any(part is None for part in expected):
+        return ONCHAIN_PARTIAL_CACHE_TTL
+    return ONCHAIN_CACHE_TTL
+
+
+def _cache_get(asset: str) -> Optional[tuple]:
+    now = time.time()
+    hit = _MEM_CACHE.get(asset)
+    if hit is not None and now - hit[0] < _cache_ttl(asset, hit[1]):
+        return hit[1]
+    path = ONCHAIN_CACHE_DIR / f"onchain_{asset}.json"
+    try:
+        mtime = os.stat(path).st_mtime
+        if now - mtime >= ONCHAIN_CACHE_TTL:
+            return None
+        raw = tuple(orjson.loads(path.read_bytes()))
+        if len(raw) != 4 or now - mtime >= _cache_ttl(asset, raw):
+            return None
+    except (OSError, ValueError):
+        return None
+    _MEM_CACHE[asset] = (mtime, raw)
+    return raw
+
+
+def _cache_put(asset: str, raw: tuple) -> None:
+    if all(part is None for part in raw):
+        # полный отказ всех провайдеров не кэшируем — следующий вызов снова попробует сеть
+        return
+    _MEM_CACHE[asset] = (time.time(), raw)
+    try:
+        ONCHAIN_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = ONCHAIN_CACHE_DIR / f"onchain_{asset}.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_bytes(orjson.dumps(raw))
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[OnChain] Failed to write cache: {e}")
+
+
+# Источник -> фичи: (имя фичи, ключ в ответе, делитель; None — как есть).
+# Если источник недоступен, все его фичи = 0.0.
+_MARKET_FEATURES = (
+    ("onchain_market_cap", "market_cap_usd", 1e9),  # В миллиардах
+    ("onchain_volume_24h", "total_volume_usd", 1e9),
+    ("onchain_circulating_supply", "circulating_supply", 1e6),  # В миллионах
+    ("onchain_price_change_24h", "price_change_24h_pct", None),
+    ("onchain_price_change_7d", "price_change_7d_pct", None),
+    ("onchain_price_change_30d", "price_change_30d_pct", None),
+)
+_BTC_FEATURES = (
+    ("onchain_hash_rate", "hash_rate", 1e18),  # В EH/s
+    ("onchain_difficulty", "difficulty", 1e12),  # В триллионах
+    ("onchain_tx_count_24h", "n_tx", 1000),  # В тысячах
+)
+_LIQUIDATION_FEATURES = (
+    ("onchain_liquidations_24h", "total_liquidations_usd", 1e6),  # В миллионах
+    ("onchain_long_liquidations", "long_liquidations_usd", 1e6),
+    ("onchain_short_liquidations", "short_liquidations_usd", 1e6),
+)
+
+
+# заглушки (все 0.0) для каждой таблицы — собраны один раз, при отказе источника просто update()
+_PLACEHOLDERS = {
+    spec: dict.fromkeys((name for name, _key, _div in spec), 0.0)
+    for spec in (_MARKET_FEATURES, _BTC_FEATURES, _LIQUIDATION_FEATURES)
+}
+
+
+def _put_features(features: Dict[str, float], data: Optional[Dict], spec: tuple) -> None:
+    if data:
+        for name, key, div in spec:
+            features[name] = data[key] / div if div is not None else data[key]
+    else:
+        features.update(_PLACEHOLDERS[spec])
+
+
+def _assemble_features(
+    market_data: Optional[Dict], btc_stats: Optional[Dict], funding_rate: Optional[float], liquidations: Optional[Dict]
+) -> Dict[str, float]:
+    features: Dict[str, float] = {}
+
+    # 1. CoinGecko Market Data (всегда доступно!)
+    if not market_data:
+        logger.warning("[OnChain] Failed to fetch CoinGecko data, using defaults")
+    _put_features(features, market_data, _MARKET_FEATURES)
+
+    # 2. Blockchain.info (только для BTC; для других монет / при ошибке — заглушки)
+    _put_features(features, btc_stats, _BTC_FEATURES)
+
+    # 3. CoinGlass Derivatives Data (для всех)
+    features["onchain_funding_rate"] = funding_rate * 100 if funding_rate is not None else 0.0  # В процентах
+    _put_features(features, liquidations, _LIQUIDATION_FEATURES)
+
+    return features
+
+
+def get_onchain_features(asset: str = "BTC", force_refresh: bool = False) -> Dict[str, float]:
     """
     Получить все on-chain метрики как словарь фич (БЕСПЛАТНЫЕ API!)
     
+    Ответы провайдеров кэшируются на ONCHAIN_CACHE_TTL (память + диск);
+    если часть провайдеров отказала — только на ONCHAIN_PARTIAL_CACHE_TTL.
+    force_refresh=True — всегда идти в сеть.
+    
     Returns:
         Dict с ключами вида "onchain_{metric_name}"
     """
-    features = {}
-    
-    # Маппинг coin_id для CoinGecko
-    coin_id_map = {
-        "BTC": "bitcoin",
-        "ETH": "ethereum",
-        "SOL": "solana",
-        "USDT": "tether",
-        "BNB": "binancecoin",
-    }
-    coin_id = coin_id_map.get(asset, "bitcoin")
-    
-    # 1. CoinGecko Market Data (всегда доступно!)
-    logger.info(f"[OnChain] Fetching CoinGecko data for {coin_id}...")
-    market_data = get_coingecko_market_data(coin_id)
-    if market_data:
-        features["onchain_market_cap"] = market_data["market_cap_usd"] / 1e9  # В миллиардах
-        features["onchain_volume_24h"] = market_data["total_volume_usd"] / 1e9
-        features["onchain_circulating_supply"] = market_data["circulating_supply"] / 1e6  # В миллионах
-        features["onchain_price_change_24h"] = market_data["price_change_24h_pct"]
-        features["onchain_price_change_7d"] = market_data["price_change_7d_pct"]
-        features["onchain_price_change_30d"] = market_data["price_change_30d_pct"]
-    else:
-        logger.warning("[OnChain] Failed to fetch CoinGecko data, using defaults")
-        features.update({
-            "onchain_market_cap": 0.0,
-            "onchain_volume_24h": 0.0,
-            "onchain_circulating_supply": 0.0,
-            "onchain_price_change_24h": 0.0,
-            "onchain_price_change_7d": 0.0,
-            "onchain_price_change_30d": 0.0,
-        })
-    
-    _rate_limit_sleep()  # Rate limiting
-    
-    # 2. Blockchain.info (только для BTC)
-    if asset == "BTC":
-        logger.info("[OnChain] Fetching Blockchain.info data...")
-        btc_stats = get_btc_blockchain_stats()
-        if btc_stats:
-            features["onchain_hash_rate"] = btc_stats["hash_rate"] / 1e18  # В EH/s
-            features["onchain_difficulty"] = btc_stats["difficulty"] / 1e12  # В триллионах
-            features["onchain_tx_count_24h"] = btc_stats["n_tx"] / 1000  # В тысячах
-        else:
-            features.update({
-                "onchain_hash_rate": 0.0,
-                "onchain_difficulty": 0.0,
-                "onchain_tx_count_24h": 0.0,
-            })
-    else:
-        # Заглушки для других монет
-        features.update({
-            "onchain_hash_rate": 0.0,
-            "onchain_difficulty": 0.0,
-            "onchain_tx_count_24h": 0.0,
-        })
-    
-    _rate_limit_sleep()
-    
-    # 3. CoinGlass Derivatives Data (для всех)
-    logger.info(f"[OnChain] Fetching CoinGlass data for {asset}...")
-    funding_rate = get_coinglass_funding_rate(asset)
-    if funding_rate is not None:
-        features["onchain_funding_rate"] = funding_rate * 100  # В процентах
-    else:
-        features["onchain_funding_rate"] = 0.0
-    
-    _rate_limit_sleep()
-    
-    liquidations = get_coinglass_liquidations(asset)
-    if liquidations:
-        features["onchain_liquidations_24h"] = liquidations["total_liquidations_usd"] / 1e6  # В миллионах
-        features["onchain_long_liquidations"] = liquidations["long_liquidations_usd"] / 1e6
-        features["onchain_short_liquidations"] = liquidations["short_liquidations_usd"] / 1e6
-    else:
-        features.update({
-            "onchain_liquidations_24h": 0.0,
-            "onchain_long_liquidations": 0.0,
-            "onchain_short_liquidations": 0.0,
-        })
-    
+    raw = None if force_refresh else _cache_get(asset)
+    if raw is not None:
+        return _assemble_features(*raw)
+
+    coin_id = COIN_ID_MAP.get(asset, "bitcoin")
+    logger.info(f"[OnChain] Fetching CoinGecko ({coin_id}), Blockchain.info, CoinGlass ({asset})...")
+
+    if ONCHAIN_ASYNC:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # вне event loop — можно крутить свой; внутри (async-эндпоинт) — пул потоков ниже
+            from .onchain_async import fetch_onchain_raw_async
+
+            raw = asyncio.run(fetch_onchain_raw_async(asset, coin_id))
+    if raw is None:
+        raw = _fetch_onchain_raw(asset, coin_id)
+    # частичный ответ живёт ONCHAIN_PARTIAL_CACHE_TTL (см. _cache_ttl)
+    _cache_put(asset, raw)
+
+    features = _assemble_features(*raw)
     logger.info(f"[OnChain] Successfully fetched {len(features)} on-chain features")
     return features
 
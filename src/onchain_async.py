@@ -0,0 +1,148 @@
+"""
+Асинхронный вариант on-chain загрузки (httpx.AsyncClient):
+все провайдеры опрашиваются в одном event loop, без потока на запрос.
+Разбор ответов и сборка фич — общие с src/onchain.py.
+Включается через ONCHAIN_ASYNC=1 (см. get_onchain_features) или напрямую из async-кода.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import weakref
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import orjson
+
+from .onchain import (
+    BLOCKCHAIN_INFO_BASE,
+    BTC_STATS_ENDPOINT,
+    COIN_ID_MAP,
+    COINGECKO_BASE,
+    COINGECKO_COIN_PARAMS,
+    COINGLASS_FUNDING_URL,
+    COINGLASS_LIQUIDATIONS_URL,
+    ONCHAIN_HEADERS,
+    _COINGECKO_BUCKET,
+    _assemble_features,
+    _cache_get,
+    _cache_put,
+    _parse_btc_stats,
+    _parse_funding_rate,
+    _parse_liquidations,
+    _parse_market_data,
+)
+
+logger = logging.getLogger(__name__)
+
+_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=8)
+# Клиент привязан к event loop, поэтому он живёт один вызов (asyncio.run создаёт новый loop);
+# внутри вызова все запросы к одному хосту идут через общий пул соединений.
+# retries — повтор только при ошибке установки соединения
+_RETRIES = 3
+
+# Одновременных запросов на хост (остальные хосты при этом не ждут)
+HOST_CONCURRENCY = {
+    "api.coingecko.com": 5,
+    "blockchain.info": 2,
+    "fapi.coinglass.com": 3,
+}
+_DEFAULT_HOST_CONCURRENCY = 4
+# asyncio.Semaphore привязан к event loop — свой набор на каждый loop
+_HOST_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _host_semaphore(host: str) -> asyncio.Semaphore:
+    per_loop = _HOST_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    sem = per_loop.get(host)
+    if sem is None:
+        sem = per_loop[host] = asyncio.Semaphore(HOST_CONCURRENCY.get(host, _DEFAULT_HOST_CONCURRENCY))
+    return sem
+
+
+async def _get_json(
+    client: httpx.AsyncClient, provider: str, url: str, params: Optional[Dict] = None, timeout: float = 15
+) -> Optional[Dict]:
+    host = urlsplit(url).hostname or ""
+    try:
+        if host == "api.coingecko.com":
+            # общий с синхронным путём лимит 50 req/min; ожидание — без блокировки event loop
+            wait = _COINGECKO_BUCKET.reserve(1)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        async with _host_semaphore(host):
+            response = await client.get(url, params=params, timeout=timeout)
+        if response.status_code == 200:
+            return orjson.loads(response.content)
+        if response.status_code == 429:
+            # не ждём минуту, как синхронный путь, — просто без данных
+            logger.warning(f"[{provider}] Rate limit hit")
+        else:
+            logger.error(f"[{provider}] Error {response.status_code}")
+        return None
+    except Exception as e:
+        logger.error(f"[{provider}] Request failed: {e}")
+        return None
+
+
+async def _none() -> None:
+    return None
+
+
+def _ok(result):
+    """Исключение из gather(return_exceptions=True) -> None, как у упавшего провайдера."""
+    if isinstance(result, BaseException):
+        logger.error(f"[ONCHAIN] Provider task failed: {result}")
+        return None
+    return result
+
+
+def _parse(parser, provider: str, data: Optional[Dict]):
+    """Битый/неполный ответ провайдера -> None, как в синхронных get_* из src/onchain.py."""
+    try:
+        return parser(data)
+    except Exception as e:
+        logger.error(f"[{provider}] Failed to parse response: {e}")
+        return None
+
+
+async def fetch_onchain_raw_async(asset: str, coin_id: str) -> tuple:
+    """(market_data, btc_stats, funding_rate, liquidations) — все запросы одним asyncio.gather.
+
+    return_exceptions=True: сбой одного провайдера не отменяет остальные запросы.
+    """
+    async with httpx.AsyncClient(
+        limits=_LIMITS,
+        headers=ONCHAIN_HEADERS,
+        transport=httpx.AsyncHTTPTransport(limits=_LIMITS, retries=_RETRIES),
+    ) as client:
+        results = await asyncio.gather(
+            _get_json(client, "CoinGecko", f"{COINGECKO_BASE}/coins/{coin_id}", COINGECKO_COIN_PARAMS),
+            _get_json(client, "Blockchain.info", f"{BLOCKCHAIN_INFO_BASE}/{BTC_STATS_ENDPOINT}")
+            if asset == "BTC"
+            else _none(),
+            _get_json(client, "CoinGlass", COINGLASS_FUNDING_URL, {"symbol": asset}, timeout=10),
+            _get_json(client, "CoinGlass", COINGLASS_LIQUIDATIONS_URL, {"symbol": asset, "interval": "h1"}, timeout=10),
+            return_exceptions=True,
+        )
+    market, btc, funding, liq = (_ok(r) for r in results)
+    return (
+        _parse(_parse_market_data, "CoinGecko", market),
+        _parse(_parse_btc_stats, "Blockchain.info", btc),
+        _parse(_parse_funding_rate, "CoinGlass", funding),
+        _parse(_parse_liquidations, "CoinGlass", liq),
+    )
+
+
+async def get_onchain_features_async(asset: str = "BTC", force_refresh: bool = False) -> Dict[str, float]:
+    """
+    Async-аналог get_onchain_features для вызова из event loop (например, async-эндпоинтов).
+    Кэш ответов провайдеров — общий с синхронным путём (ONCHAIN_CACHE_TTL).
+    """
+    raw = None if force_refresh else _cache_get(asset)
+    if raw is None:
+        raw = await fetch_onchain_raw_async(asset, COIN_ID_MAP.get(asset, "bitcoin"))
+        _cache_put(asset, raw)
+    return _assemble_features(*raw)
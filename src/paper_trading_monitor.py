@@ -10,41 +10,95 @@ Real-time Paper Trading Monitor
 """
 
 from __future__ import annotations
+import copy
 import logging
-import json
+import os
+import time
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Dict, List
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import numpy as np
+import orjson
 import pandas as pd
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from .db import SessionLocal, Price
-from .prices import fetch_and_store_prices
+from .prices import fetch_price_rows, store_price_rows
 from .features import build_dataset
-from .modeling import load_latest_model
+from .modeling import load_latest_model, predict_positive_proba
 from .trade import paper_get_equity, paper_get_positions
 from .risk import load_policy
-from .notify import send_telegram
+from .notify import enqueue_telegram
 from .simple_strategies import ema_crossover_strategy, ema_crossover_advanced_strategy
+from .utils import _tf_minutes
 
 logger = logging.getLogger(__name__)
 
-# Путь к файлу истории equity
-EQUITY_HISTORY_PATH = Path("artifacts/equity_history_realtime.json")
+# Путь к файлу истории equity: JSONL, один снимок на строку (дописывается в конец)
+EQUITY_HISTORY_PATH = Path("artifacts/equity_history_realtime.jsonl")
 EQUITY_HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+# Прежний формат (JSON-массив) — переносится в JSONL при первом обращении
+LEGACY_EQUITY_HISTORY_PATH = Path("artifacts/equity_history_realtime.json")
+
+# Храним последние 30 дней (30*24*4 = 2880 снимков при обновлении каждые 15 минут);
+# файл обрезается до MAX_EQUITY_SNAPSHOTS, когда перерастает его на EQUITY_ROTATE_SLACK строк
+MAX_EQUITY_SNAPSHOTS = 2880
+EQUITY_ROTATE_SLACK = 96
+_history_lines: Optional[int] = None  # строк в файле истории (None — ещё не считали)
+# Разобранная история: key = (путь, mtime_ns, size) файла, data — список снимков.
+# Пишет историю только цикл монитора: дописанный им снимок добавляется в кэш без перечитывания
+_HISTORY_CACHE: Dict = {"key": None, "data": None}
+
+# orjson: numpy-скаляры из pandas сериализуются как обычные числа; в JSONL — с переводом строки
+_JSON_OPTS = orjson.OPT_SERIALIZE_NUMPY
+_JSONL_OPTS = _JSON_OPTS | orjson.OPT_APPEND_NEWLINE
 
 # Путь к файлу состояния монитора
 MONITOR_STATE_PATH = Path("artifacts/state/paper_monitor.json")
 MONITOR_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+# Разобранное состояние: key = (mtime_ns, size) файла, data — dict (отдаётся копией)
+_STATE_CACHE: Dict = {"key": None, "data": None}
+
+# get_monitor_status опрашивается дашбордом: equity и число позиций paper-счёта
+# кэшируются на PAPER_STATUS_TTL секунд (цикл монитора сбрасывает кэш сам)
+PAPER_STATUS_TTL = 3.0
+_PAPER_STATUS_CACHE: Dict = {"at": 0.0, "data": None}
+
+
+def _state_file_key() -> Optional[tuple]:
+    """(mtime_ns, size) файла состояния или None, если файла нет."""
+    try:
+        st = os.stat(MONITOR_STATE_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _history_file_key() -> Optional[tuple]:
+    """(путь, mtime_ns, size) файла истории или None, если файла нет."""
+    try:
+        st = os.stat(EQUITY_HISTORY_PATH)
+    except OSError:
+        return None
+    return (str(EQUITY_HISTORY_PATH), st.st_mtime_ns, st.st_size)
 
 
 def load_monitor_state() -> Dict:
-    """Загружает состояние монитора"""
-    if MONITOR_STATE_PATH.exists():
-        try:
-            return json.loads(MONITOR_STATE_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            pass
+    """Загружает состояние монитора (разбор JSON — только при смене файла)"""
+    key = _state_file_key()
+    if key is not None:
+        if _STATE_CACHE["key"] != key:
+            try:
+                _STATE_CACHE["data"] = orjson.loads(MONITOR_STATE_PATH.read_bytes())
+                _STATE_CACHE["key"] = key
+            except Exception:
+                _STATE_CACHE["key"] = None
+        if _STATE_CACHE["key"] == key:
+            # копия: вызывающие меняют состояние (stats, enabled) перед save_monitor_state
+            return copy.deepcopy(_STATE_CACHE["data"])
     
     return {
         "enabled": False,
@@ -66,64 +120,351 @@ def load_monitor_state() -> Dict:
     }
 
 
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Запись через временный файл + os.replace: при падении процесса файл либо старый, либо новый."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
 def save_monitor_state(state: Dict) -> None:
     """Сохраняет состояние монитора"""
     state["updated_at"] = datetime.utcnow().isoformat()
-    MONITOR_STATE_PATH.write_text(
-        json.dumps(state, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    _atomic_write_bytes(MONITOR_STATE_PATH, orjson.dumps(state, option=_JSON_OPTS | orjson.OPT_INDENT_2))
+    # Только что записанное состояние сразу кладём в кэш — следующий load без разбора
+    _STATE_CACHE["data"] = copy.deepcopy(state)
+    _STATE_CACHE["key"] = _state_file_key()
+
+
+def _migrate_legacy_equity_history() -> None:
+    """Однократно переносит историю из JSON-массива в JSONL."""
+    if EQUITY_HISTORY_PATH.exists() or not LEGACY_EQUITY_HISTORY_PATH.exists():
+        return
+    try:
+        history = orjson.loads(LEGACY_EQUITY_HISTORY_PATH.read_bytes())
+        _write_equity_history(history[-MAX_EQUITY_SNAPSHOTS:])
+        LEGACY_EQUITY_HISTORY_PATH.unlink()
+        logger.info(f"[MONITOR] Migrated {len(history)} equity snapshots to {EQUITY_HISTORY_PATH}")
+    except Exception as e:
+        logger.warning(f"[MONITOR] Failed to migrate legacy equity history: {e}")
+
+
+def _write_equity_history(history: List[Dict]) -> None:
+    """Полностью перезаписывает файл истории (миграция, ротация, очистка); новые снимки дописываются."""
+    global _history_lines
+    _atomic_write_bytes(EQUITY_HISTORY_PATH, b"".join(orjson.dumps(h, option=_JSONL_OPTS) for h in history))
+    _history_lines = len(history)
+    _HISTORY_CACHE["data"] = list(history)
+    _HISTORY_CACHE["key"] = _history_file_key()
 
 
 def load_equity_history() -> List[Dict]:
-    """Загружает историю equity"""
-    if EQUITY_HISTORY_PATH.exists():
-        try:
-            return json.loads(EQUITY_HISTORY_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            pass
-    return []
+    """
+    Загружает историю equity (последние MAX_EQUITY_SNAPSHOTS снимков).
+    Файл разбирается только при смене (mtime, size); снимки общие с кэшем — не изменять.
+    """
+    _migrate_legacy_equity_history()
+    key = _history_file_key()
+    if key is None:
+        return []
+    if _HISTORY_CACHE["key"] == key:
+        return _HISTORY_CACHE["data"][-MAX_EQUITY_SNAPSHOTS:]
+    
+    history = []
+    try:
+        with EQUITY_HISTORY_PATH.open("rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    history.append(orjson.loads(line))
+                except ValueError:
+                    # Недописанная строка (процесс убит во время записи) — пропускаем
+                    continue
+    except OSError:
+        return []
+    history = history[-MAX_EQUITY_SNAPSHOTS:]
+    _HISTORY_CACHE["data"] = history
+    _HISTORY_CACHE["key"] = key
+    return list(history)
+
+
+def _utc_ms(dt: datetime) -> int:
+    """Наивный UTC datetime (как datetime.utcnow()) -> миллисекунды Unix."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _snapshot_ts_ms(snapshot: Dict) -> int:
+    """ts_ms снимка; у старых записей без него — из ISO timestamp (и запоминается в снимке)."""
+    ts_ms = snapshot.get("ts_ms")
+    if ts_ms is None:
+        ts_ms = snapshot["ts_ms"] = _utc_ms(datetime.fromisoformat(snapshot["timestamp"]))
+    return ts_ms
+
+
+def equity_history_since(history: List[Dict], cutoff: datetime) -> List[Dict]:
+    """
+    Снимки не старше cutoff (наивный UTC).
+
+    История пишется в хронологическом порядке, поэтому граница ищется
+    бинарным поиском по ts_ms — без разбора ISO-строки у каждого снимка.
+    """
+    start = bisect_left(history, _utc_ms(cutoff), key=_snapshot_ts_ms)
+    return history[start:]
+
+
+def rotate_equity_history() -> None:
+    """Обрезает файл истории до последних MAX_EQUITY_SNAPSHOTS снимков."""
+    _write_equity_history(load_equity_history())
+
+
+def clear_equity_history() -> None:
+    """Очищает историю equity."""
+    _write_equity_history([])
+    LEGACY_EQUITY_HISTORY_PATH.unlink(missing_ok=True)
 
 
 def save_equity_snapshot(equity_data: Dict) -> None:
-    """Сохраняет снимок equity в историю"""
-    history = load_equity_history()
+    """Дописывает снимок equity в конец истории (без чтения и перезаписи всего файла)"""
+    global _history_lines
+    _migrate_legacy_equity_history()
     
-    # Добавляем timestamp
+    # Добавляем timestamp (ISO для API/графиков, ts_ms — для бинарного поиска по истории).
+    # Время записи, а не начала цикла: ручной /update может идти параллельно плановому,
+    # а equity_history_since требует хронологического порядка строк
+    now = datetime.utcnow()
     snapshot = {
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now.isoformat(),
+        "ts_ms": _utc_ms(now),
         **equity_data
     }
     
-    history.append(snapshot)
+    if _history_lines is None:
+        try:
+            with EQUITY_HISTORY_PATH.open("rb") as f:
+                _history_lines = sum(1 for _ in f)
+        except OSError:
+            _history_lines = 0
     
-    # Храним последние 30 дней (30*24*4 = 2880 снимков при обновлении каждые 15 минут)
-    max_snapshots = 2880
-    if len(history) > max_snapshots:
-        history = history[-max_snapshots:]
+    prev_key = _history_file_key()
+    with EQUITY_HISTORY_PATH.open("ab") as f:
+        f.write(orjson.dumps(snapshot, option=_JSONL_OPTS))
+    _history_lines += 1
     
-    EQUITY_HISTORY_PATH.write_text(
-        json.dumps(history, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    # Кэш был актуален до записи — дописываем снимок в него, иначе следующий load перечитает файл
+    if prev_key is not None and _HISTORY_CACHE["key"] == prev_key:
+        cached = _HISTORY_CACHE["data"]
+        cached.append(snapshot)
+        if len(cached) > MAX_EQUITY_SNAPSHOTS + EQUITY_ROTATE_SLACK:
+            del cached[:-MAX_EQUITY_SNAPSHOTS]
+        _HISTORY_CACHE["key"] = _history_file_key()
+    else:
+        _HISTORY_CACHE["key"] = None
+    
+    # Ротация раз в EQUITY_ROTATE_SLACK снимков, а не на каждой записи
+    if _history_lines > MAX_EQUITY_SNAPSHOTS + EQUITY_ROTATE_SLACK:
+        rotate_equity_history()
     
     logger.info(f"[MONITOR] Saved equity snapshot: ${equity_data.get('equity', 0):.2f}")
 
 
-def update_prices_for_symbols(symbols: List[str], exchange: str, timeframe: str) -> bool:
-    """Обновляет цены для всех символов"""
+# Параллельных HTTP-запросов свечей за цикл (запись в БД — в основном потоке, одной сессией)
+PRICE_FETCH_WORKERS = 8
+
+
+def update_prices_for_symbols(
+    symbols: List[str],
+    exchange: str,
+    timeframe: str,
+    db: Session | None = None
+) -> bool:
+    """
+    Обновляет цены для всех символов (на переданной сессии db или на своей).
+    Запросы к бирже идут пулом потоков; свечи каждого символа пишутся в БД, как только пришли,
+    пока остальные ещё загружаются. Ошибка по одному символу не останавливает остальные.
+    """
+    if not symbols:
+        return True
+    own_db = db is None
+    failed = 0
     try:
-        db = SessionLocal()
-        try:
-            for symbol in symbols:
-                logger.info(f"[MONITOR] Updating prices for {symbol}...")
-                fetch_and_store_prices(db, exchange, symbol, timeframe, limit=100)
-            return True
-        finally:
-            db.close()
+        if own_db:
+            db = SessionLocal()
+        with ThreadPoolExecutor(max_workers=min(len(symbols), PRICE_FETCH_WORKERS)) as pool:
+            futures = {
+                pool.submit(fetch_price_rows, exchange, symbol, timeframe, 100): symbol for symbol in symbols
+            }
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    store_price_rows(db, exchange, symbol, timeframe, future.result())
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"[MONITOR] Error updating prices for {symbol}: {e}")
+                    # сессия дальше используется циклом монитора — снимаем прерванную транзакцию
+                    db.rollback()
+        logger.info(f"[MONITOR] Prices updated for {len(symbols) - failed}/{len(symbols)} symbols")
+        return failed == 0
     except Exception as e:
         logger.error(f"[MONITOR] Error updating prices: {e}")
+        if db is not None:
+            try:
+                db.rollback()
+            except Exception:
+                pass
         return False
+    finally:
+        if own_db and db is not None:
+            db.close()
+
+
+# Окно свечей для EMA-сигналов и минимум, без которого символ пропускается
+EMA_LOOKBACK_BARS = 100
+EMA_MIN_BARS = 50
+# Потоков на расчёт EMA-сигналов (при 2+ символах к расчёту); свечи уже загружены одним
+# запросом, а numba-ядра индикаторов отпускают GIL
+EMA_SIGNAL_MAX_WORKERS = 8
+# Нижняя граница ts в запросе свечей: EMA_LOOKBACK_BARS * запас таймфреймов назад от текущего
+# момента (запас — на пропуски свечей); более старые данные для real-time сигналов не нужны
+EMA_CUTOFF_SLACK = 2
+_OHLCV_COLUMNS = ["close", "open", "high", "low", "volume"]
+
+
+def _load_price_frames(
+    db: Session,
+    exchange: str,
+    symbols: List[str],
+    timeframe: str,
+    bars: int = EMA_LOOKBACK_BARS
+) -> Dict[str, pd.DataFrame]:
+    """
+    Последние bars свечей по всем символам одним запросом.
+
+    row_number() по каждому символу (ts по убыванию) отбирает хвост в БД,
+    вместо N отдельных SELECT ... LIMIT. Условие ts >= cutoff ограничивает
+    его диапазоном индекса uq_price_row (exchange, symbol, timeframe, ts),
+    а не всей историей символа. Кадры — по возрастанию времени,
+    индекс timestamp (UTC), символы без данных в словарь не попадают.
+    """
+    bar_ms = _tf_minutes(timeframe) * 60_000
+    cutoff_ms = int(time.time() * 1000) - bars * EMA_CUTOFF_SLACK * bar_ms
+    rn = func.row_number().over(partition_by=Price.symbol, order_by=Price.ts.desc()).label("rn")
+    recent = db.query(
+        Price.symbol, Price.ts, Price.close, Price.open, Price.high, Price.low, Price.volume, rn
+    ).filter(
+        Price.exchange == exchange,
+        Price.symbol.in_(symbols),
+        Price.timeframe == timeframe,
+        Price.ts >= cutoff_ms
+    ).subquery()
+    
+    rows = db.query(
+        recent.c.symbol, recent.c.ts, recent.c.close, recent.c.open, recent.c.high, recent.c.low, recent.c.volume
+    ).filter(recent.c.rn <= bars).order_by(recent.c.symbol, recent.c.ts.asc()).all()
+    
+    n = len(rows)
+    if not n:
+        return {}
+    
+    # Колонки собираются сразу в numpy (без dict на строку и повторного вывода dtype);
+    # строки отсортированы по символу, поэтому кадр символа — срез [start:end]
+    ts = np.fromiter((r[1] for r in rows), dtype=np.int64, count=n)
+    values = np.array([r[2:] for r in rows], dtype=np.float64)
+    index = pd.DatetimeIndex(pd.to_datetime(ts, unit="ms", utc=True), name="timestamp")
+    
+    frames = {}
+    start = 0
+    for i in range(1, n + 1):
+        if i == n or rows[i][0] != rows[start][0]:
+            frames[rows[start][0]] = pd.DataFrame(
+                values[start:i], index=index[start:i], columns=_OHLCV_COLUMNS
+            )
+            start = i
+    return frames
+
+
+def _ema_signal_for_symbol(
+    symbol: str,
+    df: pd.DataFrame,
+    exchange: str,
+    timeframe: str,
+    use_advanced: bool,
+    strategy_name: str
+) -> Optional[Dict]:
+    """EMA-сигнал по свечам одного символа (BUY или None); ошибки — вызывающему."""
+    # Генерируем сигналы (простая или улучшенная стратегия)
+    if use_advanced:
+        ema_signals, indicators = ema_crossover_advanced_strategy(
+            df, 
+            fast_period=12, 
+            slow_period=26,
+            rsi_period=14,
+            rsi_overbought=70,
+            rsi_oversold=30,
+            volume_threshold=1.2,
+            atr_period=14
+        )
+    else:
+        ema_signals = ema_crossover_strategy(df, fast_period=9, slow_period=21)
+    
+    # Последний сигнал — прямой доступ к numpy-массиву, без iloc
+    latest_signal = int(ema_signals.to_numpy()[-1])
+    
+    # Только BUY сигналы
+    if latest_signal != 1:
+        return None
+
+    current_price = float(df['close'].to_numpy()[-1])
+    timestamp = df.index[-1]
+    if use_advanced:
+        # Адаптивные уровни Stop-Loss/Take-Profit последней свечи
+        stop_loss_pct = indicators['stop_loss_pct'].to_numpy()[-1]
+        take_profit_pct = indicators['take_profit_pct'].to_numpy()[-1]
+        rsi_value = indicators['rsi'].to_numpy()[-1]
+        volume_ratio = indicators['volume_ratio'].to_numpy()[-1]
+    else:
+        stop_loss_pct = 2.0  # Фиксированный 2%
+        take_profit_pct = 5.0  # Фиксированный 5%
+        rsi_value = None
+        volume_ratio = None
+
+    signal_data = {
+        "exchange": exchange,
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "signal": "BUY",
+        "price": current_price,
+        "timestamp": str(timestamp),
+        "probability": 0.85,  # Фиксированная "вероятность" для совместимости
+        "strategy": strategy_name,
+        "vol_state": "normal",
+        "stop_loss_pct": float(stop_loss_pct),
+        "take_profit_pct": float(take_profit_pct),
+        "rsi": float(rsi_value) if rsi_value is not None else None,
+        "volume_ratio": float(volume_ratio) if volume_ratio is not None else None
+    }
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        if use_advanced:
+            logger.debug(
+                "[MONITOR EMA] BUY signal for %s @ $%.4f (RSI: %.1f, Vol: %.2fx, SL: %.2f%%, TP: %.2f%%)",
+                symbol, current_price, rsi_value, volume_ratio, stop_loss_pct, take_profit_pct
+            )
+        else:
+            logger.debug("[MONITOR EMA] BUY signal for %s @ $%.4f", symbol, current_price)
+    
+    return signal_data
+
+
+def _bar_fingerprint(ts_ms: int, close: float, volume: float) -> list:
+    """
+    [ts_ms, close, volume] последней свечи. Незакрытая свеча перезаписывается при каждом
+    обновлении цен (upsert), поэтому одного ts мало: меняются close/volume — меняется и отпечаток.
+    Список, а не tuple: значение хранится в JSON-состоянии и сравнивается после загрузки.
+    """
+    return [int(ts_ms), float(close), float(volume)]
 
 
 def generate_ema_signals_for_symbols(
@@ -131,7 +472,9 @@ def generate_ema_signals_for_symbols(
     exchange: str,
     timeframe: str,
     db: Session,
-    use_advanced: bool = True
+    use_advanced: bool = True,
+    last_bars: Optional[Dict[str, list]] = None,
+    signaled_bars: Optional[Dict[str, int]] = None
 ) -> List[Dict]:
     """
     Генерирует сигналы EMA Crossover для всех символов
@@ -140,111 +483,83 @@ def generate_ema_signals_for_symbols(
     1. SIMPLE (9/21) - базовая стратегия
     2. ADVANCED (12/26) - с RSI/Volume/ATR фильтрами (рекомендуется!)
     
+    Свечи всех символов загружаются одним запросом (_load_price_frames), сигналы
+    по символам считаются в пуле из EMA_SIGNAL_MAX_WORKERS потоков.
+    Порядок сигналов совпадает с порядком symbols.
+    
     Args:
         use_advanced: Использовать улучшенную стратегию (по умолчанию True)
+        last_bars: {"exchange:symbol:timeframe": _bar_fingerprint последней обработанной свечи}.
+            Символ пропускается, только если последняя свеча не изменилась вовсе
+            (ни новой свечи, ни нового close/volume у незакрытой); обновляется на месте
+        signaled_bars: {"exchange:symbol:timeframe": ts_ms свечи, по которой уже выдан BUY}.
+            Повторный BUY по той же свече не выдаётся; обновляется на месте
     """
-    signals = []
-    
     try:
-        strategy_name = "EMA Crossover Advanced (12/26 + RSI/Vol/ATR)" if use_advanced else "EMA Crossover Simple (9/21)"
-        logger.info(f"[MONITOR EMA] Generating {strategy_name} signals for {len(symbols)} symbols")
+        strategy_name = (
+            "EMA Crossover Advanced (12/26 + RSI/Vol/ATR)" if use_advanced else "EMA Crossover Simple (9/21)"
+        )
+        frames = _load_price_frames(db, exchange, symbols, timeframe) if symbols else {}
         
+        # По символам — только debug; итог одной строкой после цикла
+        debug = logger.isEnabledFor(logging.DEBUG)
+        skipped = unchanged = repeated = errors = 0
+        pending = []  # (symbol, df, bar_key, bar) — свечи, которые надо пересчитать
         for symbol in symbols:
+            df = frames.get(symbol)
+            if df is None or len(df) < EMA_MIN_BARS:
+                skipped += 1
+                if debug:
+                    logger.debug("[MONITOR EMA] Not enough data for %s (need %d+)", symbol, EMA_MIN_BARS)
+                continue
+            
+            bar_key = f"{exchange}:{symbol}:{timeframe}"
+            bar = _bar_fingerprint(
+                df.index.asi8[-1] // 1_000_000,  # ns -> ms
+                df["close"].to_numpy()[-1],
+                df["volume"].to_numpy()[-1],
+            )
+            if last_bars is not None and last_bars.get(bar_key) == bar:
+                unchanged += 1
+                continue
+            pending.append((symbol, df, bar_key, bar))
+        
+        def compute(item):
+            # ошибка одного символа не должна ронять остальные — возвращаем её вместе с результатом
             try:
-                # Загружаем последние 100 свечей
-                prices_query = db.query(Price).filter(
-                    Price.exchange == exchange,
-                    Price.symbol == symbol,
-                    Price.timeframe == timeframe
-                ).order_by(Price.ts.desc()).limit(100).all()
-                
-                if not prices_query or len(prices_query) < 50:
-                    logger.warning(f"[MONITOR EMA] Not enough data for {symbol} (need 50+)")
-                    continue
-                
-                # Reverse (старые -> новые)
-                prices_query = list(reversed(prices_query))
-                
-                # Convert to DataFrame
-                df = pd.DataFrame([
-                    {
-                        "timestamp": pd.Timestamp(p.ts, unit='ms', tz='UTC'),
-                        "close": p.close,
-                        "open": p.open,
-                        "high": p.high,
-                        "low": p.low,
-                        "volume": p.volume
-                    }
-                    for p in prices_query
-                ])
-                
-                df = df.set_index("timestamp")
-                
-                # Генерируем сигналы (простая или улучшенная стратегия)
-                if use_advanced:
-                    ema_signals, indicators = ema_crossover_advanced_strategy(
-                        df, 
-                        fast_period=12, 
-                        slow_period=26,
-                        rsi_period=14,
-                        rsi_overbought=70,
-                        rsi_oversold=30,
-                        volume_threshold=1.2,
-                        atr_period=14
-                    )
-                    
-                    # Получаем адаптивные уровни Stop-Loss/Take-Profit
-                    latest_indicators = indicators.iloc[-1]
-                    stop_loss_pct = latest_indicators['stop_loss_pct']
-                    take_profit_pct = latest_indicators['take_profit_pct']
-                    rsi_value = latest_indicators['rsi']
-                    volume_ratio = latest_indicators['volume_ratio']
-                else:
-                    ema_signals = ema_crossover_strategy(df, fast_period=9, slow_period=21)
-                    stop_loss_pct = 2.0  # Фиксированный 2%
-                    take_profit_pct = 5.0  # Фиксированный 5%
-                    rsi_value = None
-                    volume_ratio = None
-                
-                # Последний сигнал
-                latest_signal = int(ema_signals.iloc[-1])
-                current_price = float(df['close'].iloc[-1])
-                timestamp = df.index[-1]
-                
-                # Только BUY сигналы
-                if latest_signal == 1:
-                    signal_data = {
-                        "exchange": exchange,
-                        "symbol": symbol,
-                        "timeframe": timeframe,
-                        "signal": "BUY",
-                        "price": current_price,
-                        "timestamp": str(timestamp),
-                        "probability": 0.85,  # Фиксированная "вероятность" для совместимости
-                        "strategy": strategy_name,
-                        "vol_state": "normal",
-                        "stop_loss_pct": float(stop_loss_pct),
-                        "take_profit_pct": float(take_profit_pct),
-                        "rsi": float(rsi_value) if rsi_value is not None else None,
-                        "volume_ratio": float(volume_ratio) if volume_ratio is not None else None
-                    }
-                    
-                    signals.append(signal_data)
-                    
-                    if use_advanced:
-                        logger.info(
-                            f"[MONITOR EMA] BUY signal for {symbol} @ ${current_price:.4f} "
-                            f"(RSI: {rsi_value:.1f}, Vol: {volume_ratio:.2f}x, "
-                            f"SL: {stop_loss_pct:.2f}%, TP: {take_profit_pct:.2f}%)"
-                        )
-                    else:
-                        logger.info(f"[MONITOR EMA] BUY signal for {symbol} @ ${current_price:.4f}")
-                
+                return _ema_signal_for_symbol(item[0], item[1], exchange, timeframe, use_advanced, strategy_name), None
             except Exception as e:
-                logger.error(f"[MONITOR EMA] Error processing {symbol}: {e}")
+                return None, e
+        
+        # Расчёт — в пуле потоков; last_bars/signaled_bars меняются только здесь, в вызывающем потоке
+        if len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=min(EMA_SIGNAL_MAX_WORKERS, len(pending))) as pool:
+                results = list(pool.map(compute, pending))
+        else:
+            results = [compute(item) for item in pending]
+        
+        signals = []
+        for (symbol, _df, bar_key, bar), (signal, error) in zip(pending, results):
+            if error is not None:
+                errors += 1
+                logger.error("[MONITOR EMA] Error processing %s: %s", symbol, error)
+                continue
+            if last_bars is not None:
+                last_bars[bar_key] = bar
+            if signal is None:
                 continue
+            if signaled_bars is not None:
+                if signaled_bars.get(bar_key) == bar[0]:
+                    repeated += 1
+                    continue
+                signaled_bars[bar_key] = bar[0]
+            signals.append(signal)
         
-        logger.info(f"[MONITOR EMA] Generated {len(signals)} BUY signals")
+        logger.info(
+            "[MONITOR EMA] %s: processed %d symbols, %d BUY signals "
+            "(unchanged=%d, already signaled=%d, skipped=%d, errors=%d)",
+            strategy_name, len(symbols), len(signals), unchanged, repeated, skipped, errors
+        )
         return signals
     
     except Exception as e:
@@ -252,13 +567,39 @@ def generate_ema_signals_for_symbols(
         return []
 
 
+def _latest_bars(db: Session, exchange: str, symbols: List[str], timeframe: str) -> Dict[str, list]:
+    """{symbol: _bar_fingerprint последней свечи в БД} — один запрос на все символы."""
+    latest = (
+        db.query(Price.symbol.label("symbol"), func.max(Price.ts).label("ts"))
+        .filter(Price.exchange == exchange, Price.timeframe == timeframe, Price.symbol.in_(symbols))
+        .group_by(Price.symbol)
+        .subquery()
+    )
+    rows = (
+        db.query(Price.symbol, Price.ts, Price.close, Price.volume)
+        .join(latest, (Price.symbol == latest.c.symbol) & (Price.ts == latest.c.ts))
+        .filter(Price.exchange == exchange, Price.timeframe == timeframe)
+        .all()
+    )
+    return {symbol: _bar_fingerprint(ts, close, volume) for symbol, ts, close, volume in rows}
+
+
 def generate_signals_for_symbols(
     symbols: List[str],
     exchange: str,
     timeframe: str,
-    db: Session
+    db: Session,
+    last_bars: Optional[Dict[str, list]] = None,
+    signaled_bars: Optional[Dict[str, int]] = None
 ) -> List[Dict]:
-    """Генерирует сигналы для всех символов (LEGACY ML VERSION)"""
+    """
+    Генерирует сигналы для всех символов (LEGACY ML VERSION)
+    
+    Args:
+        last_bars, signaled_bars: как у generate_ema_signals_for_symbols — символ скорится
+            заново при любом изменении последней свечи, BUY по одной свече выдаётся один раз;
+            словари обновляются на месте
+    """
     signals = []
     
     try:
@@ -275,19 +616,37 @@ def generate_signals_for_symbols(
         # Загружаем risk policy
         policy = load_policy()
         
+        # По символам — только debug; итог одной строкой после цикла
+        debug = logger.isEnabledFor(logging.DEBUG)
+        skipped = unchanged = repeated = errors = 0
+        # Строки фич для пачки: буфер на все символы, заполняются только прошедшие проверки
+        X_rows = np.zeros((len(symbols), len(feature_cols_from_model)), dtype=np.float32)
+        scored: List[tuple] = []  # (symbol, close, bar_key, bar) в порядке строк X_rows
+        # build_dataset — только для символов, у которых изменилась последняя свеча
+        latest = _latest_bars(db, exchange, symbols, timeframe) if symbols else {}
         for symbol in symbols:
+            bar = latest.get(symbol)
+            if bar is None:
+                skipped += 1
+                if debug:
+                    logger.debug("[MONITOR] No prices for %s", symbol)
+                continue
+            bar_key = f"{exchange}:{symbol}:{timeframe}"
+            if last_bars is not None and last_bars.get(bar_key) == bar:
+                unchanged += 1
+                continue
+            
             try:
                 # Строим датасет (horizon_steps ОБЯЗАТЕЛЬНО!)
                 horizon_steps = 6  # Такой же как при обучении модели
                 df, feature_list = build_dataset(db, exchange, symbol, timeframe, horizon_steps)
                 
                 if df is None or len(df) < 50:
-                    logger.warning(f"[MONITOR] Not enough data for {symbol}")
+                    skipped += 1
+                    if debug:
+                        logger.debug("[MONITOR] Not enough data for %s", symbol)
                     continue
                 
-                # Получаем последнюю строку
-                last_row = df.iloc[-1]
-                
                 # ВАЖНО: Используем feature_cols из модели, а НЕ все колонки датасета!
                 # Модель обучена на конкретном наборе из 84 фич
                 feature_cols = feature_cols_from_model
@@ -295,34 +654,57 @@ def generate_signals_for_symbols(
                 # Проверяем наличие всех нужных фич
                 missing_cols = [col for col in feature_cols if col not in df.columns]
                 if missing_cols:
-                    logger.warning(f"[MONITOR] Missing features for {symbol}: {missing_cols[:5]}")
+                    skipped += 1
+                    if debug:
+                        logger.debug("[MONITOR] Missing features for %s: %s", symbol, missing_cols[:5])
                     continue
                 
-                # Предсказание
-                X = df[feature_cols].iloc[[-1]].fillna(0)
-                proba = model.predict_proba(X)[0, 1]
-                
-                # Простая проверка порога вероятности
-                min_prob = policy.get("min_probability", 0.55)
-                
-                if proba >= min_prob:
-                    signal = {
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "exchange": exchange,
-                        "symbol": symbol,
-                        "timeframe": timeframe,
-                        "probability": float(proba),
-                        "action": "BUY",
-                        "price": float(last_row.get("close", 0)),
-                        "vol_state": "normal"
-                    }
-                    
-                    signals.append(signal)
-                    logger.info(f"[MONITOR] Generated signal for {symbol}: BUY @ {signal['price']:.2f} (prob: {proba:.3f})")
+                # Последняя строка: фичи в порядке модели + цена закрытия
+                X_rows[len(scored)] = np.nan_to_num(
+                    df[feature_cols].tail(1).to_numpy(dtype=np.float32)[0], nan=0.0, posinf=np.inf, neginf=-np.inf
+                )
+                close = df["close"].to_numpy()[-1] if "close" in df.columns else 0
+                scored.append((symbol, float(close), bar_key, bar))
             
             except Exception as e:
-                logger.error(f"[MONITOR] Error generating signal for {symbol}: {e}")
+                errors += 1
+                logger.error("[MONITOR] Error generating signal for %s: %s", symbol, e)
                 continue
+        
+        # Предсказание — одним вызовом на все символы
+        if scored:
+            probas = predict_positive_proba(model, X_rows[: len(scored)])
+            # Простая проверка порога вероятности
+            min_prob = policy.get("min_probability", 0.55)
+            now_iso = datetime.utcnow().isoformat()
+            for (symbol, price, bar_key, bar), proba in zip(scored, probas):
+                if last_bars is not None:
+                    last_bars[bar_key] = bar
+                if proba < min_prob:
+                    continue
+                if signaled_bars is not None:
+                    if signaled_bars.get(bar_key) == bar[0]:
+                        repeated += 1
+                        continue
+                    signaled_bars[bar_key] = bar[0]
+                signals.append({
+                    "timestamp": now_iso,
+                    "exchange": exchange,
+                    "symbol": symbol,
+                    "timeframe": timeframe,
+                    "probability": float(proba),
+                    "action": "BUY",
+                    "price": price,
+                    "vol_state": "normal"
+                })
+                if debug:
+                    logger.debug("[MONITOR] Generated signal for %s: BUY @ %.2f (prob: %.3f)", symbol, price, proba)
+        
+        logger.info(
+            "[MONITOR] ML: processed %d symbols, %d BUY signals "
+            "(unchanged=%d, already signaled=%d, skipped=%d, errors=%d)",
+            len(symbols), len(signals), unchanged, repeated, skipped, errors
+        )
     
     except Exception as e:
         logger.error(f"[MONITOR] Error in signal generation: {e}")
@@ -341,24 +723,20 @@ def execute_signals_if_enabled(signals: List[Dict], auto_execute: bool) -> None:
         try:
             logger.info(f"[MONITOR] Auto-executing signal: {signal['symbol']}")
             
-            db = SessionLocal()
-            try:
-                result = paper_open_buy_auto(
-                    exchange=signal["exchange"],
-                    symbol=signal["symbol"],
-                    timeframe=signal["timeframe"],
-                    price=signal["price"],
-                    ts_iso=signal.get("timestamp", datetime.utcnow().isoformat()),
-                    vol_state=signal.get("vol_state", "normal")
-                )
-                
-                if result.get("status") == "ok":
-                    logger.info(f"[MONITOR] Successfully executed: {result}")
-                else:
-                    logger.warning(f"[MONITOR] Failed to execute: {result}")
+            # paper-сделки живут в файле состояния (src/trade.py) — сессия БД не нужна
+            result = paper_open_buy_auto(
+                exchange=signal["exchange"],
+                symbol=signal["symbol"],
+                timeframe=signal["timeframe"],
+                price=signal["price"],
+                ts_iso=signal.get("timestamp") or datetime.utcnow().isoformat(),
+                vol_state=signal.get("vol_state", "normal")
+            )
             
-            finally:
-                db.close()
+            if result.get("status") == "ok":
+                logger.info(f"[MONITOR] Successfully executed: {result}")
+            else:
+                logger.warning(f"[MONITOR] Failed to execute: {result}")
         
         except Exception as e:
             logger.error(f"[MONITOR] Error executing signal: {e}")
@@ -389,8 +767,9 @@ def send_notification_if_enabled(
         if len(signals) > 3:
             message += f"... и еще {len(signals) - 3} сигналов"
         
-        send_telegram(message)
-        logger.info("[MONITOR] Notification sent")
+        # Отправка — в фоновом потоке notify, цикл монитора не ждёт ответа Telegram
+        if enqueue_telegram(message):
+            logger.info("[MONITOR] Notification queued")
     
     except Exception as e:
         logger.error(f"[MONITOR] Error sending notification: {e}")
@@ -403,7 +782,9 @@ def run_monitor_update() -> Dict:
     Returns:
         Dict с результатами обновления
     """
+    # Одна ISO-строка времени цикла для результата и статистики
     start_time = datetime.utcnow()
+    start_iso = start_time.isoformat()
     
     # Загружаем состояние
     try:
@@ -427,15 +808,18 @@ def run_monitor_update() -> Dict:
     
     results = {
         "status": "ok",
-        "timestamp": start_time.isoformat(),
+        "timestamp": start_iso,
         "updates": {},
         "signals": [],
         "equity": {},
         "errors": []
     }
     
+    # Одна сессия БД на весь цикл: цены, сигналы (закрывается в finally)
     db = None
     try:
+        db = SessionLocal()
+        
         # 1. Обновляем цены
         symbols = state.get("symbols", ["BTC/USDT"])
         exchange = state.get("exchange", "bybit")
@@ -443,7 +827,7 @@ def run_monitor_update() -> Dict:
         
         logger.info(f"[MONITOR] Updating prices for {len(symbols)} symbols...")
         try:
-            prices_updated = update_prices_for_symbols(symbols, exchange, timeframe)
+            prices_updated = update_prices_for_symbols(symbols, exchange, timeframe, db=db)
             if not prices_updated:
                 results["errors"].append("Failed to update prices")
                 logger.warning("[MONITOR] Price update failed")
@@ -452,20 +836,31 @@ def run_monitor_update() -> Dict:
             results["errors"].append(f"Price update error: {e}")
         
         # 2. Генерируем сигналы
-        db = SessionLocal()
         try:
             use_ml = state.get("use_ml_model", False)  # По умолчанию EMA Crossover
             use_advanced_ema = state.get("use_advanced_ema", True)  # По умолчанию улучшенная версия
             
+            # Отпечатки последних обработанных свечей (символ без изменений не пересчитывается)
+            # и ts свечей, по которым BUY уже выдан (без повторов в пределах свечи)
+            stats = state["stats"]
+            stats.pop("last_bar_ts", None)  # прежний ключ: только ts, без close/volume
+            last_bars = stats.get("last_bars") or {}
+            signaled_bars = stats.get("signaled_bars") or {}
             if use_ml:
                 logger.info("[MONITOR] Generating ML model signals...")
-                signals = generate_signals_for_symbols(symbols, exchange, timeframe, db)
+                signals = generate_signals_for_symbols(
+                    symbols, exchange, timeframe, db, last_bars=last_bars, signaled_bars=signaled_bars
+                )
             else:
                 strategy_type = "Advanced (с фильтрами)" if use_advanced_ema else "Simple"
                 logger.info(f"[MONITOR] Generating EMA Crossover signals ({strategy_type})...")
                 signals = generate_ema_signals_for_symbols(
-                    symbols, exchange, timeframe, db, use_advanced=use_advanced_ema
+                    symbols, exchange, timeframe, db, use_advanced=use_advanced_ema,
+                    last_bars=last_bars, signaled_bars=signaled_bars
                 )
+            current_keys = {f"{exchange}:{symbol}:{timeframe}" for symbol in symbols}
+            stats["last_bars"] = {k: v for k, v in last_bars.items() if k in current_keys}
+            stats["signaled_bars"] = {k: v for k, v in signaled_bars.items() if k in current_keys}
             
             results["signals"] = signals
             logger.info(f"[MONITOR] Generated {len(signals)} signals")
@@ -479,6 +874,7 @@ def run_monitor_update() -> Dict:
             if state.get("auto_execute", False) and signals:
                 logger.info(f"[MONITOR] Auto-executing {len(signals)} signals...")
                 execute_signals_if_enabled(signals, True)
+                _invalidate_paper_status()
         except Exception as e:
             logger.error(f"[MONITOR] Error executing signals: {e}", exc_info=True)
             results["errors"].append(f"Signal execution error: {e}")
@@ -497,6 +893,7 @@ def run_monitor_update() -> Dict:
             # 5. Сохраняем snapshot equity
             if equity_data:
                 save_equity_snapshot(equity_data)
+                _invalidate_paper_status()
         except Exception as e:
             logger.error(f"[MONITOR] Error saving equity snapshot: {e}", exc_info=True)
             results["errors"].append(f"Snapshot error: {e}")
@@ -511,12 +908,12 @@ def run_monitor_update() -> Dict:
             
         # 7. Обновляем статистику
         try:
-            state["last_update"] = start_time.isoformat()
+            state["last_update"] = start_iso
             state["stats"]["total_updates"] += 1
             state["stats"]["total_signals"] += len(signals)
             
             if signals:
-                state["stats"]["last_signal_time"] = start_time.isoformat()
+                state["stats"]["last_signal_time"] = start_iso
             
             save_monitor_state(state)
             logger.info("[MONITOR] Update cycle completed successfully")
@@ -533,9 +930,8 @@ def run_monitor_update() -> Dict:
         results["status"] = "error"
         results["errors"].append(f"Critical error: {e}")
         
-        # Увеличиваем счётчик ошибок
+        # Увеличиваем счётчик ошибок (state уже загружен в начале цикла)
         try:
-            state = load_monitor_state()
             state["stats"]["errors"] = state.get("stats", {}).get("errors", 0) + 1
             save_monitor_state(state)
         except Exception:
@@ -572,10 +968,7 @@ def get_equity_chart_data(hours: int = 24) -> Dict:
     
     # Фильтруем по времени
     cutoff = datetime.utcnow() - timedelta(hours=hours)
-    filtered = [
-        h for h in history
-        if datetime.fromisoformat(h["timestamp"]) >= cutoff
-    ]
+    filtered = equity_history_since(history, cutoff)
     
     if not filtered:
         filtered = history[-min(100, len(history)):]  # Последние 100 точек
@@ -591,11 +984,25 @@ def get_equity_chart_data(hours: int = 24) -> Dict:
     }
 
 
+def _paper_status_cached() -> tuple:
+    """(equity, число позиций) paper-счёта, кэш на PAPER_STATUS_TTL секунд."""
+    now = time.monotonic()
+    data = _PAPER_STATUS_CACHE["data"]
+    if data is None or now - _PAPER_STATUS_CACHE["at"] >= PAPER_STATUS_TTL:
+        data = (paper_get_equity(), len(paper_get_positions()))
+        _PAPER_STATUS_CACHE["at"] = now
+        _PAPER_STATUS_CACHE["data"] = data
+    return data
+
+
+def _invalidate_paper_status() -> None:
+    _PAPER_STATUS_CACHE["data"] = None
+
+
 def get_monitor_status() -> Dict:
     """Получает текущий статус монитора"""
     state = load_monitor_state()
-    equity = paper_get_equity()
-    positions = paper_get_positions()
+    equity, positions_count = _paper_status_cached()
     
     return {
         "enabled": state.get("enabled", False),
@@ -605,7 +1012,7 @@ def get_monitor_status() -> Dict:
         "notifications": state.get("notifications", True),
         "symbols": state.get("symbols", []),
         "stats": state.get("stats", {}),
-        "equity": equity,
-        "positions_count": len(positions)
+        "equity": dict(equity),
+        "positions_count": positions_count
     }
 
@@ -3,7 +3,7 @@ import math
 from typing import List, Tuple
 import requests
 from sqlalchemy.orm import Session
-from src.db import Price
+from src.db import Price, dialect_insert
 
 # --- таймфреймы и утилиты ---
 _BINANCE_TF = {"1m": "1m", "5m": "5m", "15m": "15m", "1h": "1h", "4h": "4h", "1d": "1d"}
@@ -36,48 +36,44 @@ def _insert_prices(
 ) -> int:
     """
     rows: list of (ts_ms, o, h, l, c, v)
-    Использует INSERT OR REPLACE для избежания UNIQUE constraint ошибок
+    Один INSERT ... ON CONFLICT (exchange, symbol, timeframe, ts) DO UPDATE на пачку (SQLite/PostgreSQL):
+    незакрытая свеча перезаписывается свежими значениями, как раньше с INSERT OR REPLACE.
     """
-    from sqlalchemy import text
-    
-    added = 0
-    for ts, o, h, low, c, v in rows:
-        # Используем raw SQL с INSERT OR REPLACE (работает быстрее и безопаснее)
-        try:
-            db.execute(
-                text("""
-                    INSERT OR REPLACE INTO prices 
-                    (exchange, symbol, timeframe, ts, open, high, low, close, volume)
-                    VALUES (:exchange, :symbol, :timeframe, :ts, :open, :high, :low, :close, :volume)
-                """),
-                {
-                    "exchange": exchange,
-                    "symbol": symbol,
-                    "timeframe": timeframe,
-                    "ts": int(ts),
-                    "open": float(o),
-                    "high": float(h),
-                    "low": float(low),
-                    "close": float(c),
-                    "volume": float(v)
-                }
-            )
-            added += 1
-        except Exception as e:
-            print(f"[ERROR] Failed to insert price: {e}")
-            continue
-    
-    # Один commit в конце
+    # в одной пачке ключ должен встречаться один раз (иначе PostgreSQL отвергнет DO UPDATE) — берём последнюю
+    by_ts = {int(ts): (o, h, low, c, v) for ts, o, h, low, c, v in rows}
+    if not by_ts:
+        return 0
+    params = [
+        {
+            "exchange": exchange,
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "ts": ts,
+            "open": float(o),
+            "high": float(h),
+            "low": float(low),
+            "close": float(c),
+            "volume": float(v),
+        }
+        for ts, (o, h, low, c, v) in by_ts.items()
+    ]
+
+    stmt = dialect_insert(db, Price)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["exchange", "symbol", "timeframe", "ts"],
+        set_={col: stmt.excluded[col] for col in ("open", "high", "low", "close", "volume")},
+    )
     try:
+        db.execute(stmt, params)
         db.commit()
     except Exception as e:
-        print(f"[ERROR] Failed to commit prices: {e}")
+        print(f"[ERROR] Failed to store prices: {e}")
         import traceback
         traceback.print_exc()
         db.rollback()
-        added = 0
-    
-    return added
+        return 0
+
+    return len(params)
 
 
 # --- загрузчики по биржам ---
@@ -119,10 +115,12 @@ def _fetch_bybit(symbol: str, timeframe: str, limit: int) -> List[Tuple[int, flo
 
 
 # --- публичное API ---
-def fetch_and_store_prices(db: Session, exchange: str, symbol: str, timeframe: str, limit: int = 500) -> int:
+def fetch_price_rows(
+    exchange: str, symbol: str, timeframe: str, limit: int = 500
+) -> List[Tuple[int, float, float, float, float, float]]:
     """
-    Грузит OHLCV и сохраняет в БД.
-    Поддержка: binance, bybit (spot). Возвращает число добавленных строк.
+    Только сетевая часть fetch_and_store_prices: строки (ts_ms, o, h, l, c, v) без NaN, БД не трогает —
+    можно вызывать из пула потоков.
     """
     exchange = (exchange or "").lower()
     symbol = symbol.upper()
@@ -137,8 +135,23 @@ def fetch_and_store_prices(db: Session, exchange: str, symbol: str, timeframe: s
         raise ValueError(f"unsupported exchange '{exchange}'")
 
     # отфильтруем NaN/пустые
-    rows = [r for r in rows if all(math.isfinite(x) for x in r)]
-    return _insert_prices(db, exchange, symbol, timeframe, rows)
+    return [r for r in rows if all(math.isfinite(x) for x in r)]
+
+
+def store_price_rows(
+    db: Session, exchange: str, symbol: str, timeframe: str, rows: List[Tuple[int, float, float, float, float, float]]
+) -> int:
+    """Сохраняет строки fetch_price_rows в БД. Возвращает число добавленных строк."""
+    return _insert_prices(db, (exchange or "").lower(), symbol.upper(), timeframe.lower(), rows)
+
+
+def fetch_and_store_prices(db: Session, exchange: str, symbol: str, timeframe: str, limit: int = 500) -> int:
+    """
+    Грузит OHLCV и сохраняет в БД.
+    Поддержка: binance, bybit (spot). Возвращает число добавленных строк.
+    """
+    rows = fetch_price_rows(exchange, symbol, timeframe, limit)
+    return store_price_rows(db, exchange, symbol, timeframe, rows)
 
 
 def fetch_ohlcv(
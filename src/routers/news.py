@@ -11,9 +11,10 @@ from urllib.parse import urlparse
 import pandas as pd
 from fastapi import APIRouter, Depends, Query
 from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from src.dependencies import get_db, require_api_key, ok_data
+from src.dependencies import get_db, require_api_key, ok_data, orjson_response
 from src.db import Article, ArticleAnnotation, SessionLocal
 from src.news import fetch_and_store
 from src.analysis import analyze_new_articles
@@ -39,15 +40,12 @@ def news_fetch(db: Session = Depends(get_db), _=Depends(require_api_key)):
 @router.get("/latest")
 def news_latest(limit: int = 20, db: Session = Depends(get_db)):
     """Получить последние новости"""
-    rows = (
-        db.query(Article)
-        .order_by(Article.published_at.is_(None), Article.published_at.desc(), Article.id.desc())
+    rows = db.execute(
+        select(Article.id, Article.source, Article.title, Article.url, Article.published_at)
+        .order_by(Article.published_at.desc().nullslast(), Article.id.desc())
         .limit(limit)
-        .all()
-    )
-    return [
-        {"id": r.id, "source": r.source, "title": r.title, "url": r.url, "published_at": r.published_at} for r in rows
-    ]
+    ).mappings().all()
+    return orjson_response(rows)
 
 
 @router.get("/search")
@@ -57,7 +55,7 @@ def news_search(q: str = Query(..., min_length=2), limit: int = 30, db: Session
     rows = (
         db.query(Article)
         .filter((Article.title.ilike(q_like)) | (Article.summary.ilike(q_like)))
-        .order_by(Article.published_at.is_(None), Article.published_at.desc(), Article.id.desc())
+        .order_by(Article.published_at.desc().nullslast(), Article.id.desc())
         .limit(limit)
         .all()
     )
@@ -90,7 +88,7 @@ def news_annotated(limit: int = 20, db: Session = Depends(get_db)):
     rows = (
         db.query(Article, ArticleAnnotation)
         .join(ArticleAnnotation, ArticleAnnotation.article_id == Article.id)
-        .order_by(Article.published_at.is_(None), Article.published_at.desc(), Article.id.desc())
+        .order_by(Article.published_at.desc().nullslast(), Article.id.desc())
         .limit(limit)
         .all()
     )
@@ -119,7 +117,7 @@ def news_by_tag(tag: str = Query(..., min_length=2), limit: int = 30, db: Sessio
         db.query(Article, ArticleAnnotation)
         .join(ArticleAnnotation, ArticleAnnotation.article_id == Article.id)
         .filter(ArticleAnnotation.tags.ilike(f"%{tag}%"))
-        .order_by(Article.published_at.is_(None), Article.published_at.desc(), Article.id.desc())
+        .order_by(Article.published_at.desc().nullslast(), Article.id.desc())
         .limit(limit)
         .all()
     )
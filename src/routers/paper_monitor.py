@@ -227,7 +227,7 @@ async def get_equity_summary(_=Depends(require_api_key)):
     """
     try:
         from datetime import datetime, timedelta
-        from ..paper_trading_monitor import load_equity_history
+        from ..paper_trading_monitor import load_equity_history, equity_history_since
         
         history = load_equity_history()
         
@@ -250,10 +250,7 @@ async def get_equity_summary(_=Depends(require_api_key)):
         
         for period_name, hours in periods.items():
             cutoff = now - timedelta(hours=hours)
-            period_data = [
-                h for h in history
-                if datetime.fromisoformat(h["timestamp"]) >= cutoff
-            ]
+            period_data = equity_history_since(history, cutoff)
             
             if period_data:
                 first = period_data[0]
@@ -326,10 +323,9 @@ async def clear_history(_=Depends(require_api_key)):
     ВНИМАНИЕ: Это действие необратимо!
     """
     try:
-        from ..paper_trading_monitor import EQUITY_HISTORY_PATH
+        from ..paper_trading_monitor import clear_equity_history
         
-        if EQUITY_HISTORY_PATH.exists():
-            EQUITY_HISTORY_PATH.write_text("[]", encoding="utf-8")
+        clear_equity_history()
         
         return {
             "status": "ok",
@@ -4,9 +4,10 @@
 from __future__ import annotations
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from src.dependencies import get_db, require_api_key, ok, ok_data, err
+from src.dependencies import get_db, require_api_key, ok, err, orjson_response
 from src.db import Price
 from src.prices import fetch_and_store_prices
 
@@ -43,15 +44,14 @@ def prices_latest(
     _=Depends(require_api_key),
 ):
     """Получить последние OHLCV свечи"""
-    rows = (
-        db.query(Price)
-        .filter(Price.exchange == exchange, Price.symbol == symbol, Price.timeframe == timeframe)
+    # последние N свечей (DESC + LIMIT по uq_price_row), затем хронологический порядок — всё в БД
+    last_n = (
+        select(Price.ts, Price.open, Price.high, Price.low, Price.close, Price.volume)
+        .where(Price.exchange == exchange, Price.symbol == symbol, Price.timeframe == timeframe)
         .order_by(Price.ts.desc())
         .limit(limit)
-        .all()
-    )
-    rows = list(reversed(rows))
-    return ok_data(
-        [{"ts": r.ts, "open": r.open, "high": r.high, "low": r.low, "close": r.close, "volume": r.volume} for r in rows]
+        .subquery()
     )
+    rows = db.execute(select(last_n).order_by(last_n.c.ts.asc())).mappings().all()
+    return orjson_response({"status": "ok", "data": rows})
 
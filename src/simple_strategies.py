@@ -14,6 +14,98 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Numba (опционально): EMA/скользящие средние для EMA-стратегий считаются по сырым
+# float64-массивам без диспетчеризации pandas; без numba — те же формулы через pandas.
+# nogil: ядра отпускают GIL, и пул потоков generate_ema_signals_for_symbols считает символы параллельно
+try:
+    from numba import njit
+
+    NUMBA_ENABLED = True
+except ImportError:
+    NUMBA_ENABLED = False
+
+if NUMBA_ENABLED:
+
+    @njit(cache=True, nogil=True)
+    def _ema_numba(x, span):
+        # ewm(span, adjust=False): y[0] = x[0], y[i] = a*x[i] + (1-a)*y[i-1]
+        alpha = 2.0 / (span + 1.0)
+        out = np.empty_like(x)
+        if x.shape[0] == 0:
+            return out
+        out[0] = x[0]
+        for i in range(1, x.shape[0]):
+            out[i] = alpha * x[i] + (1.0 - alpha) * out[i - 1]
+        return out
+
+    @njit(cache=True, nogil=True)
+    def _rolling_mean_numba(x, window):
+        # rolling(window).mean(): NaN, пока в окне меньше window значений или есть NaN
+        n = x.shape[0]
+        out = np.full(n, np.nan)
+        for i in range(window - 1, n):
+            s = 0.0
+            ok = True
+            for j in range(i - window + 1, i + 1):
+                v = x[j]
+                if np.isnan(v):
+                    ok = False
+                    break
+                s += v
+            if ok:
+                out[i] = s / window
+        return out
+
+
+def _ema_values(x: np.ndarray, span: int) -> np.ndarray:
+    """EMA (adjust=False) по float64-массиву."""
+    if NUMBA_ENABLED and not np.isnan(x).any():
+        return _ema_numba(x, span)
+    # пропуски — семантика pandas ewm с NaN
+    return pd.Series(x).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def _rolling_mean_values(x: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее по float64-массиву (как rolling(window).mean())."""
+    if NUMBA_ENABLED:
+        return _rolling_mean_numba(x, window)
+    return pd.Series(x).rolling(window=window).mean().to_numpy()
+
+
+def _shift1(x: np.ndarray) -> np.ndarray:
+    """Сдвиг на один бар вперёд (как Series.shift(1)), первый элемент — NaN."""
+    out = np.empty_like(x)
+    out[:1] = np.nan
+    out[1:] = x[:-1]
+    return out
+
+
+def _rsi_values(close: np.ndarray, period: int) -> np.ndarray:
+    """RSI по тем же формулам, что calculate_rsi."""
+    delta = close - _shift1(close)
+    # delta[0] = NaN: сравнения дают False -> 0, как delta.where(...) в calculate_rsi
+    gain = _rolling_mean_values(np.where(delta > 0, delta, 0.0), period)
+    loss = _rolling_mean_values(np.where(delta < 0, -delta, 0.0), period)
+    rs = gain / (loss + 1e-9)
+    return 100 - (100 / (1 + rs))
+
+
+def _atr_values(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    """ATR по тем же формулам, что calculate_atr."""
+    prev_close = _shift1(close)
+    # fmax пропускает NaN (первый бар без prev_close), как max(axis=1) в calculate_atr
+    tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    return _rolling_mean_values(tr, period)
+
+
+def _ema_crosses(ema_fast: np.ndarray, ema_slow: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Маски пересечений (bullish, bearish) быстрой и медленной EMA."""
+    fast_prev = _shift1(ema_fast)
+    slow_prev = _shift1(ema_slow)
+    bullish = (ema_fast > ema_slow) & (fast_prev <= slow_prev)
+    bearish = (ema_fast < ema_slow) & (fast_prev >= slow_prev)
+    return bullish, bearish
+
 
 def calculate_rsi(prices: pd.Series, period: int = 14) -> pd.Series:
     """
@@ -90,19 +182,24 @@ def ema_crossover_strategy(
     Returns:
         Series сигналов (1 = BUY, -1 = SELL, 0 = HOLD)
     """
-    ema_fast = df['close'].ewm(span=fast_period, adjust=False).mean()
-    ema_slow = df['close'].ewm(span=slow_period, adjust=False).mean()
+    close = df['close'].to_numpy(dtype=np.float64)
+    ema_fast = _ema_values(close, fast_period)
+    ema_slow = _ema_values(close, slow_period)
     
     # Crossover detection
-    signals = pd.Series(0, index=df.index)
-    
-    # BUY: Fast crosses above Slow
-    signals[(ema_fast > ema_slow) & (ema_fast.shift(1) <= ema_slow.shift(1))] = 1
+    bullish, bearish = _ema_crosses(ema_fast, ema_slow)
     
-    # SELL: Fast crosses below Slow
-    signals[(ema_fast < ema_slow) & (ema_fast.shift(1) >= ema_slow.shift(1))] = -1
+    # BUY: Fast crosses above Slow; SELL: Fast crosses below Slow
+    values = np.zeros(len(close), dtype=np.int64)
+    values[bullish] = 1
+    values[bearish] = -1
+    signals = pd.Series(values, index=df.index)
     
-    logger.info(f"[EMA Crossover] Generated {(signals == 1).sum()} BUY, {(signals == -1).sum()} SELL signals")
+    # вызывается на каждый символ монитора — подсчёт и форматирование только при DEBUG
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "[EMA Crossover] Generated %d BUY, %d SELL signals", (values == 1).sum(), (values == -1).sum()
+        )
     
     return signals
 
@@ -128,6 +225,8 @@ def calculate_atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
     return atr
 
 
+# деление на нулевой объём/цену даёт inf/NaN, как раньше в pandas, — без RuntimeWarning
+@np.errstate(divide="ignore", invalid="ignore")
 def ema_crossover_advanced_strategy(
     df: pd.DataFrame,
     fast_period: int = 12,
@@ -160,26 +259,31 @@ def ema_crossover_advanced_strategy(
     Returns:
         Tuple[Series сигналов, DataFrame с индикаторами]
     """
+    # Колонки извлекаются один раз, индикаторы считаются по numpy-массивам
+    close = df['close'].to_numpy(dtype=np.float64)
+    volume = df['volume'].to_numpy(dtype=np.float64)
+    
     # 1. EMA
-    ema_fast = df['close'].ewm(span=fast_period, adjust=False).mean()
-    ema_slow = df['close'].ewm(span=slow_period, adjust=False).mean()
+    ema_fast = _ema_values(close, fast_period)
+    ema_slow = _ema_values(close, slow_period)
     
     # 2. RSI
-    rsi = calculate_rsi(df['close'], period=rsi_period)
+    rsi = _rsi_values(close, rsi_period)
     
     # 3. Volume
-    volume_ma = df['volume'].rolling(window=20).mean()
-    volume_confirmed = df['volume'] > (volume_ma * volume_threshold)
+    volume_ma = _rolling_mean_values(volume, 20)
+    volume_confirmed = volume > (volume_ma * volume_threshold)
     
     # 4. ATR
-    atr = calculate_atr(df, period=atr_period)
+    atr = _atr_values(
+        df['high'].to_numpy(dtype=np.float64), df['low'].to_numpy(dtype=np.float64), close, atr_period
+    )
     
     # 5. EMA Crossover detection
-    ema_bullish_cross = (ema_fast > ema_slow) & (ema_fast.shift(1) <= ema_slow.shift(1))
-    ema_bearish_cross = (ema_fast < ema_slow) & (ema_fast.shift(1) >= ema_slow.shift(1))
+    ema_bullish_cross, ema_bearish_cross = _ema_crosses(ema_fast, ema_slow)
     
     # Инициализация сигналов
-    signals = pd.Series(0, index=df.index)
+    values = np.zeros(len(close), dtype=np.int64)
     
     # BUY signal: EMA bullish cross + RSI not overbought + Volume confirmed
     buy_conditions = (
@@ -187,32 +291,34 @@ def ema_crossover_advanced_strategy(
         (rsi < rsi_overbought) & 
         volume_confirmed
     )
-    signals[buy_conditions] = 1
+    values[buy_conditions] = 1
     
     # SELL signal: EMA bearish cross OR RSI overbought
     sell_conditions = ema_bearish_cross | (rsi > rsi_overbought)
-    signals[sell_conditions] = -1
+    values[sell_conditions] = -1
+    signals = pd.Series(values, index=df.index)
     
     # Создаём DataFrame с индикаторами для анализа
+    atr_pct = (atr / close) * 100  # ATR в % от цены
     indicators = pd.DataFrame({
         'ema_fast': ema_fast,
         'ema_slow': ema_slow,
         'rsi': rsi,
         'volume_ma': volume_ma,
-        'volume_ratio': df['volume'] / volume_ma,
+        'volume_ratio': volume / volume_ma,
         'atr': atr,
-        'atr_pct': (atr / df['close']) * 100,  # ATR в % от цены
-        'signal': signals
+        'atr_pct': atr_pct,
+        'signal': values,
+        # Расчёт адаптивных Stop-Loss и Take-Profit
+        'stop_loss_pct': atr_pct * 1.5,  # 1.5x ATR
+        'take_profit_pct': atr_pct * 3.0  # 3x ATR (R:R = 2:1)
     }, index=df.index)
     
-    # Расчёт адаптивных Stop-Loss и Take-Profit
-    indicators['stop_loss_pct'] = indicators['atr_pct'] * 1.5  # 1.5x ATR
-    indicators['take_profit_pct'] = indicators['atr_pct'] * 3.0  # 3x ATR (R:R = 2:1)
-    
-    logger.info(
-        f"[EMA Advanced] Generated {(signals == 1).sum()} BUY, "
-        f"{(signals == -1).sum()} SELL signals (with RSI/Volume/ATR filters)"
-    )
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "[EMA Advanced] Generated %d BUY, %d SELL signals (with RSI/Volume/ATR filters)",
+            (values == 1).sum(), (values == -1).sum()
+        )
     
     return signals, indicators
 
@@ -342,7 +448,9 @@ def backtest_strategy(
     sharpe_ratio = (returns.mean() / (returns.std() + 1e-9)) * np.sqrt(252 * 24)
     
     downside_returns = returns[returns < 0]
-    sortino_ratio = (returns.mean() / (downside_returns.std() + 1e-9)) * np.sqrt(252 * 24) if len(downside_returns) > 0 else 0.0
+    sortino_ratio = (
+        (returns.mean() / (downside_returns.std() + 1e-9)) * np.sqrt(252 * 24) if len(downside_returns) > 0 else 0.0
+    )
     
     cummax = equity_series.cummax()
     drawdown = (equity_series - cummax) / cummax
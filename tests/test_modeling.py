@@ -15,7 +15,9 @@ from src.modeling import (
     train_xgb_and_save,
     load_latest_model,
     load_model_from_path,
+    read_model_artifact,
     walk_forward_cv,
+    predict_positive_proba,
 )
 
 
@@ -143,6 +145,43 @@ def test_select_threshold_grid_default():
     assert 0.50 <= best_thr <= 0.70
 
 
+def test_select_threshold_grid_matches_per_threshold_eval():
+    """Векторный подбор порога совпадает с поштучной оценкой _evaluate_with_threshold."""
+    rng = np.random.default_rng(7)
+    y_true = rng.integers(0, 2, 200)
+    proba = rng.uniform(0.3, 0.8, 200)
+    future_ret = rng.normal(0, 0.02, 200)
+    grid = np.arange(0.50, 0.71, 0.01)
+
+    best_thr, best_metrics = _select_threshold_grid(y_true, proba, future_ret, grid=grid)
+
+    per_thr = [_evaluate_with_threshold(y_true, proba, future_ret, float(t)) for t in grid]
+    expected = max(per_thr, key=lambda d: (d["sharpe_like"], d["total_return"]))
+    assert best_metrics["sharpe_like"] == pytest.approx(expected["sharpe_like"])
+    assert best_metrics["total_return"] == pytest.approx(expected["total_return"])
+    assert best_metrics["accuracy"] == pytest.approx(expected["accuracy"])
+
+
+def test_select_threshold_grid_numba_matches_numpy(monkeypatch):
+    """Numba-ядро перебора порогов даёт тот же результат, что и NumPy broadcast."""
+    pytest.importorskip("numba")
+    import src.modeling as modeling
+
+    rng = np.random.default_rng(3)
+    y_true = rng.integers(0, 2, 500)
+    proba = rng.uniform(0.3, 0.8, 500)
+    future_ret = rng.normal(0, 0.02, 500)
+
+    monkeypatch.setattr(modeling, "_THR_SWEEP_NUMBA_MIN_CELLS", 10**12)
+    thr_np, m_np = _select_threshold_grid(y_true, proba, future_ret)
+    monkeypatch.setattr(modeling, "_THR_SWEEP_NUMBA_MIN_CELLS", 0)
+    thr_nb, m_nb = _select_threshold_grid(y_true, proba, future_ret)
+
+    assert thr_nb == thr_np
+    for k in ("accuracy", "total_return", "sharpe_like"):
+        assert m_nb[k] == pytest.approx(m_np[k])
+
+
 # --- Тесты train_xgb_and_save ---
 
 
@@ -164,7 +203,8 @@ def test_train_xgb_and_save(sample_df, temp_artifacts_dir):
 
     # Проверяем, что модель сохранена
     assert Path(model_path).exists()
-    assert model_path.endswith(".pkl")
+    assert model_path.endswith(".ubj")
+    assert Path(model_path).with_suffix(".meta.json").exists()
 
     # Проверяем артефакты
     metrics_file = Path(temp_artifacts_dir) / "metrics.json"
@@ -197,8 +237,8 @@ def test_train_xgb_and_save_missing_columns(sample_df, temp_artifacts_dir):
 
     assert Path(model_path).exists()
     # Загружаем модель и проверяем, что используются только существующие фичи
-    obj = joblib.load(model_path)
-    assert "nonexistent_col" not in obj["feature_cols"]
+    _, saved_cols, _ = read_model_artifact(model_path)
+    assert "nonexistent_col" not in saved_cols
 
 
 # --- Тесты load_latest_model ---
@@ -284,6 +324,37 @@ def test_walk_forward_cv(sample_df):
     assert len(result["curve"]["timestamps"]) > 0
 
 
+def test_walk_forward_cv_threshold_is_out_of_sample(sample_df, monkeypatch):
+    """Порог подбирается на хвосте train, которого модель ещё не видела; потом хвост дообучается."""
+    import src.modeling as modeling
+
+    train_rows, valid_rows = [], []
+    real_train, real_select = modeling.xgb.train, modeling._select_threshold_grid
+
+    def spy_train(params, dtrain, *args, **kwargs):
+        train_rows.append(dtrain.num_row())
+        return real_train(params, dtrain, *args, **kwargs)
+
+    def spy_select(y_true, proba, future_ret, grid=None):
+        valid_rows.append((len(y_true), len(train_rows)))
+        return real_select(y_true, proba, future_ret, grid)
+
+    monkeypatch.setattr(modeling.xgb, "train", spy_train)
+    monkeypatch.setattr(modeling, "_select_threshold_grid", spy_select)
+
+    result = walk_forward_cv(
+        sample_df, ["ret_1", "ret_3"], window_train=100, window_test=30, step=50,
+        inner_valid_ratio=0.2, warm_start_rounds=0, n_jobs=1,
+    )
+
+    n_folds = result["summary"]["n_folds"]
+    assert n_folds > 0
+    # на фолд: обучение на inner_train (80 строк), затем дообучение на хвосте (20 строк)
+    assert train_rows == [80, 20] * n_folds
+    # порог — по 20 строкам хвоста, до дообучения на нём
+    assert valid_rows == [(20, 2 * k + 1) for k in range(n_folds)]
+
+
 def test_walk_forward_cv_empty_df():
     """Проверяет обработку пустого датасета."""
     df_empty = pd.DataFrame()
@@ -304,6 +375,20 @@ def test_walk_forward_cv_insufficient_data():
     assert result["summary"]["n_folds"] == 0
 
 
+def test_walk_forward_cv_window_train_too_small(sample_df):
+    """window_train < 2 — ошибка независимо от размера датасета."""
+    with pytest.raises(ValueError, match="window_train must be >= 2"):
+        walk_forward_cv(sample_df, ["ret_1"], window_train=1, window_test=30)
+    with pytest.raises(ValueError, match="window_train must be >= 2"):
+        walk_forward_cv(sample_df.iloc[:3], ["ret_1"], window_train=1, window_test=30)
+
+
+def test_walk_forward_cv_shorter_than_one_window(sample_df):
+    """Датасет короче window_train + window_test — пустой результат, без ошибки."""
+    result = walk_forward_cv(sample_df.iloc[:120], ["ret_1", "ret_3"], window_train=100, window_test=30)
+    assert result == {"folds": [], "summary": {"n_folds": 0}}
+
+
 def test_walk_forward_cv_no_usable_features(sample_df):
     """Проверяет ошибку при отсутствии используемых фичей."""
     with pytest.raises(ValueError, match="no usable feature columns"):
@@ -352,3 +437,78 @@ def test_full_pipeline(sample_df, temp_artifacts_dir):
     predictions = (proba > threshold).astype(int)
     assert all(p in [0, 1] for p in predictions)
 
+
+
+def test_load_model_cache_reuses_and_invalidates(sample_df, temp_artifacts_dir):
+    """Повторная загрузка отдаёт тот же объект, перезапись файла инвалидирует кэш."""
+    import os
+
+    _, model_path = train_xgb_and_save(sample_df, ["ret_1", "ret_3"], artifacts_dir=temp_artifacts_dir)
+
+    m1, _, _, _ = load_model_from_path(model_path)
+    m2, _, _, _ = load_latest_model(artifacts_dir=temp_artifacts_dir)
+    assert m1 is m2
+
+    st = os.stat(model_path)
+    os.utime(model_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    m3, _, _, _ = load_model_from_path(model_path)
+    assert m3 is not m1
+
+
+def test_walk_forward_cv_warm_start(sample_df):
+    """При сильном перекрытии окон фолды дообучают прошлый бустер, с периодическим полным переобучением."""
+    feature_cols = ["ret_1", "ret_3", "rsi_14"]
+
+    result = walk_forward_cv(sample_df, feature_cols, window_train=100, window_test=20, step=10, full_refit_every=3)
+    flags = [f["warm_start"] for f in result["folds"]]
+    assert flags[:6] == [False, True, True, False, True, True]
+
+    cold = walk_forward_cv(sample_df, feature_cols, window_train=100, window_test=20, step=10, warm_start_rounds=0)
+    assert not any(f["warm_start"] for f in cold["folds"])
+    assert cold["params"]["warm_start_rounds"] == 0
+
+
+def test_walk_forward_cv_parallel_matches_serial(sample_df):
+    """Параллельный прогон цепочек фолдов даёт тот же результат, что и последовательный."""
+    feature_cols = ["ret_1", "ret_3", "rsi_14"]
+    kwargs = dict(window_train=100, window_test=30, step=10, full_refit_every=2)
+
+    serial = walk_forward_cv(sample_df, feature_cols, n_jobs=1, **kwargs)
+    parallel = walk_forward_cv(sample_df, feature_cols, n_jobs=2, **kwargs)
+
+    assert serial == parallel
+
+
+def test_load_legacy_pickle_model(sample_df, temp_artifacts_dir):
+    """Старые .pkl-артефакты (dict с model/feature_cols/threshold) по-прежнему загружаются."""
+    _, model_path = train_xgb_and_save(sample_df, ["ret_1", "ret_3"], artifacts_dir=temp_artifacts_dir)
+    model, cols, thr = read_model_artifact(model_path)
+
+    legacy_path = Path(temp_artifacts_dir) / "models" / "legacy.pkl"
+    joblib.dump({"model": model, "feature_cols": cols, "threshold": thr}, legacy_path)
+
+    loaded, loaded_cols, loaded_thr, _ = load_model_from_path(str(legacy_path))
+    assert loaded_cols == cols
+    assert loaded_thr == thr
+    X = sample_df[cols].iloc[:5].values
+    np.testing.assert_allclose(loaded.predict_proba(X), model.predict_proba(X))
+
+
+def test_read_model_artifact_rejects_json_sidecars(sample_df, temp_artifacts_dir):
+    """meta.json и прочие .json рядом с моделью не читаются как модель XGBoost."""
+    _, model_path = train_xgb_and_save(sample_df, ["ret_1", "ret_3"], artifacts_dir=temp_artifacts_dir)
+    meta_path = Path(model_path).with_suffix(".meta.json")
+    assert meta_path.exists()
+
+    with pytest.raises(ValueError, match="Not a model artifact"):
+        read_model_artifact(meta_path)
+
+
+def test_predict_positive_proba_matches_predict_proba(sample_df, temp_artifacts_dir):
+    """Быстрый путь inplace_predict совпадает с predict_proba[:, 1]."""
+    _, model_path = train_xgb_and_save(sample_df, ["ret_1", "ret_3"], artifacts_dir=temp_artifacts_dir)
+    model, cols, _ = read_model_artifact(model_path)
+
+    X = sample_df[cols].iloc[-20:].to_numpy(dtype=np.float32)
+    np.testing.assert_allclose(predict_positive_proba(model, X), model.predict_proba(X)[:, 1], rtol=1e-6)
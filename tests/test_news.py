@@ -0,0 +1,144 @@
+"""
+Тесты для src/news.py (условный GET лент и вставка без дублей).
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import src.news as news
+from src.db import Base, Article, FeedState
+
+
+FEED_URL = "https://feed.example.com/rss"
+
+RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>Example</title>
+<item><title>First headline</title><link>https://news.example.com/a</link>
+<pubDate>Mon, 01 Jan 2024 10:00:00 GMT</pubDate></item>
+<item><title>Second headline</title><link>https://news.example.com/b</link>
+<pubDate>Mon, 01 Jan 2024 11:00:00 GMT</pubDate></item>
+<item><title>Second headline, repost</title><link>https://news.example.com/b</link>
+<pubDate>Mon, 01 Jan 2024 12:00:00 GMT</pubDate></item>
+</channel></rss>"""
+
+
+class _Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture
+def db():
+    """In-memory SQLite со статьями и состоянием лент; индекс заголовков — с нуля."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Article.__table__, FeedState.__table__])
+    session = sessionmaker(bind=engine)()
+    news.reset_recent_titles()
+    yield session
+    session.close()
+    news.reset_recent_titles()
+
+
+@pytest.fixture
+def fake_get(monkeypatch):
+    """requests.get ленты: отвечает заготовленными ответами, запоминает заголовки запросов."""
+    responses = []
+    sent_headers = []
+
+    def get(url, timeout=None, headers=None):
+        sent_headers.append(dict(headers or {}))
+        return responses.pop(0)
+
+    monkeypatch.setattr(news.requests, "get", get)
+    return responses, sent_headers
+
+
+# --- Tests ---
+
+
+def test_validators_round_trip(db, fake_get):
+    responses, sent_headers = fake_get
+    responses.append(_Response(200, RSS, {"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 12:00:00 GMT"}))
+    responses.append(_Response(304))
+
+    news.fetch_and_store(db, feeds=[FEED_URL])
+
+    state = db.get(FeedState, FEED_URL)
+    assert (state.etag, state.last_modified) == ('"v1"', "Mon, 01 Jan 2024 12:00:00 GMT")
+    assert state.last_fetched is not None
+    assert "If-None-Match" not in sent_headers[0]
+
+    # второй запрос — условный, с валидаторами из feed_state
+    news.fetch_and_store(db, feeds=[FEED_URL])
+    assert sent_headers[1]["If-None-Match"] == '"v1"'
+    assert sent_headers[1]["If-Modified-Since"] == "Mon, 01 Jan 2024 12:00:00 GMT"
+
+
+def test_save_feed_state_upserts(db):
+    news._save_feed_state(db, FEED_URL, '"v1"', None)
+    news._save_feed_state(db, FEED_URL, '"v2"', "Tue, 02 Jan 2024 00:00:00 GMT")
+
+    rows = db.query(FeedState).all()
+    assert len(rows) == 1
+    assert (rows[0].etag, rows[0].last_modified) == ('"v2"', "Tue, 02 Jan 2024 00:00:00 GMT")
+
+
+def test_not_modified_skips_parse(db, fake_get, monkeypatch):
+    responses, _ = fake_get
+    db.add(FeedState(url=FEED_URL, etag='"v1"'))
+    db.commit()
+    responses.append(_Response(304))
+
+    def parse(_content):
+        raise AssertionError("304 не должен разбираться")
+
+    monkeypatch.setattr(news.feedparser, "parse", parse)
+
+    assert news.fetch_and_store(db, feeds=[FEED_URL]) == 0
+    assert db.query(Article).count() == 0
+
+
+def test_duplicate_urls_do_not_raise(db, fake_get):
+    responses, _ = fake_get
+    # статья /a уже в БД (под другим заголовком — мягкая дедупликация её не отсеет)
+    db.add(Article(source="news.example.com", title="Old title", url="https://news.example.com/a"))
+    db.commit()
+    responses.append(_Response(200, RSS))
+
+    # /a — конфликт с БД, второй /b — дубль внутри ленты
+    assert news.fetch_and_store(db, feeds=[FEED_URL]) == 1
+
+    urls = sorted(a.url for a in db.query(Article).all())
+    assert urls == ["https://news.example.com/a", "https://news.example.com/b"]
+
+
+def test_failed_insert_keeps_old_validators(db, fake_get, monkeypatch):
+    responses, _ = fake_get
+    db.add(FeedState(url=FEED_URL, etag='"v0"'))
+    db.commit()
+    responses.append(_Response(200, RSS, {"ETag": '"v1"'}))
+
+    execute = db.execute
+
+    def failing_execute(stmt, *args, **kwargs):
+        if getattr(stmt, "is_insert", False) and stmt.table.name == "articles":
+            raise RuntimeError("disk I/O error")
+        return execute(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(db, "execute", failing_execute)
+
+    assert news.fetch_and_store(db, feeds=[FEED_URL]) == 0
+
+    # статьи откатились — валидаторы прежние, следующий опрос снова получит ленту целиком
+    db.expire_all()
+    assert db.get(FeedState, FEED_URL).etag == '"v0"'
+    assert db.query(Article).count() == 0
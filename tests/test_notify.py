@@ -0,0 +1,124 @@
+"""
+Тесты для src/notify.py (фоновая отправка в Telegram: очередь, склейка, повторы).
+"""
+import queue
+import threading
+import time
+
+import pytest
+
+import src.notify as notify
+
+
+_STOP = "__stop__"
+_PARKED = threading.Event()
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """Своя очередь отправки; поток-отправитель тестом не запускается автоматически."""
+    q = queue.Queue(maxsize=1000)
+    monkeypatch.setattr(notify, "_OUTBOX", q)
+    monkeypatch.setattr(notify, "_SENDER", {"thread": object()})
+    monkeypatch.setattr(notify, "notifications_enabled", lambda: True)
+    return q
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """_post_telegram без сети: тексты копятся в списке; на _STOP поток-отправитель засыпает навсегда
+    (daemon), чтобы после теста не забирать сообщения из настоящей очереди."""
+    texts = []
+
+    def post(text):
+        if text == _STOP:
+            _PARKED.set()
+            threading.Event().wait()
+        texts.append(text)
+        return True, "ok", 0.0
+
+    monkeypatch.setattr(notify, "_post_telegram", post)
+    return texts
+
+
+def _drain(q, texts, expected):
+    """Запускает _sender_loop на уже заполненной очереди и ждёт expected отправок."""
+    _PARKED.clear()
+    threading.Thread(target=notify._sender_loop, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while len(texts) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    q.put(_STOP)
+    assert _PARKED.wait(timeout=5)
+
+
+# --- Tests ---
+
+
+def test_burst_is_coalesced_in_order(outbox, sent):
+    for text in ("first", "second", "third"):
+        assert notify.enqueue_telegram(text) is True
+
+    _drain(outbox, sent, 1)
+
+    assert sent == ["first\n\nsecond\n\nthird"]
+
+
+def test_coalescing_respects_max_len(outbox, sent, monkeypatch):
+    monkeypatch.setattr(notify, "_TG_MAX_LEN", 10)
+    for text in ("aaaa", "bbbb", "cccc", "dd"):
+        outbox.put(text)
+
+    _drain(outbox, sent, 2)
+
+    # "aaaa\n\nbbbb" — ровно 10 символов; "cccc" уже не влезает и уходит следующим сообщением
+    assert sent == ["aaaa\n\nbbbb", "cccc\n\ndd"]
+    assert all(len(text) <= 10 for text in sent)
+
+
+def test_retry_after_is_honoured(monkeypatch):
+    replies = [(False, "429 Too Many Requests", 1.5), (True, "ok", 0.0)]
+    posted, slept = [], []
+
+    def post(text):
+        posted.append(text)
+        return replies.pop(0)
+
+    monkeypatch.setattr(notify, "_post_telegram", post)
+    monkeypatch.setattr(notify.time, "sleep", slept.append)
+
+    notify._send_with_backoff("hello")
+
+    assert posted == ["hello", "hello"]
+    assert slept == [1.5]
+
+
+def test_send_gives_up_without_retry_after(monkeypatch):
+    posted = []
+
+    def post(text):
+        posted.append(text)
+        return False, "400 Bad Request", 0.0
+
+    monkeypatch.setattr(notify, "_post_telegram", post)
+
+    notify._send_with_backoff("hello")
+
+    assert posted == ["hello"]
+
+
+def test_full_queue_returns_false(outbox, monkeypatch):
+    monkeypatch.setattr(notify, "_OUTBOX", queue.Queue(maxsize=1))
+
+    assert notify.enqueue_telegram("one") is True
+    assert notify.enqueue_telegram("two") is False
+
+
+def test_disabled_notifications_are_not_queued(outbox, monkeypatch):
+    monkeypatch.setattr(notify, "notifications_enabled", lambda: False)
+
+    assert notify.enqueue_telegram("one") is False
+    assert outbox.empty()
@@ -0,0 +1,132 @@
+"""
+Тесты для src/onchain.py (кэш ответов провайдеров).
+"""
+import asyncio
+
+import pytest
+
+import src.onchain as onchain
+import src.onchain_async as onchain_async
+
+
+MARKET = {
+    "market_cap_usd": 1e12,
+    "total_volume_usd": 3e10,
+    "circulating_supply": 19e6,
+    "price_change_24h_pct": 1.0,
+    "price_change_7d_pct": 2.0,
+    "price_change_30d_pct": 3.0,
+}
+BTC = {"hash_rate": 6e20, "difficulty": 8e13, "n_tx": 400000}
+LIQ = {"total_liquidations_usd": 5e7, "long_liquidations_usd": 3e7, "short_liquidations_usd": 2e7}
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture
+def fake_fetch(tmp_path, monkeypatch):
+    """Кэш во временной папке, сеть заменена очередью заготовленных ответов."""
+    monkeypatch.setattr(onchain, "ONCHAIN_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(onchain, "ONCHAIN_ASYNC", False)
+    monkeypatch.setattr(onchain, "_MEM_CACHE", {})
+    responses = []
+    calls = []
+
+    def fetch(asset, coin_id):
+        calls.append(asset)
+        return responses.pop(0)
+
+    monkeypatch.setattr(onchain, "_fetch_onchain_raw", fetch)
+    return responses, calls
+
+
+# --- Tests ---
+
+
+def test_full_response_is_cached(fake_fetch):
+    responses, calls = fake_fetch
+    responses.append((MARKET, BTC, 0.0001, LIQ))
+
+    first = onchain.get_onchain_features("BTC")
+    second = onchain.get_onchain_features("BTC")
+
+    assert calls == ["BTC"]
+    assert first == second
+    assert first["onchain_hash_rate"] == pytest.approx(600.0)
+
+
+def test_partial_response_expires_quickly(fake_fetch, monkeypatch):
+    responses, calls = fake_fetch
+    # CoinGlass (ликвидации) не ответил
+    responses.append((MARKET, BTC, 0.0001, None))
+    responses.append((MARKET, BTC, 0.0001, LIQ))
+
+    now = [onchain.time.time()]
+    monkeypatch.setattr(onchain.time, "time", lambda: now[0])
+
+    first = onchain.get_onchain_features("BTC")
+    assert first["onchain_liquidations_24h"] == 0.0
+
+    # в пределах короткого TTL — из кэша
+    now[0] += onchain.ONCHAIN_PARTIAL_CACHE_TTL - 1
+    onchain.get_onchain_features("BTC")
+    assert calls == ["BTC"]
+
+    # короткий TTL истёк (и в памяти, и на диске) — снова идём в сеть
+    now[0] += 2
+    second = onchain.get_onchain_features("BTC")
+    assert calls == ["BTC", "BTC"]
+    assert second["onchain_liquidations_24h"] == pytest.approx(50.0)
+
+
+def test_missing_btc_stats_is_not_partial_for_altcoins():
+    assert onchain._cache_ttl("ETH", (MARKET, None, 0.0001, LIQ)) == onchain.ONCHAIN_CACHE_TTL
+    assert onchain._cache_ttl("BTC", (MARKET, None, 0.0001, LIQ)) == onchain.ONCHAIN_PARTIAL_CACHE_TTL
+
+
+def _fake_get_json(payloads, calls):
+    async def get_json(client, provider, url, params=None, timeout=15):
+        calls.append(url)
+        for key, payload in payloads.items():
+            if key in url:
+                return payload
+        return None
+
+    return get_json
+
+
+def test_async_malformed_coinglass_payload_is_none(fake_fetch, monkeypatch):
+    calls = []
+    payloads = {
+        "funding": {"success": True, "data": [{"rate": "n/a"}]},
+        "liquidation": {"success": True, "data": [{"longLiquidationValue": None}]},
+    }
+    monkeypatch.setattr(onchain_async, "_get_json", _fake_get_json(payloads, calls))
+
+    raw = asyncio.run(onchain_async.fetch_onchain_raw_async("ETH", "ethereum"))
+
+    # битый ответ — как отказ провайдера, без исключения из asyncio.run
+    assert raw == (None, None, None, None)
+
+
+def test_async_features_share_sync_cache(fake_fetch, monkeypatch):
+    responses, sync_calls = fake_fetch
+    calls = []
+    payloads = {
+        "coingecko": {"market_data": {"market_cap": {"usd": 1e12}}},
+        "funding": {"success": True, "data": [{"rate": 0.0001}]},
+        "liquidation": {"success": True, "data": [{"longLiquidationValue": 3e7, "shortLiquidationValue": 2e7}]},
+    }
+    monkeypatch.setattr(onchain_async, "_get_json", _fake_get_json(payloads, calls))
+
+    first = asyncio.run(onchain_async.get_onchain_features_async("ETH"))
+    n_requests = len(calls)
+    second = asyncio.run(onchain_async.get_onchain_features_async("ETH"))
+
+    assert n_requests == 3
+    assert len(calls) == n_requests  # второй вызов — из кэша
+    assert first == second
+    # тот же кэш видит и синхронный путь
+    assert onchain.get_onchain_features("ETH") == first
+    assert sync_calls == []
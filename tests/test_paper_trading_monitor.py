@@ -0,0 +1,241 @@
+"""
+Тесты для src/paper_trading_monitor.py (история equity в JSONL).
+"""
+import json
+
+import pytest
+
+import src.paper_trading_monitor as monitor
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture
+def history_paths(tmp_path, monkeypatch):
+    """Перенаправляет файлы истории equity во временную папку."""
+    path = tmp_path / "equity_history_realtime.jsonl"
+    legacy = tmp_path / "equity_history_realtime.json"
+    monkeypatch.setattr(monitor, "EQUITY_HISTORY_PATH", path)
+    monkeypatch.setattr(monitor, "LEGACY_EQUITY_HISTORY_PATH", legacy)
+    monkeypatch.setattr(monitor, "_history_lines", None)
+    monkeypatch.setattr(monitor, "_HISTORY_CACHE", {"key": None, "data": None})
+    return path, legacy
+
+
+# --- Tests ---
+
+
+def test_snapshots_are_appended(history_paths):
+    path, _ = history_paths
+    monitor.save_equity_snapshot({"equity": 10000.0, "total_pnl": 0.0})
+    monitor.save_equity_snapshot({"equity": 10050.0, "total_pnl": 50.0})
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+
+    history = monitor.load_equity_history()
+    assert [h["equity"] for h in history] == [10000.0, 10050.0]
+    assert all("timestamp" in h for h in history)
+
+
+def test_history_is_rotated(history_paths, monkeypatch):
+    path, _ = history_paths
+    monkeypatch.setattr(monitor, "MAX_EQUITY_SNAPSHOTS", 5)
+    monkeypatch.setattr(monitor, "EQUITY_ROTATE_SLACK", 3)
+
+    for i in range(9):
+        monitor.save_equity_snapshot({"equity": float(i)})
+
+    # 9 > 5 + 3 — файл обрезан до последних 5
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 5
+    assert [h["equity"] for h in monitor.load_equity_history()] == [4.0, 5.0, 6.0, 7.0, 8.0]
+
+
+def test_broken_line_is_skipped(history_paths):
+    path, _ = history_paths
+    monitor.save_equity_snapshot({"equity": 1.0})
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"timestamp": "2024-')
+
+    assert [h["equity"] for h in monitor.load_equity_history()] == [1.0]
+
+
+def test_legacy_json_is_migrated(history_paths):
+    path, legacy = history_paths
+    legacy.write_text(
+        json.dumps([{"timestamp": "2024-01-01T00:00:00", "equity": 1.0}]),
+        encoding="utf-8",
+    )
+
+    monitor.save_equity_snapshot({"equity": 2.0})
+
+    assert not legacy.exists()
+    assert [h["equity"] for h in monitor.load_equity_history()] == [1.0, 2.0]
+
+
+def test_clear_history(history_paths):
+    monitor.save_equity_snapshot({"equity": 1.0})
+    monitor.clear_equity_history()
+    assert monitor.load_equity_history() == []
+
+
+def test_history_cache(history_paths):
+    path, _ = history_paths
+    monitor.save_equity_snapshot({"equity": 1.0})
+    first = monitor.load_equity_history()
+    first.append({"equity": -1.0})  # вызывающий получает копию списка
+
+    monitor.save_equity_snapshot({"equity": 2.0})
+    assert monitor._HISTORY_CACHE["key"] == monitor._history_file_key()
+    assert [h["equity"] for h in monitor.load_equity_history()] == [1.0, 2.0]
+
+    # запись файла в обход монитора подхватывается по mtime/size
+    path.write_text('{"timestamp": "2024-01-01T00:00:00", "equity": 5.0}\n', encoding="utf-8")
+    assert [h["equity"] for h in monitor.load_equity_history()] == [5.0]
+
+
+def test_monitor_state_cache(tmp_path, monkeypatch):
+    path = tmp_path / "paper_monitor.json"
+    monkeypatch.setattr(monitor, "MONITOR_STATE_PATH", path)
+    monkeypatch.setattr(monitor, "_STATE_CACHE", {"key": None, "data": None})
+
+    state = monitor.load_monitor_state()
+    state["enabled"] = True
+    monitor.save_monitor_state(state)
+
+    loaded = monitor.load_monitor_state()
+    assert loaded["enabled"] is True
+    # изменения возвращённой копии не попадают в кэш
+    loaded["stats"]["total_updates"] = 99
+    assert monitor.load_monitor_state()["stats"]["total_updates"] == 0
+
+    # запись файла в обход save_monitor_state подхватывается по mtime/size
+    path.write_text(json.dumps({"enabled": False, "stats": {}}), encoding="utf-8")
+    assert monitor.load_monitor_state()["enabled"] is False
+
+
+def test_equity_history_since():
+    from datetime import datetime, timedelta
+
+    base = datetime(2024, 1, 1)
+    # старые записи (без ts_ms) и новые вперемешку — граница находится по времени
+    history = [
+        {"timestamp": (base + timedelta(minutes=15 * i)).isoformat(), "equity": float(i)}
+        for i in range(10)
+    ]
+    for h in history[5:]:
+        h["ts_ms"] = monitor._utc_ms(datetime.fromisoformat(h["timestamp"]))
+
+    since = monitor.equity_history_since(history, base + timedelta(minutes=30))
+    assert [h["equity"] for h in since] == [2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+    assert monitor.equity_history_since(history, base + timedelta(days=1)) == []
+    assert len(monitor.equity_history_since(history, base - timedelta(days=1))) == 10
+
+
+@pytest.fixture
+def price_db():
+    """In-memory SQLite с таблицей цен."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from src.db import Base, Price
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Price.__table__])
+    db = sessionmaker(bind=engine)()
+    yield db
+    db.close()
+
+
+def _hour_bars(n, close, end_ms):
+    """n часовых свечей (ts_ms, o, h, l, c, v), последняя открыта в end_ms."""
+    return [(end_ms - (n - 1 - i) * 3_600_000, close, close, close, close, 1.0) for i in range(n)]
+
+
+def test_forming_bar_update_is_rescored(price_db, monkeypatch):
+    import time as _time
+    import pandas as pd
+    from src.prices import store_price_rows
+
+    calls = []
+
+    def fake_strategy(df, **kwargs):
+        # BUY, когда последняя цена выше 100
+        calls.append(float(df["close"].iloc[-1]))
+        return pd.Series((df["close"].to_numpy() > 100).astype(int), index=df.index)
+
+    monkeypatch.setattr(monitor, "ema_crossover_strategy", fake_strategy)
+    now_ms = int(_time.time() * 1000)
+    bar_ts = now_ms - now_ms % 3_600_000
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", _hour_bars(60, 100.0, bar_ts))
+
+    last_bars, signaled_bars = {}, {}
+
+    def tick():
+        return monitor.generate_ema_signals_for_symbols(
+            ["BTC/USDT"], "bybit", "1h", price_db, use_advanced=False,
+            last_bars=last_bars, signaled_bars=signaled_bars
+        )
+
+    assert tick() == []
+    # ничего не изменилось — символ не пересчитывается
+    assert tick() == []
+    assert len(calls) == 1
+
+    # та же незакрытая свеча (ts не менялся), но новый close — пересчёт и сигнал
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", [(bar_ts, 100.0, 101.0, 100.0, 101.0, 2.0)])
+    signals = tick()
+    assert [s["price"] for s in signals] == [101.0]
+
+    # дальнейшие обновления той же свечи пересчитываются, но повторный BUY не выдаётся
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", [(bar_ts, 100.0, 102.0, 100.0, 102.0, 3.0)])
+    assert tick() == []
+    assert calls[-1] == 102.0
+
+    # новая свеча — сигнал снова возможен
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", [(bar_ts + 3_600_000, 102.0, 103.0, 102.0, 103.0, 1.0)])
+    assert [s["price"] for s in tick()] == [103.0]
+
+
+def test_ml_forming_bar_update_is_rescored(price_db, monkeypatch):
+    import pandas as pd
+    from src.prices import store_price_rows
+
+    class FakeModel:
+        pass
+
+    built = []
+
+    def fake_build(db, exchange, symbol, timeframe, horizon_steps):
+        # одна фича — последняя цена из БД
+        from src.db import Price
+        closes = [p.close for p in db.query(Price).order_by(Price.ts).all()]
+        built.append(closes[-1])
+        return pd.DataFrame({"f": closes, "close": closes}), ["f"]
+
+    monkeypatch.setattr(monitor, "build_dataset", fake_build)
+    monkeypatch.setattr(monitor, "load_latest_model", lambda: (FakeModel(), ["f"], 0.5, "fake"))
+    monkeypatch.setattr(monitor, "load_policy", lambda: {"min_probability": 0.5})
+    # вероятность 1.0, когда цена выше 100
+    monkeypatch.setattr(monitor, "predict_positive_proba", lambda model, X: (X[:, 0] > 100).astype(float))
+
+    bar_ts = 1_700_000_000_000 - 1_700_000_000_000 % 3_600_000
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", _hour_bars(60, 100.0, bar_ts))
+    last_bars, signaled_bars = {}, {}
+
+    def tick():
+        return monitor.generate_signals_for_symbols(
+            ["BTC/USDT"], "bybit", "1h", price_db, last_bars=last_bars, signaled_bars=signaled_bars
+        )
+
+    assert tick() == []
+    assert tick() == []
+    assert built == [100.0]
+
+    # незакрытая свеча обновилась — фичи пересобираются, сигнал выдаётся
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", [(bar_ts, 100.0, 101.0, 100.0, 101.0, 2.0)])
+    assert [s["price"] for s in tick()] == [101.0]
+    # следующее обновление той же свечи — без повторного BUY
+    store_price_rows(price_db, "bybit", "BTC/USDT", "1h", [(bar_ts, 100.0, 102.0, 100.0, 102.0, 3.0)])
+    assert tick() == []
+    assert built == [100.0, 101.0, 102.0]
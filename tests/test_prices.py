@@ -0,0 +1,71 @@
+"""
+Тесты для src/prices.py (upsert свечей в БД).
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.db import Base, Price
+from src.prices import _insert_prices
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture
+def db():
+    """In-memory SQLite с таблицей цен."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[Price.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _rows(db):
+    return db.query(Price).order_by(Price.ts).all()
+
+
+# --- Tests ---
+
+
+def test_insert_prices_inserts_rows(db):
+    rows = [(1000, 1.0, 2.0, 0.5, 1.5, 10.0), (2000, 1.5, 2.5, 1.0, 2.0, 20.0)]
+
+    assert _insert_prices(db, "bybit", "BTC/USDT", "1h", rows) == 2
+
+    stored = _rows(db)
+    assert [(p.ts, p.open, p.high, p.low, p.close, p.volume) for p in stored] == rows
+    assert {(p.exchange, p.symbol, p.timeframe) for p in stored} == {("bybit", "BTC/USDT", "1h")}
+
+
+def test_insert_prices_updates_forming_bar(db):
+    _insert_prices(db, "bybit", "BTC/USDT", "1h", [(1000, 1.0, 2.0, 0.5, 1.5, 10.0), (2000, 1.5, 2.5, 1.0, 2.0, 20.0)])
+    ids = {p.ts: p.id for p in _rows(db)}
+
+    # повторная отправка: последняя (незакрытая) свеча изменилась
+    _insert_prices(db, "bybit", "BTC/USDT", "1h", [(1000, 1.0, 2.0, 0.5, 1.5, 10.0), (2000, 1.5, 3.0, 1.0, 2.8, 35.0)])
+    db.expire_all()
+
+    stored = _rows(db)
+    assert len(stored) == 2
+    assert {p.ts: p.id for p in stored} == ids  # строки обновлены на месте, id прежние
+    last = stored[-1]
+    assert (last.high, last.close, last.volume) == (3.0, 2.8, 35.0)
+    assert stored[0].close == 1.5
+
+
+def test_insert_prices_duplicate_ts_in_batch(db):
+    rows = [(1000, 1.0, 2.0, 0.5, 1.5, 10.0), (1000, 1.0, 2.2, 0.5, 1.8, 12.0)]
+
+    # в пачке ключ встречается дважды — побеждает последнее значение, без ошибки
+    assert _insert_prices(db, "bybit", "BTC/USDT", "1h", rows) == 1
+
+    stored = _rows(db)
+    assert len(stored) == 1
+    assert (stored[0].close, stored[0].volume) == (1.8, 12.0)
+
+
+def test_insert_prices_empty(db):
+    assert _insert_prices(db, "bybit", "BTC/USDT", "1h", []) == 0
+    assert _rows(db) == []
@@ -0,0 +1,101 @@
+"""
+Тесты для src/simple_strategies.py: numpy/numba-индикаторы совпадают с прежними pandas-формулами.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.simple_strategies as ss
+
+
+# --- Fixtures ---
+
+
+@pytest.fixture(params=["numba", "fallback"])
+def backend(request, monkeypatch):
+    """Каждый тест — и через numba-ядра, и через pandas-fallback."""
+    if request.param == "numba":
+        if not ss.NUMBA_ENABLED:
+            pytest.skip("numba не установлена")
+    else:
+        monkeypatch.setattr(ss, "NUMBA_ENABLED", False)
+    return request.param
+
+
+@pytest.fixture
+def ohlcv():
+    """Фиксированный случайный OHLCV (random walk — с пересечениями EMA)."""
+    rng = np.random.default_rng(42)
+    n = 300
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    open_ = close + rng.normal(0, 0.3, n)
+    high = np.maximum(open_, close) + rng.uniform(0, 1, n)
+    low = np.minimum(open_, close) - rng.uniform(0, 1, n)
+    volume = rng.uniform(100, 1000, n)
+    index = pd.date_range("2024-01-01", periods=n, freq="h", tz="UTC")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume}, index=index)
+
+
+# --- Tests ---
+
+
+def test_ema_matches_pandas(backend, ohlcv):
+    close = ohlcv["close"]
+    for span in (9, 12, 21, 26):
+        expected = close.ewm(span=span, adjust=False).mean().to_numpy()
+        np.testing.assert_allclose(ss._ema_values(close.to_numpy(), span), expected, rtol=1e-12)
+
+
+def test_ema_numba_kernel_matches_pandas(ohlcv):
+    if not ss.NUMBA_ENABLED:
+        pytest.skip("numba не установлена")
+    close = ohlcv["close"]
+    expected = close.ewm(span=12, adjust=False).mean().to_numpy()
+    np.testing.assert_allclose(ss._ema_numba(close.to_numpy(), 12), expected, rtol=1e-12)
+
+
+def test_rolling_mean_matches_pandas(backend, ohlcv):
+    x = ohlcv["volume"].to_numpy().copy()
+    x[50] = np.nan  # окна с пропуском — NaN, как в pandas
+    expected = pd.Series(x).rolling(window=20).mean().to_numpy()
+    np.testing.assert_allclose(ss._rolling_mean_values(x, 20), expected, rtol=1e-9, equal_nan=True)
+
+
+def test_rsi_matches_calculate_rsi(backend, ohlcv):
+    expected = ss.calculate_rsi(ohlcv["close"], period=14).to_numpy()
+    np.testing.assert_allclose(ss._rsi_values(ohlcv["close"].to_numpy(), 14), expected, rtol=1e-9, equal_nan=True)
+
+
+def test_atr_matches_calculate_atr(backend, ohlcv):
+    expected = ss.calculate_atr(ohlcv, period=14).to_numpy()
+    actual = ss._atr_values(
+        ohlcv["high"].to_numpy(), ohlcv["low"].to_numpy(), ohlcv["close"].to_numpy(), 14
+    )
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, equal_nan=True)
+
+
+def test_ema_crosses_match_pandas(backend, ohlcv):
+    ema_fast = ohlcv["close"].ewm(span=9, adjust=False).mean()
+    ema_slow = ohlcv["close"].ewm(span=21, adjust=False).mean()
+    expected_bull = (ema_fast > ema_slow) & (ema_fast.shift(1) <= ema_slow.shift(1))
+    expected_bear = (ema_fast < ema_slow) & (ema_fast.shift(1) >= ema_slow.shift(1))
+
+    bullish, bearish = ss._ema_crosses(ema_fast.to_numpy(), ema_slow.to_numpy())
+
+    assert expected_bull.any() and expected_bear.any()
+    np.testing.assert_array_equal(bullish, expected_bull.to_numpy())
+    np.testing.assert_array_equal(bearish, expected_bear.to_numpy())
+
+
+def test_ema_crossover_strategy_matches_pandas(backend, ohlcv):
+    # прежняя pandas-реализация ema_crossover_strategy
+    ema_fast = ohlcv["close"].ewm(span=9, adjust=False).mean()
+    ema_slow = ohlcv["close"].ewm(span=21, adjust=False).mean()
+    expected = pd.Series(0, index=ohlcv.index)
+    expected[(ema_fast > ema_slow) & (ema_fast.shift(1) <= ema_slow.shift(1))] = 1
+    expected[(ema_fast < ema_slow) & (ema_fast.shift(1) >= ema_slow.shift(1))] = -1
+
+    signals = ss.ema_crossover_strategy(ohlcv, fast_period=9, slow_period=21)
+
+    np.testing.assert_array_equal(signals.to_numpy(), expected.to_numpy())
+    assert signals.index.equals(ohlcv.index)